@@ -2,6 +2,8 @@
 ASGI config for app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The recipe list, detail and image upload endpoints are served by the async
+views of recipe.async_views, everything else by the regular Django stack.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
@@ -9,8 +11,12 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+django.setup(set_prefix=False)
 
-application = get_asgi_application()
+from core.asgi import AsyncViewsHandler  # noqa: E402
+from recipe.async_views import VIEWS  # noqa: E402
+
+application = AsyncViewsHandler(VIEWS)
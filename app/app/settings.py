@@ -31,7 +31,9 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    # the admin modules are discovered by the URLconf, processes not
+    # serving requests don't import them
+    'django.contrib.admin.apps.SimpleAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -44,6 +46,12 @@ INSTALLED_APPS = [
     'recipe',]
 
 MIDDLEWARE = [
+    # first, so its timings cover the whole middleware chain
+    'core.middleware.QueryMetricsMiddleware',
+    'core.query_inspector.QueryInspectorMiddleware',
+    # inside the metrics, so they record the compressed sizes
+    'core.compression.CompressionMiddleware',
+    'core.ratelimit.RateLimitHeadersMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +95,56 @@ DATABASES = {
     }
 }
 
+# Read replicas, one alias per host of DB_REPLICA_HOSTS (replica_1, ...)
+# GETs of the recipe API are routed to by core.routers.ReplicaRouter
+DB_REPLICA_HOSTS = [
+    host for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host
+]
+for number, host in enumerate(DB_REPLICA_HOSTS, start=1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [f'replica_{number}' for number in
+                     range(1, len(DB_REPLICA_HOSTS) + 1)]
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+# round_robin or least_lag
+DATABASE_REPLICA_SELECTION = os.environ.get(
+    'DB_REPLICA_SELECTION', 'round_robin'
+)
+
+# Cache shared by the processes of the app, memcached servers of
+# MEMCACHED_HOSTS (host:port, ...). Without them each process falls back to
+# its own local memory, which leaves the other processes serving responses
+# and recommendations the writes have invalidated
+MEMCACHED_HOSTS = [
+    host for host in os.environ.get('MEMCACHED_HOSTS', '').split(',') if host
+]
+SHARED_CACHE = bool(MEMCACHED_HOSTS)
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': MEMCACHED_HOSTS,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# replicas further behind are skipped, checked every few seconds
+DATABASE_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 5))
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = 5
+# users read from the primary for this long after a write, so they see
+# their own writes. The pins are kept in the default cache, which must be
+# shared between the processes (memcached, redis) when replicas are used
+DATABASE_REPLICA_PIN_SECONDS = int(
+    os.environ.get('DB_REPLICA_PIN_SECONDS', 10)
+)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -131,3 +189,103 @@ STATIC_ROOT = '/vol/web/static'
 MEDIA_ROOT = '/vol/web/media'
 
 AUTH_USER_MODEL = 'core.User'
+
+# Storage of the recipe images, files are named after their content and
+# stored once. core.storage.S3ContentAddressedStorage keeps them in an S3
+# compatible bucket instead of MEDIA_ROOT
+RECIPE_IMAGE_STORAGE = os.environ.get(
+    'RECIPE_IMAGE_STORAGE', 'core.storage.ContentAddressedStorage'
+)
+RECIPE_IMAGE_S3_BUCKET = os.environ.get('RECIPE_IMAGE_S3_BUCKET', '')
+RECIPE_IMAGE_S3_ENDPOINT = os.environ.get('RECIPE_IMAGE_S3_ENDPOINT', '')
+RECIPE_IMAGE_S3_BASE_URL = os.environ.get('RECIPE_IMAGE_S3_BASE_URL', '')
+
+# Logs requests repeating a query shape (N+1) and queries slower than
+# QUERY_INSPECTOR_SLOW_MS, meant for staging
+QUERY_INSPECTOR_ENABLED = os.environ.get('QUERY_INSPECTOR') == '1'
+QUERY_INSPECTOR_THRESHOLD = int(
+    os.environ.get('QUERY_INSPECTOR_THRESHOLD', 5)
+)
+QUERY_INSPECTOR_SLOW_MS = float(
+    os.environ.get('QUERY_INSPECTOR_SLOW_MS', 100)
+)
+
+# Hash partitions of the recipe tables, 0 keeps plain tables. Applied by
+# migration core 0016 (see core.partitioning), migrate back to 0015 and
+# forward again to change it on a migrated database
+RECIPE_PARTITIONS = int(os.environ.get('RECIPE_PARTITIONS', 0))
+
+# Responses smaller than this many bytes are sent uncompressed, levels of
+# the encodings (brotli needs the brotli package), see core.compression
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_LEVELS = {
+    'br': int(os.environ.get('COMPRESSION_BROTLI_LEVEL', 4)),
+    'gzip': int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6)),
+}
+# Lifetime of the cached compressed list responses, 0 disables the cache.
+# Off by default without a SHARED_CACHE, writes only invalidate the cache of
+# the process handling them
+RESPONSE_CACHE_SECONDS = int(
+    os.environ.get('RESPONSE_CACHE_SECONDS', 300 if SHARED_CACHE else 0)
+)
+
+# "Recipes like this one": 'jaccard' or 'cosine' similarity of the tags
+# and ingredients, neighbors kept per recipe and how long they are cached,
+# see core.recommendations. Minutes only without a SHARED_CACHE, the other
+# processes miss the updates of the neighbors until they expire
+RECOMMENDATIONS_METRIC = os.environ.get('RECOMMENDATIONS_METRIC', 'jaccard')
+RECOMMENDATIONS_TOP_K = int(os.environ.get('RECOMMENDATIONS_TOP_K', 10))
+RECOMMENDATIONS_CACHE_SECONDS = int(os.environ.get(
+    'RECOMMENDATIONS_CACHE_SECONDS', 86400 if SHARED_CACHE else 60
+))
+
+# Token bucket rate limits of the API per client, see core.ratelimit
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': ('core.ratelimit.TokenBucketThrottle',),
+    'DEFAULT_THROTTLE_RATES': {
+        'read': os.environ.get('RATE_LIMIT_READ', '600/min'),
+        'write': os.environ.get('RATE_LIMIT_WRITE', '120/min'),
+        'upload': os.environ.get('RATE_LIMIT_UPLOAD', '20/min'),
+    },
+}
+# Where the buckets are kept: 'local' to every process, or 'cache' for
+# budgets shared by the processes through the default cache
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'local')
+
+# Who may scrape /metrics and the metrics port of the worker: the clients
+# of METRICS_ALLOWED_IPS (addresses or networks, comma separated) and the
+# ones sending `Authorization: Bearer <METRICS_TOKEN>`. Nobody by default
+METRICS_ALLOWED_IPS = [
+    ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip
+]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Background jobs, see core.jobs: attempts of a failing job, the backoff
+# before its retries (doubled every attempt up to the max), running jobs
+# given back to the queue after JOB_TIMEOUT_SECONDS (their worker died),
+# and the defaults of the worker command
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+JOB_BACKOFF_SECONDS = float(os.environ.get('JOB_BACKOFF_SECONDS', 10))
+JOB_BACKOFF_MAX_SECONDS = float(
+    os.environ.get('JOB_BACKOFF_MAX_SECONDS', 3600)
+)
+JOB_TIMEOUT_SECONDS = int(os.environ.get('JOB_TIMEOUT_SECONDS', 3600))
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', 4))
+JOB_POOL = os.environ.get('JOB_POOL', 'thread')
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 5))
+# Files of the queued exports are written to EXPORT_ROOT, outside the
+# served MEDIA_ROOT, downloaded through their job and deleted after
+# EXPORT_RETENTION_SECONDS
+EXPORT_ROOT = os.environ.get('EXPORT_ROOT', '/vol/exports')
+EXPORT_RETENTION_SECONDS = int(
+    os.environ.get('EXPORT_RETENTION_SECONDS', 86400)
+)
+
+# manage.py test applies the fast test profile unless TEST_FAST_PROFILE=0,
+# see core.test_runner
+TEST_RUNNER = 'core.test_runner.FastTestRunner'
+TEST_FAST_PROFILE = os.environ.get('TEST_FAST_PROFILE', '1') == '1'
+
+# Threads running the blocking work of the async views (app/asgi.py), it
+# bounds the database connections of an ASGI process
+ASYNC_THREAD_POOL_SIZE = int(os.environ.get('ASYNC_THREAD_POOL_SIZE', 8))
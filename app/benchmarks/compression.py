@@ -0,0 +1,69 @@
+"""
+CPU against bandwidth of the response compression levels.
+
+measure() compresses a payload at every level given, recording the
+compressed size and the time spent compressing and decompressing it. A level
+pays off while the time it adds stays below the time its saved bytes take
+on the wire, see transfer_ms().
+"""
+import time
+
+from core import compression
+
+
+# encoding: levels measured, the configured defaults included
+LEVELS = {
+    compression.GZIP: (1, 3, 6, 9),
+    compression.BROTLI: (1, 4, 6, 9, 11),
+}
+
+# bandwidths the saved transfer time is computed for, in megabits per second
+BANDWIDTHS = (10, 100)
+
+
+def transfer_ms(size, mbps):
+    """
+    Returns the milliseconds size bytes take at mbps megabits per second
+    """
+    return size * 8 / (mbps * 1000)
+
+
+def _timed(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    return result, (time.perf_counter() - started) * 1000 / iterations
+
+
+def measure(payload, levels=None, iterations=20):
+    """
+    Returns a dict per encoding and level measured on the payload: the
+    compressed size and ratio, the milliseconds to compress and decompress
+    it and the transfer milliseconds saved at every bandwidth of BANDWIDTHS
+    """
+    levels = levels or LEVELS
+    results = []
+    for encoding in compression.available_encodings():
+        for level in levels.get(encoding, ()):
+            compressed, compress_ms = _timed(
+                lambda: compression.compress(payload, encoding, level),
+                iterations,
+            )
+            _, decompress_ms = _timed(
+                lambda: compression.decompress(compressed, encoding),
+                iterations,
+            )
+            saved = len(payload) - len(compressed)
+            results.append({
+                'encoding': encoding,
+                'level': level,
+                'size': len(compressed),
+                'ratio': len(payload) / len(compressed),
+                'compress_ms': compress_ms,
+                'decompress_ms': decompress_ms,
+                'saved_ms': {
+                    str(mbps): transfer_ms(saved, mbps)
+                    for mbps in BANDWIDTHS
+                },
+            })
+    return results
@@ -0,0 +1,108 @@
+"""
+Synthetic data for the benchmarks.
+
+Everything is written with bulk inserts, users share a single password hash
+so hashing doesn't dominate the setup, and the user stats are rebuilt once at
+the end since bulk inserts don't send signals.
+"""
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from core.models import Tag, Ingredient, Recipe, UserStats
+
+
+PASSWORD = 'benchmark-pass'
+EMAIL = 'bench{}@example.com'
+
+
+class DataSpec:
+    """
+    Size of the generated data set, density is the share of the user's
+    tags/ingredients attached to every recipe
+    """
+    def __init__(self, users=10, recipes=200, tags=20, ingredients=50,
+                 density=0.2, seed=0):
+        self.users = users
+        self.recipes = recipes
+        self.tags = tags
+        self.ingredients = ingredients
+        self.density = density
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _sample(rng, ids, density):
+    count = round(len(ids) * density)
+    return rng.sample(ids, min(count, len(ids)))
+
+
+def _create_attrs(model, users, count, prefix):
+    objects = model.objects.bulk_create([
+        model(user=user, name=f'{prefix} {number}')
+        for user in users
+        for number in range(count)
+    ])
+    ids = {}
+    for obj in objects:
+        ids.setdefault(obj.user_id, []).append(obj.id)
+    return ids
+
+
+def generate(spec):
+    """
+    Creates spec.users users (EMAIL.format(0..n-1), password PASSWORD) with
+    their recipes, tags and ingredients. Returns the users
+    """
+    rng = random.Random(spec.seed)
+    password = make_password(PASSWORD)
+
+    with transaction.atomic():
+        users = get_user_model().objects.bulk_create([
+            get_user_model()(
+                email=EMAIL.format(number),
+                name=f'Benchmark {number}',
+                password=password,
+            )
+            for number in range(spec.users)
+        ])
+        tag_ids = _create_attrs(Tag, users, spec.tags, 'Tag')
+        ingredient_ids = _create_attrs(
+            Ingredient, users, spec.ingredients, 'Ingredient'
+        )
+
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                user=user,
+                title=f'Recipe {number}',
+                time_minutes=rng.randint(1, 240),
+                price=Decimal(rng.randint(100, 10000)) / 100,
+            )
+            for user in users
+            for number in range(spec.recipes)
+        ], batch_size=1000)
+
+        recipe_tags = Recipe.tags.through
+        recipe_ingredients = Recipe.ingredients.through
+        recipe_tags.objects.bulk_create([
+            recipe_tags(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe in recipes
+            for tag_id in _sample(
+                rng, tag_ids.get(recipe.user_id, []), spec.density
+            )
+        ], batch_size=5000)
+        recipe_ingredients.objects.bulk_create([
+            recipe_ingredients(recipe_id=recipe.id, ingredient_id=ingr_id)
+            for recipe in recipes
+            for ingr_id in _sample(
+                rng, ingredient_ids.get(recipe.user_id, []), spec.density
+            )
+        ], batch_size=5000)
+
+        UserStats.objects.rebuild([user.pk for user in users])
+    return users
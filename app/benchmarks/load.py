@@ -0,0 +1,462 @@
+"""
+Load generation against a running server (runserver, wsgi.py or asgi.py
+behind any server) with asyncio virtual users.
+
+Every virtual user signs up, gets its token from the token endpoint and then
+loops over a weighted mix of actions with a random think time in between,
+over one keep-alive HTTP/1.1 connection of its own. The virtual users all
+sign up from the same address, the server's RATE_LIMIT_WRITE must allow
+them. The number of active users follows a ramp profile, a list of
+(users, seconds) stages the user count moves to linearly.
+
+The client is deliberately minimal (no TLS, no redirects) and only loopback
+addresses are accepted: this is for local servers, never for load on shared
+or remote deployments.
+"""
+import asyncio
+import io
+import ipaddress
+import json
+import random
+import socket
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+from django.urls import reverse
+from PIL import Image
+
+from .runner import percentile
+
+
+SIGNUP_URL = reverse('user:create')
+TOKEN_URL = reverse('user:token')
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_BULK_URL = reverse('recipe:tag-bulk')
+INGREDIENTS_BULK_URL = reverse('recipe:ingredient-bulk')
+
+PASSWORD = 'loadtest-pass'
+
+# name: [(users, seconds), ...]
+PROFILES = {
+    'smoke': [(2, 10)],
+    'ramp': [(10, 30), (50, 60), (50, 60), (0, 30)],
+    'spike': [(5, 20), (100, 5), (100, 30), (5, 5), (5, 20)],
+    'soak': [(20, 60), (20, 1800), (0, 60)],
+}
+
+# name: {action: weight}
+MIXES = {
+    'browse': {'list': 50, 'detail': 30, 'filter': 20},
+    'mixed': {'list': 35, 'detail': 25, 'filter': 20, 'create': 15,
+              'upload': 5},
+    'write': {'list': 20, 'detail': 10, 'create': 50, 'upload': 20},
+}
+
+
+def parse_profile(value):
+    """
+    Returns the stages of a profile name or of a 'users:seconds,...' spec
+    """
+    if value in PROFILES:
+        return PROFILES[value]
+    try:
+        stages = [
+            (int(users), float(seconds))
+            for users, seconds in (
+                stage.split(':') for stage in value.split(',')
+            )
+        ]
+    except ValueError:
+        raise ValueError(
+            f'{value!r} is neither a profile ({", ".join(PROFILES)}) nor '
+            f'a users:seconds,... ramp'
+        )
+    if any(users < 0 or seconds <= 0 for users, seconds in stages):
+        raise ValueError('Stages need users >= 0 and seconds > 0')
+    return stages
+
+
+def target_users(stages, elapsed):
+    """
+    Returns the number of users the profile asks for after `elapsed` seconds
+    """
+    previous = 0
+    for users, seconds in stages:
+        if elapsed < seconds:
+            return round(previous + (users - previous) * elapsed / seconds)
+        elapsed -= seconds
+        previous = users
+    return previous
+
+
+def check_local(url):
+    """
+    Returns (host, port) of an http URL, ValueError unless every address it
+    resolves to is a loopback address
+    """
+    parts = urlsplit(url)
+    if parts.scheme != 'http' or not parts.hostname:
+        raise ValueError(f'{url} is not an http:// URL')
+    port = parts.port or 80
+    try:
+        addresses = {
+            info[4][0] for info in socket.getaddrinfo(
+                parts.hostname, port, type=socket.SOCK_STREAM
+            )
+        }
+    except socket.gaierror as error:
+        raise ValueError(f'Cannot resolve {parts.hostname}: {error}')
+    remote = [address for address in addresses
+              if not ipaddress.ip_address(address).is_loopback]
+    if remote:
+        raise ValueError(
+            f'{parts.hostname} resolves to non local addresses '
+            f'{", ".join(sorted(remote))}, only local servers can be load '
+            f'tested'
+        )
+    return parts.hostname, port
+
+
+class HttpClient:
+    """
+    HTTP/1.1 client over one keep-alive connection, reconnecting when the
+    server closes it
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        """
+        Returns (status, body bytes)
+        """
+        head = [f'{method} {path} HTTP/1.1', f'Host: {self.host}',
+                f'Content-Length: {len(body)}']
+        head += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        message = ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+        # a reused connection may have been closed by the server meanwhile
+        reused = self._writer is not None
+        try:
+            return await self._send(message)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            if not reused:
+                raise
+        return await self._send(message)
+
+    async def _send(self, message):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        self._writer.write(message)
+        await self._writer.drain()
+        status, headers, body = await self._read_response()
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, body
+
+    async def _read_response(self):
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by the server')
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0], 16)
+                chunk = await self._reader.readexactly(size + 2)
+                if not size:
+                    break
+                body += chunk[:-2]
+        elif 'content-length' in headers:
+            body = await self._reader.readexactly(
+                int(headers['content-length'])
+            )
+        else:
+            body = await self._reader.read()
+            headers['connection'] = 'close'
+        return status, headers, body
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class Stats:
+    """
+    Outcome of every request by action, plus totals per report interval
+    """
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.error_samples = []
+        self.interval_requests = 0
+        self.interval_errors = 0
+
+    def record(self, action, latency, error=None):
+        self.latencies.setdefault(action, []).append(latency)
+        self.interval_requests += 1
+        if error is not None:
+            self.errors[action] = self.errors.get(action, 0) + 1
+            self.interval_errors += 1
+            if len(self.error_samples) < 20:
+                self.error_samples.append(f'{action}: {error}')
+
+    def take_interval(self):
+        """
+        Returns (requests, errors) since the previous call
+        """
+        counts = self.interval_requests, self.interval_errors
+        self.interval_requests = self.interval_errors = 0
+        return counts
+
+    def summary(self, duration):
+        actions = {}
+        for action, latencies in sorted(self.latencies.items()):
+            errors = self.errors.get(action, 0)
+            actions[action] = {
+                'requests': len(latencies),
+                'errors': errors,
+                'error_rate': errors / len(latencies),
+                'throughput_rps': len(latencies) / duration,
+                'latency_p50_ms': percentile(latencies, 50),
+                'latency_p95_ms': percentile(latencies, 95),
+                'latency_p99_ms': percentile(latencies, 99),
+                'latency_max_ms': max(latencies),
+            }
+        requests = sum(len(latencies) for latencies in self.latencies.values())
+        errors = sum(self.errors.values())
+        every = [value for latencies in self.latencies.values()
+                 for value in latencies]
+        return {
+            'duration_s': duration,
+            'requests': requests,
+            'errors': errors,
+            'error_rate': errors / requests if requests else 0.0,
+            'throughput_rps': requests / duration if duration else 0.0,
+            'latency_p50_ms': percentile(every, 50),
+            'latency_p95_ms': percentile(every, 95),
+            'latency_p99_ms': percentile(every, 99),
+            'actions': actions,
+            'error_samples': self.error_samples,
+        }
+
+
+def _jpeg():
+    image = io.BytesIO()
+    Image.new('RGB', (64, 64), 'orange').save(image, format='JPEG')
+    return image.getvalue()
+
+
+_IMAGE = _jpeg()
+
+
+def _multipart(field, filename, content, content_type):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; '
+        f'filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class VirtualUser:
+    """
+    One simulated client with its own account, token and connection
+    """
+    def __init__(self, number, client, stats, run_id, mix, think, rng):
+        self.email = f'load-{run_id}-{number}@example.com'
+        self.client = client
+        self.stats = stats
+        self.mix = mix
+        self.think = think
+        self.rng = rng
+        self.headers = {'Content-Type': 'application/json'}
+        self.recipe_ids = []
+        self.tag_ids = []
+        self.ingredient_ids = []
+        self.stopping = False
+
+    async def call(self, action, method, path, payload=None, expected=200,
+                   body=None, content_type=None):
+        """
+        Sends one request and records its outcome, returns the decoded JSON
+        body or None if the request failed
+        """
+        headers = dict(self.headers)
+        if payload is not None:
+            body = json.dumps(payload).encode()
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+        started = time.perf_counter()
+        try:
+            status, content = await self.client.request(
+                method, path, body or b'', headers
+            )
+        except (OSError, asyncio.IncompleteReadError) as error:
+            self.stats.record(
+                action, (time.perf_counter() - started) * 1000, repr(error)
+            )
+            return None
+        latency = (time.perf_counter() - started) * 1000
+        if status != expected:
+            self.stats.record(action, latency, f'HTTP {status}')
+            return None
+        try:
+            data = json.loads(content) if content else {}
+        except ValueError:
+            self.stats.record(action, latency, 'Invalid JSON response')
+            return None
+        self.stats.record(action, latency)
+        return data
+
+    async def setup(self):
+        """
+        Signs up, logs in and creates a small library, returns False if any
+        step failed
+        """
+        account = {'email': self.email, 'password': PASSWORD,
+                   'name': 'Load test'}
+        if await self.call('signup', 'POST', SIGNUP_URL, account,
+                           expected=201) is None:
+            return False
+        token = await self.call('login', 'POST', TOKEN_URL, {
+            'email': self.email, 'password': PASSWORD,
+        })
+        if token is None:
+            return False
+        self.headers['Authorization'] = f"Token {token['token']}"
+
+        tags = await self.call('setup', 'POST', TAGS_BULK_URL, {
+            'names': ['Vegan', 'Dessert', 'Quick', 'Dinner'],
+        })
+        ingredients = await self.call('setup', 'POST', INGREDIENTS_BULK_URL, {
+            'names': ['Salt', 'Flour', 'Eggs', 'Milk', 'Butter', 'Sugar'],
+        })
+        if tags is None or ingredients is None:
+            return False
+        self.tag_ids = [tag['id'] for tag in tags]
+        self.ingredient_ids = [ingr['id'] for ingr in ingredients]
+        for _ in range(5):
+            await self.create()
+        return bool(self.recipe_ids)
+
+    async def browse(self):
+        await self.call('list', 'GET', f'{RECIPES_URL}?page_size=25')
+
+    async def detail(self):
+        recipe_id = self.rng.choice(self.recipe_ids)
+        await self.call('detail', 'GET', f'{RECIPES_URL}{recipe_id}/')
+
+    async def filter(self):
+        query = urlencode({
+            'tags': self.rng.choice(self.tag_ids),
+            'price__lte': self.rng.choice(['5', '10', '20']),
+            'ordering': self.rng.choice(['price', '-time_minutes', 'title']),
+            'page_size': 25,
+        })
+        await self.call('filter', 'GET', f'{RECIPES_URL}?{query}')
+
+    async def create(self):
+        recipe = await self.call('create', 'POST', RECIPES_URL, {
+            'title': f'Load recipe {len(self.recipe_ids)}',
+            'time_minutes': self.rng.randint(5, 120),
+            'price': f'{self.rng.randint(100, 3000) / 100:.2f}',
+            'tags': self.rng.sample(self.tag_ids, 2),
+            'ingredients': self.rng.sample(self.ingredient_ids, 3),
+        }, expected=201)
+        if recipe is not None:
+            self.recipe_ids.append(recipe['id'])
+
+    async def upload(self):
+        recipe_id = self.rng.choice(self.recipe_ids)
+        body, content_type = _multipart(
+            'image', 'load.jpg', _IMAGE, 'image/jpeg'
+        )
+        await self.call(
+            'upload', 'POST', f'{RECIPES_URL}{recipe_id}/upload-image/',
+            body=body, content_type=content_type
+        )
+
+    async def run(self):
+        actions = {
+            'list': self.browse,
+            'detail': self.detail,
+            'filter': self.filter,
+            'create': self.create,
+            'upload': self.upload,
+        }
+        names = list(self.mix)
+        weights = list(self.mix.values())
+        try:
+            if not await self.setup():
+                return
+            while not self.stopping:
+                await actions[self.rng.choices(names, weights)[0]]()
+                if self.think:
+                    await asyncio.sleep(self.rng.expovariate(1 / self.think))
+        finally:
+            self.client.close()
+
+
+async def run_load(url, stages, mix, think=0.5, seed=None,
+                   report_interval=5.0, report=None):
+    """
+    Runs virtual users against the local server at url following the ramp
+    stages, calls report(elapsed, users, requests, errors) every
+    report_interval seconds and returns the Stats summary
+    """
+    host, port = check_local(url)
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:8]
+    stats = Stats()
+    active = []
+    tasks = []
+    loop = asyncio.get_event_loop()
+    duration = sum(seconds for _, seconds in stages)
+
+    started = loop.time()
+    next_report = report_interval
+    elapsed = 0.0
+    while elapsed < duration:
+        target = target_users(stages, elapsed)
+        while len(active) < target:
+            user = VirtualUser(
+                len(tasks), HttpClient(host, port), stats, run_id, mix,
+                think, random.Random(rng.random())
+            )
+            active.append(user)
+            tasks.append(loop.create_task(user.run()))
+        while len(active) > target:
+            active.pop().stopping = True
+        if report is not None and elapsed >= next_report:
+            report(elapsed, len(active), *stats.take_interval())
+            next_report += report_interval
+        await asyncio.sleep(0.1)
+        elapsed = loop.time() - started
+
+    for user in active:
+        user.stopping = True
+    if tasks:
+        # users finish the action in flight, stragglers are cancelled
+        done, pending = await asyncio.wait(tasks, timeout=30)
+        for task in pending:
+            task.cancel()
+    return stats.summary(loop.time() - started)
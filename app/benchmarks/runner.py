@@ -0,0 +1,335 @@
+"""
+In-process benchmarks of the recipe and user APIs.
+
+Every scenario sends one request through the Django test client, so the
+whole middleware, authentication and serialization stack is measured without
+a network in between. A scenario is run in two passes: a timed pass recording
+the latency and the number of queries of every request, then a shorter pass
+under tracemalloc recording the peak memory allocated while handling a
+request, kept apart so tracing doesn't inflate the latencies.
+
+Results are plain dicts, saved as JSON to be used as the baseline of later
+runs, see compare().
+"""
+import io
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import partitioning, ratelimit
+from core.middleware import QueryTimer
+from core.models import Recipe
+
+from . import compression, datagen
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+# high enough for every scenario not to be limited, the buckets are still
+# checked and their cost measured
+RATE_LIMITS = {scope: '1000000/s' for scope in (
+    ratelimit.READ, ratelimit.WRITE, ratelimit.UPLOAD
+)}
+
+
+class BenchmarkError(Exception):
+    """A scenario request didn't get the expected response"""
+
+
+class Context:
+    """
+    What the scenarios work with: an authenticated client of the first
+    generated user and the ids of some of its objects
+    """
+    def __init__(self, user):
+        self.user = user
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        recipes = Recipe.objects.filter(user=user).order_by('id')
+        self.recipe_id = recipes.values_list('id', flat=True).first()
+        self.tag_ids = list(user.tag_set.values_list('id', flat=True)[:2])
+        self.ingredient_ids = list(
+            user.ingredient_set.values_list('id', flat=True)[:3]
+        )
+        self.created = 0
+
+
+def _image():
+    image = io.BytesIO()
+    Image.new('RGB', (64, 64), 'orange').save(image, format='JPEG')
+    image.name = 'benchmark.jpg'
+    image.seek(0)
+    return image
+
+
+def recipe_list(context):
+    return context.client.get(RECIPES_URL)
+
+
+def recipe_list_gzip(context):
+    return context.client.get(RECIPES_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+
+def recipe_page(context):
+    return context.client.get(RECIPES_URL, {'page_size': 25})
+
+
+def recipe_detail(context):
+    return context.client.get(
+        reverse('recipe:recipe-detail', args=[context.recipe_id])
+    )
+
+
+def recipe_filter(context):
+    return context.client.get(RECIPES_URL, {
+        'tags': ','.join(str(pk) for pk in context.tag_ids),
+        'price__lte': '50',
+        'ordering': '-price',
+        'page_size': 25,
+    })
+
+
+def recipe_create(context):
+    context.created += 1
+    return context.client.post(RECIPES_URL, {
+        'title': f'Benchmark recipe {context.created}',
+        'time_minutes': 20,
+        'price': '7.50',
+        'tags': context.tag_ids,
+        'ingredients': context.ingredient_ids,
+    })
+
+
+def token_login(context):
+    return context.anonymous.post(TOKEN_URL, {
+        'email': context.user.email,
+        'password': datagen.PASSWORD,
+    })
+
+
+def image_upload(context):
+    return context.client.post(
+        reverse('recipe:recipe-upload-image', args=[context.recipe_id]),
+        {'image': _image()},
+        format='multipart',
+    )
+
+
+# name: (scenario, expected status), in the order they run: the read only
+# scenarios go first so they see the generated data set only
+SCENARIOS = {
+    'recipe_list': (recipe_list, 200),
+    'recipe_list_gzip': (recipe_list_gzip, 200),
+    'recipe_page': (recipe_page, 200),
+    'recipe_detail': (recipe_detail, 200),
+    'recipe_filter': (recipe_filter, 200),
+    'recipe_create': (recipe_create, 201),
+    'token_login': (token_login, 200),
+    'image_upload': (image_upload, 200),
+}
+
+
+def percentile(values, pct):
+    """
+    Returns the pct percentile of the values, interpolating between the two
+    closest ranks
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _call(name, context):
+    scenario, expected = SCENARIOS[name]
+    response = scenario(context)
+    if response.status_code != expected:
+        raise BenchmarkError(
+            f'{name}: expected {expected}, got {response.status_code} '
+            f'{response.content[:200]!r}'
+        )
+    return response
+
+
+def measure(name, context, iterations=50, warmup=5, alloc_iterations=10):
+    """
+    Runs one scenario, returns its metrics: latency percentiles in
+    milliseconds, queries per request and peak allocations in KiB
+    """
+    for _ in range(warmup):
+        _call(name, context)
+
+    latencies = []
+    queries = []
+    for _ in range(iterations):
+        timer = QueryTimer()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            started = time.perf_counter()
+            _call(name, context)
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(timer.count)
+
+    allocations = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_iterations):
+            tracemalloc.clear_traces()
+            _call(name, context)
+            allocations.append(tracemalloc.get_traced_memory()[1] / 1024)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'latency_mean_ms': sum(latencies) / len(latencies),
+        'latency_p50_ms': percentile(latencies, 50),
+        'latency_p90_ms': percentile(latencies, 90),
+        'latency_p95_ms': percentile(latencies, 95),
+        'latency_p99_ms': percentile(latencies, 99),
+        'queries': max(queries),
+        'alloc_peak_kib': percentile(allocations, 50),
+    }
+
+
+def prepare_tables(partitions=0):
+    """
+    Splits the recipe tables into hash partitions, or analyzes the plain
+    tables so both layouts are measured with fresh planner statistics
+    """
+    with connections[DEFAULT_DB_ALIAS].schema_editor() as editor:
+        if partitions:
+            partitioning.partition_recipes(editor, Recipe, partitions)
+            return
+        for table in partitioning.partition_keys(Recipe):
+            editor.execute(f'ANALYZE {editor.quote_name(table)}')
+
+
+def run(spec, scenarios=None, iterations=50, warmup=5, alloc_iterations=10,
+        partitions=0, compression_levels=None):
+    """
+    Generates the data set described by spec and runs the scenarios (all of
+    them by default) against it, on recipe tables split into `partitions`
+    hash partitions if given. With compression_levels, {encoding: levels},
+    the recipe list is compressed at these levels too, see
+    benchmarks.compression. Expects an empty database
+    """
+    names = [name for name in SCENARIOS if not scenarios or name in scenarios]
+    users = datagen.generate(spec)
+    prepare_tables(partitions)
+    context = Context(users[0])
+
+    media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+    try:
+        with override_settings(MEDIA_ROOT=media_root, REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            'DEFAULT_THROTTLE_RATES': RATE_LIMITS,
+        }):
+            results = {
+                name: measure(name, context, iterations, warmup,
+                              alloc_iterations)
+                for name in names
+            }
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+    output = {
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'data': spec.as_dict(),
+            'partitions': partitions,
+        },
+        'scenarios': results,
+    }
+    if compression_levels:
+        payload = _call('recipe_list', context).content
+        output['compression'] = {
+            'payload_size': len(payload),
+            'levels': compression.measure(payload, compression_levels),
+        }
+    return output
+
+
+# metric: (relative tolerance factor, absolute slack), a metric regresses
+# when current > baseline * (1 + tolerance * factor) + slack. The slack keeps
+# noise on tiny numbers from failing a run, query counts must not grow at all
+COMPARED_METRICS = {
+    'latency_p50_ms': (1, 1.0),
+    'latency_p95_ms': (1, 2.0),
+    'queries': (0, 0),
+    'alloc_peak_kib': (1, 16),
+}
+# for the start up of the commands, see benchmarks.startup
+COMPARED_STARTUP_METRICS = {
+    'wall_ms': (1, 50.0),
+    'import_ms': (1, 20.0),
+}
+
+
+class Regression:
+    def __init__(self, scenario, metric, baseline, current, limit):
+        self.scenario = scenario
+        self.metric = metric
+        self.baseline = baseline
+        self.current = current
+        self.limit = limit
+
+    def __str__(self):
+        return (
+            f'{self.scenario} {self.metric}: {self.current:.2f} > '
+            f'{self.limit:.2f} (baseline {self.baseline:.2f})'
+        )
+
+
+def _compare(baseline, results, compared, tolerance):
+    regressions = []
+    for name, metrics in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for metric, (factor, slack) in compared.items():
+            if metric not in reference:
+                continue
+            limit = reference[metric] * (1 + tolerance * factor) + slack
+            if metrics[metric] > limit:
+                regressions.append(Regression(
+                    name, metric, reference[metric], metrics[metric], limit
+                ))
+    return regressions
+
+
+def compare(baseline, results, tolerance=0.2):
+    """
+    Returns the Regressions of results against a baseline, both as returned
+    by run() with the start up of the commands under 'startup' if
+    measured. Scenarios and commands missing from the baseline are not
+    compared
+    """
+    return _compare(
+        baseline['scenarios'], results['scenarios'], COMPARED_METRICS,
+        tolerance
+    ) + _compare(
+        baseline.get('startup', {}), results.get('startup', {}),
+        COMPARED_STARTUP_METRICS, tolerance
+    )
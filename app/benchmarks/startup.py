@@ -0,0 +1,124 @@
+"""
+Start up time of manage.py commands.
+
+Every command runs in a fresh interpreter started with -X importtime, which
+writes the time spent importing every module to stderr, so what a command
+imports is measured the way a container start pays for it: nothing is
+imported yet. The wall time covers the whole run, interpreter start, django
+setup and the command itself.
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+
+
+# name: manage.py arguments. wait_for_db and the worker start without the
+# URLconf, check imports all of it like the web processes do
+COMMANDS = {
+    'wait_for_db': ['wait_for_db'],
+    'worker_help': ['worker', '--help'],
+    'check': ['check'],
+}
+
+IMPORT_LINE = re.compile(
+    r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$'
+)
+
+
+class Import:
+    def __init__(self, module, self_us, cumulative_us, depth):
+        self.module = module
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.depth = depth
+
+    @property
+    def package(self):
+        return self.module.split('.')[0]
+
+
+def parse(output):
+    """
+    Returns the Imports of the -X importtime output, in the order written:
+    a module follows the modules it imported
+    """
+    imports = []
+    for line in output.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            imports.append(Import(match[4], int(match[1]), int(match[2]),
+                                  len(match[3]) // 2))
+    return imports
+
+
+def packages(imports):
+    """
+    Returns {top level package: milliseconds spent importing its modules},
+    slowest first
+    """
+    totals = {}
+    for module in imports:
+        totals[module.package] = \
+            totals.get(module.package, 0) + module.self_us / 1000
+    return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+
+def profile(args, env=None):
+    """
+    Runs manage.py with the arguments in a new interpreter, with the
+    environment variables of env set, returns (wall milliseconds, Imports).
+    The command must succeed
+    """
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime',
+         os.path.join(settings.BASE_DIR, 'manage.py'), *args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True, cwd=settings.BASE_DIR,
+        env={**os.environ, **(env or {})},
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if process.returncode:
+        raise subprocess.CalledProcessError(
+            process.returncode, process.args, stderr=process.stderr
+        )
+    return wall_ms, parse(process.stderr)
+
+
+def measure(args, runs=5):
+    """
+    Returns the start up metrics of the command: the median wall and import
+    milliseconds of the runs, the modules imported and the import
+    milliseconds of the slowest packages of the last run
+    """
+    walls = []
+    import_times = []
+    for _ in range(runs):
+        wall_ms, imports = profile(args)
+        walls.append(wall_ms)
+        import_times.append(
+            sum(module.self_us for module in imports) / 1000
+        )
+    return {
+        'runs': runs,
+        'wall_ms': statistics.median(walls),
+        'import_ms': statistics.median(import_times),
+        'modules': len(imports),
+        'packages': dict(list(packages(imports).items())[:10]),
+    }
+
+
+def run(commands=None, runs=5):
+    """
+    Measures the commands of COMMANDS, all of them by default
+    """
+    return {
+        name: measure(args, runs)
+        for name, args in COMMANDS.items()
+        if not commands or name in commands
+    }
@@ -0,0 +1,241 @@
+"""
+Background deletion of user accounts.
+
+Deleting an account through the API deactivates the user and queues an
+AccountDeletion with a delete_account job, see core.jobs, the
+delete_accounts command carries out the pending ones by hand. The
+recipes, then the tags and ingredients of the user are deleted in batches of
+batch_size, every batch committed on its own with the progress of the
+deletion, so locks are short, the requests of the other users aren't held
+up and an interrupted deletion resumes where it stopped. The user and the
+rest of its rows go last.
+
+A batch is one statement deleting the objects and their M2M rows by id when
+the only receivers of their deletes are the ones of core.signals, whose
+work is done here for the whole batch: the image references are released
+once per file, the deletions recorded in the change feed and the stats and
+cached neighbors of the user dropped with the user. Models with other
+receivers are deleted through the ORM, batch by batch, so those run.
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models.signals import pre_delete, post_delete
+from django.utils import timezone
+
+from core import jobs, recommendations
+from core.models import AccountDeletion, Change, Ingredient, Recipe, Tag
+
+
+RECIPES_SQL = """
+    WITH batch AS (
+        SELECT id FROM {recipe}
+        WHERE user_id = %(user_id)s
+        ORDER BY id
+        LIMIT %(limit)s
+    ),
+    tags AS (
+        DELETE FROM {recipe_tags} WHERE recipe_id IN (SELECT id FROM batch)
+    ),
+    ingredients AS (
+        DELETE FROM {recipe_ingredients}
+        WHERE recipe_id IN (SELECT id FROM batch)
+    )
+    DELETE FROM {recipe}
+    WHERE user_id = %(user_id)s AND id IN (SELECT id FROM batch)
+    RETURNING id, image
+"""
+# other users' recipes may use the tags and ingredients, they are returned
+# to be recorded as updated
+ATTRS_SQL = """
+    WITH batch AS (
+        SELECT id FROM {table}
+        WHERE user_id = %(user_id)s
+        ORDER BY id
+        LIMIT %(limit)s
+    ),
+    links AS (
+        DELETE FROM {through} WHERE {column} IN (SELECT id FROM batch)
+        RETURNING recipe_id
+    ),
+    deleted AS (
+        DELETE FROM {table} WHERE id IN (SELECT id FROM batch)
+        RETURNING id
+    )
+    SELECT ARRAY(SELECT id FROM deleted),
+           ARRAY(SELECT DISTINCT recipe_id FROM links)
+"""
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def request_deletion(user):
+    """
+    Deactivates the user, which can't sign in or use its tokens anymore,
+    and queues the deletion of the account. Returns the AccountDeletion
+    """
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        deletion, created = AccountDeletion.objects.get_or_create(
+            user_id=user.pk
+        )
+        if created:
+            jobs.enqueue('delete_account', user=user,
+                         deletion_id=deletion.pk)
+    return deletion
+
+
+def pending():
+    """
+    The deletions to carry out, oldest first. Interrupted and failed ones
+    are resumed
+    """
+    return AccountDeletion.objects.exclude(
+        status=AccountDeletion.DONE
+    ).order_by('id')
+
+
+def _needs_signals(*models):
+    """
+    Whether receivers other than the ones of core.signals listen to the
+    deletes of any of the models
+    """
+    return any(
+        receiver.__module__ != 'core.signals'
+        for model in models
+        for signal in (pre_delete, post_delete)
+        for receiver in signal._live_receivers(model)
+    )
+
+
+def _release_images(images):
+    storage = Recipe._meta.get_field('image').storage
+    counts = Counter(image for image in images if image)
+    for image, count in counts.items():
+        if hasattr(storage, 'release'):
+            storage.release(image, count)
+        else:
+            storage.delete(image)
+    return sum(counts.values())
+
+
+def _delete_recipes(user_id, batch_size):
+    """
+    Deletes a batch of the user's recipes, returns (recipes, images)
+    """
+    through = [Recipe.tags.through, Recipe.ingredients.through]
+    if _needs_signals(Recipe, *through):
+        rows = list(Recipe.objects.filter(user_id=user_id).order_by('id')
+                    .values_list('id', 'image')[:batch_size])
+        # the receivers of core.signals release the images
+        Recipe.objects.filter(
+            user_id=user_id, pk__in=[recipe_id for recipe_id, _ in rows]
+        ).delete()
+        return len(rows), sum(1 for _, image in rows if image)
+
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(RECIPES_SQL.format(
+            recipe=quote(Recipe._meta.db_table),
+            recipe_tags=quote(through[0]._meta.db_table),
+            recipe_ingredients=quote(through[1]._meta.db_table),
+        ), {'user_id': user_id, 'limit': batch_size})
+        rows = cursor.fetchall()
+    Change.objects.record(Recipe, Change.DELETED, user_id,
+                          [recipe_id for recipe_id, _ in rows])
+    return len(rows), _release_images(image for _, image in rows)
+
+
+def _delete_attrs(model, user_id, batch_size):
+    """
+    Deletes a batch of the user's tags or ingredients, returns how many
+    """
+    through = Recipe._meta.get_field(
+        f'{model._meta.model_name}s'
+    ).remote_field.through
+    if _needs_signals(model, through):
+        ids = list(model.objects.filter(user_id=user_id).order_by('id')
+                   .values_list('id', flat=True)[:batch_size])
+        model.objects.filter(pk__in=ids).delete()
+        return len(ids)
+
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(ATTRS_SQL.format(
+            table=quote(model._meta.db_table),
+            through=quote(through._meta.db_table),
+            column=quote(f'{model._meta.model_name}_id'),
+        ), {'user_id': user_id, 'limit': batch_size})
+        deleted, recipe_ids = cursor.fetchone()
+    Change.objects.record(model, Change.DELETED, user_id, deleted)
+    owners = {}
+    for owner_id, recipe_id in Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('user_id', 'id'):
+        owners.setdefault(owner_id, []).append(recipe_id)
+    for owner_id, owner_recipe_ids in owners.items():
+        Change.objects.record(Recipe, Change.UPDATED, owner_id,
+                              owner_recipe_ids)
+        recommendations.update_on_commit(owner_id, owner_recipe_ids)
+    return len(deleted)
+
+
+def _start(deletion):
+    deletion.status = AccountDeletion.RUNNING
+    deletion.error = ''
+    if deletion.recipes_total is None:
+        for name, model in (('recipes', Recipe), ('tags', Tag),
+                            ('ingredients', Ingredient)):
+            setattr(deletion, f'{name}_total',
+                    model.objects.filter(user_id=deletion.user_id).count())
+    deletion.save()
+
+
+def delete_account(deletion, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Carries out the deletion batch by batch. Yields the deletion after every
+    batch, its progress saved with the batch
+    """
+    _start(deletion)
+    user_id = deletion.user_id
+
+    while True:
+        with transaction.atomic():
+            recipes, images = _delete_recipes(user_id, batch_size)
+            if not recipes:
+                break
+            deletion.recipes_deleted += recipes
+            deletion.images_released += images
+            deletion.save()
+        yield deletion
+
+    for name, model in (('tags', Tag), ('ingredients', Ingredient)):
+        while True:
+            with transaction.atomic():
+                deleted = _delete_attrs(model, user_id, batch_size)
+                if not deleted:
+                    break
+                field = f'{name}_deleted'
+                setattr(deletion, field, getattr(deletion, field) + deleted)
+                deletion.save()
+            yield deletion
+
+    with transaction.atomic():
+        # the stats, tokens and the few rows left go with the user
+        get_user_model().objects.filter(pk=user_id).delete()
+        deletion.status = AccountDeletion.DONE
+        deletion.finished = timezone.now()
+        deletion.save()
+    recommendations.forget(user_id)
+    yield deletion
+
+
+def fail(deletion, error):
+    """
+    Records the error of a deletion that stopped, it is resumed by the next
+    run
+    """
+    deletion.status = AccountDeletion.FAILED
+    deletion.error = str(error)
+    deletion.save(update_fields=['status', 'error'])
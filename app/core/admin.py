@@ -41,3 +41,23 @@ admin.site.register(models.User, UserAdmin)
 admin.site.register(models.Tag)
 admin.site.register(models.Ingredient)
 admin.site.register(models.Recipe)
+
+
+class AccountDeletionAdmin(admin.ModelAdmin):
+    ordering = ['-id']
+    list_display = ['user_id', 'status', 'progress', 'images_released',
+                    'requested', 'finished']
+    list_filter = ['status']
+
+
+admin.site.register(models.AccountDeletion, AccountDeletionAdmin)
+
+
+class JobAdmin(admin.ModelAdmin):
+    ordering = ['-id']
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at',
+                    'finished']
+    list_filter = ['status', 'name']
+
+
+admin.site.register(models.Job, JobAdmin)
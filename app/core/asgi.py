@@ -0,0 +1,177 @@
+"""
+Native async views under ASGI.
+
+Django 3.0 runs every view in a worker thread, holding it for the whole
+request. AsyncViewsHandler serves the (view name, method) pairs it is given
+with coroutines instead and hands everything else to the regular Django
+stack. An async view does the non-blocking part of a request, checking it
+and receiving its body, and returns a function doing the blocking rest.
+The handler calls that function in a pool thread inside the Django
+middleware chain, the way Django calls a view, so both stacks apply the
+same middleware: metrics, compression, rate limit headers, security
+headers. The middleware sees the request once its body is received, as it
+does under Django's own ASGIHandler. Async views only use threads for the
+blocking parts of a request:
+
+    db_sync_to_async  ORM work, with the connection hygiene of a request
+    sync_to_async     file and CPU bound work (thread_sensitive=False)
+
+Both run on the event loop's default executor, which the handler bounds to
+ASYNC_THREAD_POOL_SIZE threads, so the number of database connections
+stays bounded however many clients are connected. Async views read the
+request body themselves with read_body(), after they checked the request,
+so a slow upload never holds a thread.
+"""
+import asyncio
+import tempfile
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import RequestAborted
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.base import BaseHandler
+from django.db import close_old_connections
+from django.urls import Resolver404, get_resolver, set_script_prefix
+
+
+_executors = weakref.WeakKeyDictionary()
+
+
+def install_executor(loop):
+    """
+    Makes a bounded thread pool the default executor of the loop, once
+    """
+    if loop not in _executors:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_THREAD_POOL_SIZE,
+            thread_name_prefix='asgi-sync',
+        )
+        loop.set_default_executor(executor)
+        _executors[loop] = executor
+
+
+def db_sync_to_async(func):
+    """
+    sync_to_async for ORM work: the connections of the pool thread are
+    checked before and after the call, like Django does around requests
+    """
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+async def read_body(request):
+    """
+    Receives the body of a request served by an async view, spooled to disk
+    past FILE_UPLOAD_MAX_MEMORY_SIZE
+    """
+    body_file = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE, mode='w+b'
+    )
+    while True:
+        message = await request.asgi_receive()
+        if message['type'] == 'http.disconnect':
+            body_file.close()
+            raise RequestAborted()
+        if 'body' in message:
+            # a large chunk would block the loop while written to disk
+            await sync_to_async(body_file.write, thread_sensitive=False)(
+                message['body']
+            )
+        if not message.get('more_body', False):
+            break
+    body_file.seek(0)
+    request._stream = body_file
+
+
+def _raising(exc):
+    def finish(request):
+        raise exc
+    return finish
+
+
+class MiddlewareHandler(BaseHandler):
+    """
+    The Django middleware chain around the functions returned by the async
+    views, called with the request in request.finish_view
+    """
+    def _get_response(self, request):
+        match = request.resolver_match
+        for middleware_method in self._view_middleware:
+            response = middleware_method(request, match.func, match.args,
+                                         match.kwargs)
+            if response:
+                return response
+        try:
+            return request.finish_view(request)
+        except Exception as exc:
+            response = self.process_exception_by_middleware(exc, request)
+            if response is None:
+                raise
+            return response
+
+
+class AsyncViewsHandler(ASGIHandler):
+    """
+    ASGI handler serving `views`, {(view name, HTTP method): coroutine},
+    natively. A coroutine is called like a view with the request and the
+    URL kwargs and returns the function computing the response from the
+    request, see the module docstring
+    """
+    def __init__(self, views):
+        super().__init__()
+        self.views = views
+        self.middleware = MiddlewareHandler()
+        self.middleware.load_middleware()
+
+    async def __call__(self, scope, receive, send):
+        install_executor(asyncio.get_event_loop())
+        if scope['type'] == 'http':
+            view, match = self.resolve_async(scope)
+            if view is not None:
+                await self.handle_async(view, match, scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
+
+    def resolve_async(self, scope):
+        """
+        Returns (coroutine, resolver match) for the request, (None, None) if
+        it is served by the regular stack
+        """
+        # the path within the application, like ASGIRequest.path_info
+        path = scope['path']
+        root_path = scope.get('root_path', '')
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        try:
+            match = get_resolver().resolve(path)
+        except Resolver404:
+            return None, None
+        view = self.views.get((match.view_name, scope['method'].upper()))
+        return view, match
+
+    async def handle_async(self, view, match, scope, receive, send):
+        set_script_prefix(self.get_script_prefix(scope))
+        request, response = self.create_request(scope, None)
+        if request is not None:
+            request.resolver_match = match
+            request.asgi_receive = receive
+            try:
+                request.finish_view = await view(request, *match.args,
+                                                 **match.kwargs)
+            except RequestAborted:
+                return
+            except Exception as exc:
+                # handled by the middleware like the errors of a view
+                request.finish_view = _raising(exc)
+            response = await db_sync_to_async(
+                self.middleware.get_response
+            )(request)
+
+        await self.send_response(response, send)
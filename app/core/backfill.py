@@ -0,0 +1,62 @@
+"""
+Batched backfill of the exact decimal recipe price (price_decimal) from the
+legacy float column, used by the migration and the backfill_recipe_price
+command.
+
+Every batch is one set based UPDATE over a bounded id range, committed on
+its own, so locks are short and the work can be interrupted and resumed.
+"""
+import time
+
+from django.db import connections
+
+
+BACKFILL_SQL = """
+    UPDATE core_recipe
+    SET price_decimal = ROUND(price::numeric, 2)
+    WHERE id BETWEEN %s AND %s AND price_decimal IS NULL
+"""
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+def price_decimal_pending(using='default'):
+    """
+    Returns True while the legacy float column still has to be copied
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        columns = connection.introspection.get_table_description(
+            cursor, 'core_recipe'
+        )
+    return 'price_decimal' in {column.name for column in columns}
+
+
+def backfill_price_decimal(using='default', batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Copies the float prices to price_decimal batch by batch.
+    Yields a progress dict after every batch with the last id done, the
+    highest id, the rows updated so far and the throughput in rows/s
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT MIN(id), MAX(id) FROM core_recipe')
+        first_id, last_id = cursor.fetchone()
+    if first_id is None:
+        return
+
+    updated = 0
+    started = time.monotonic()
+    for start in range(first_id, last_id + 1, batch_size):
+        end = min(start + batch_size - 1, last_id)
+        with connection.cursor() as cursor:
+            cursor.execute(BACKFILL_SQL, [start, end])
+            updated += cursor.rowcount
+        elapsed = time.monotonic() - started
+        yield {
+            'done_id': end,
+            'last_id': last_id,
+            'first_id': first_id,
+            'updated': updated,
+            'rows_per_second': updated / elapsed if elapsed else 0,
+        }
@@ -0,0 +1,262 @@
+"""
+Negotiated response compression and a cache of compressed responses.
+
+compress_response() encodes a response with the best encoding the client
+accepts, brotli when the brotli package is installed, else gzip, at the
+levels of COMPRESSION_LEVELS. Responses smaller than COMPRESSION_MIN_SIZE
+aren't worth it and are sent as they are, streaming responses are
+compressed chunk by chunk as they are sent. CompressionMiddleware applies
+it to the Django stack, core.asgi to the async views.
+
+CompressedCacheMixin caches the list responses of a viewset per user,
+already rendered and compressed, so a hit skips the queries, the
+serialization and the compression. Every change recorded in the change feed
+(core.models.Change) moves the user to a new cache version, which leaves
+the cached responses of the user behind.
+"""
+import hashlib
+import json
+import uuid
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from rest_framework.response import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+BROTLI = 'br'
+GZIP = 'gzip'
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/x-ndjson',
+    'application/javascript', 'application/xml', 'image/svg+xml',
+)
+
+VERSION_KEY = 'response-version:{}'
+RESPONSE_KEY = 'response:{}:{}:{}'
+
+
+def available_encodings():
+    """
+    Returns the supported encodings, preferred first
+    """
+    return (BROTLI, GZIP) if brotli is not None else (GZIP,)
+
+
+def negotiate(accept_encoding):
+    """
+    Returns the supported encoding the Accept-Encoding header prefers, None
+    if the client accepts none
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding.strip().lower()] = weight
+
+    best = None
+    for encoding in available_encodings():
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > 0 and (best is None or weight > best[1]):
+            best = (encoding, weight)
+    return best[0] if best else None
+
+
+def compressor(encoding, level=None):
+    """
+    Returns (compress(bytes), finish()) functions of a new compressor
+    """
+    if level is None:
+        level = settings.COMPRESSION_LEVELS[encoding]
+    if encoding == BROTLI:
+        stream = brotli.Compressor(quality=level)
+        return stream.process, stream.finish
+    stream = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return stream.compress, stream.flush
+
+
+def compress(data, encoding, level=None):
+    write, finish = compressor(encoding, level)
+    return write(data) + finish()
+
+
+def decompress(data, encoding):
+    if encoding == BROTLI:
+        return brotli.decompress(data)
+    if encoding == GZIP:
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    return data
+
+
+def compress_stream(chunks, encoding, level=None):
+    """
+    Compresses a sequence of chunks, yielding the output as the compressor
+    emits it
+    """
+    write, finish = compressor(encoding, level)
+    for chunk in chunks:
+        output = write(chunk)
+        if output:
+            yield output
+    yield finish()
+
+
+def _compressible(response):
+    content_type = response.get('Content-Type', '').lower()
+    return not response.has_header('Content-Encoding') and \
+        content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress_response(request, response):
+    """
+    Compresses the response with the encoding the client prefers, if it is
+    worth it
+    """
+    if not _compressible(response) or (
+            not response.streaming and
+            len(response.content) < settings.COMPRESSION_MIN_SIZE):
+        return response
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoding is None:
+        return response
+
+    if response.streaming:
+        response.streaming_content = compress_stream(
+            response.streaming_content, encoding
+        )
+        del response['Content-Length']
+    else:
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+
+    # the representation changed, as in django.middleware.gzip
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+    response['Content-Encoding'] = encoding
+    return response
+
+
+class CompressionMiddleware:
+    """
+    Compresses the responses of the Django stack, see compress_response()
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return compress_response(request, self.get_response(request))
+
+
+def _bump(user_id):
+    cache.set(VERSION_KEY.format(user_id), uuid.uuid4().hex, None)
+
+
+def invalidate(user_id):
+    """
+    Leaves the cached responses of the user behind, now for the rest of
+    the transaction and again after the commit for the responses cached
+    from data read before it
+    """
+    _bump(user_id)
+    transaction.on_commit(lambda: _bump(user_id))
+
+
+def cache_version(user_id):
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        # an evicted version must not bring back older responses
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+class CachedResponse(Response):
+    """
+    Response of a cache hit, rendered already. Its data is decoded from the
+    JSON content when asked for
+    """
+    def __init__(self, entry):
+        super().__init__(content_type=entry['content_type'])
+        self.content = entry['content']
+        for header, value in entry['headers']:
+            self[header] = value
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(
+                decompress(self.content, self.get('Content-Encoding'))
+            )
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+
+class CompressedCacheMixin:
+    """
+    Viewset mixin caching the rendered and compressed JSON list responses
+    for RESPONSE_CACHE_SECONDS, per user, cache version, URL and encoding
+    """
+    def _cache_key(self, request, encoding):
+        user_id = request.user.pk
+        variant = hashlib.sha1(
+            f'{encoding}\n{request.get_full_path()}'.encode()
+        ).hexdigest()
+        return RESPONSE_KEY.format(user_id, cache_version(user_id), variant)
+
+    def list(self, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_SECONDS or \
+                request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        key = self._cache_key(request, encoding)
+        entry = cache.get(key)
+        if entry is not None:
+            return CachedResponse(entry)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        # rendered like finalize_response() would, to cache the bytes sent
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        for header, value in self.headers.items():
+            response[header] = value
+        response = compress_response(request, response.render())
+
+        cache.set(key, {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'headers': [
+                (header, response[header])
+                for header in ('Content-Encoding', 'Vary', 'Allow')
+                if response.has_header(header)
+            ],
+        }, settings.RESPONSE_CACHE_SECONDS)
+        return response
@@ -0,0 +1,280 @@
+"""
+Background jobs queued in PostgreSQL, without a broker.
+
+A job is a row of core.models.Job naming a task and its JSON arguments.
+Tasks are functions registered with @task in the `tasks` module of an app.
+enqueue() writes the job in the transaction of the caller, so it is queued
+if and only if the change it follows commits, and wakes the workers up on
+commit with NOTIFY.
+
+The worker command claims due jobs with SELECT ... FOR UPDATE SKIP LOCKED
+(see JobManager), marking them running in a statement of its own, and runs
+them in a pool of threads or processes. A failing job is retried until it
+made JOB_MAX_ATTEMPTS attempts, after a backoff of JOB_BACKOFF_SECONDS
+doubled at every attempt, up to JOB_BACKOFF_MAX_SECONDS, with jitter so
+jobs failing together aren't retried together. Jobs running for longer than
+JOB_TIMEOUT_SECONDS are taken to be lost with their worker and queued again,
+or failed if that was their last attempt.
+A job may thus run more than once, tasks must be safe to run again.
+
+Workers count the outcomes, run times and queue waits of their jobs in
+core.metrics.job_registry, render_queue() the queue depth from the table.
+"""
+import logging
+import multiprocessing
+import os
+import random
+import select
+import socket
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections
+from django.db.models import Count, Min
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from core import processes
+from core.metrics import job_registry
+from core.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+THREAD = 'thread'
+PROCESS = 'process'
+POOLS = (THREAD, PROCESS)
+
+# outcomes of an attempt
+SUCCEEDED = 'succeeded'
+RETRIED = 'retried'
+FAILED = 'failed'
+
+TASKS = {}
+_discovered = False
+
+
+def task(name):
+    """
+    Registers the decorated function as the task of the jobs named name,
+    called with the job arguments as keyword arguments. Its return value,
+    JSON serializable, is the result of the job
+    """
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+def tasks():
+    global _discovered
+    if not _discovered:
+        autodiscover_modules('tasks')
+        _discovered = True
+    return TASKS
+
+
+def enqueue(name, user=None, run_at=None, **args):
+    """
+    Queues a job of the task with the given arguments, run for the user if
+    given, see the module docstring. Returns the Job
+    """
+    if name not in tasks():
+        raise ValueError(f'Unknown task {name}')
+    return Job.objects.enqueue(name, args, run_at=run_at,
+                               user_id=user.pk if user else None)
+
+
+def backoff(attempts):
+    """
+    Returns the seconds to wait before the next attempt of a job that
+    failed attempts times
+    """
+    delay = min(settings.JOB_BACKOFF_SECONDS * 2 ** (attempts - 1),
+                settings.JOB_BACKOFF_MAX_SECONDS)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _finish(job, **fields):
+    # a no-op if the job was given to another worker in the meantime
+    return Job.objects.filter(
+        pk=job.pk, worker=job.worker, attempts=job.attempts,
+        status=Job.RUNNING
+    ).update(**fields)
+
+
+def _fail(job, error):
+    logger.error('Job %s %s failed, attempt %s/%s', job.pk, job.name,
+                 job.attempts, job.max_attempts)
+    now = timezone.now()
+    if job.attempts < job.max_attempts and job.name in TASKS:
+        _finish(job, status=Job.QUEUED, error=error,
+                run_at=now + timedelta(seconds=backoff(job.attempts)))
+        return RETRIED
+    _finish(job, status=Job.FAILED, error=error, finished=now)
+    return FAILED
+
+
+def execute(job_id):
+    """
+    Runs a claimed job and records its outcome. Returns (job name,
+    outcome, seconds run, seconds waited in the queue)
+    """
+    job = Job.objects.get(pk=job_id)
+    wait = max((job.started - job.run_at).total_seconds(), 0)
+    started = time.monotonic()
+    try:
+        result = tasks()[job.name](**job.args)
+    except Exception:
+        outcome = _fail(job, traceback.format_exc())
+    else:
+        _finish(job, status=Job.DONE, result=result, error='',
+                finished=timezone.now())
+        outcome = SUCCEEDED
+    return job.name, outcome, time.monotonic() - started, wait
+
+
+def _run(job_id):
+    # in the pool, its connections are handled like the ones of a request
+    close_old_connections()
+    try:
+        return execute(job_id)
+    finally:
+        close_old_connections()
+
+
+def render_queue():
+    """
+    Returns the jobs queued and running by task, and how long the oldest
+    due job has waited, in the Prometheus text format
+    """
+    now = timezone.now()
+    rows = Job.objects.filter(
+        status__in=(Job.QUEUED, Job.RUNNING)
+    ).values('name', 'status').annotate(
+        jobs=Count('id'), oldest=Min('run_at')
+    ).order_by('name', 'status')
+    lines = [
+        '# HELP jobs_pending Jobs queued or running by status',
+        '# TYPE jobs_pending gauge',
+    ]
+    waits = []
+    for row in rows:
+        lines.append(f'jobs_pending{{job="{row["name"]}",'
+                     f'status="{row["status"]}"}} {row["jobs"]}')
+        if row['status'] == Job.QUEUED:
+            waits.append((row['name'],
+                          max((now - row['oldest']).total_seconds(), 0)))
+    lines.append('# HELP job_oldest_wait_seconds Time the oldest queued '
+                 'job has been due')
+    lines.append('# TYPE job_oldest_wait_seconds gauge')
+    for name, wait in waits:
+        lines.append(f'job_oldest_wait_seconds{{job="{name}"}} {wait}')
+    return '\n'.join(lines) + '\n'
+
+
+class Worker:
+    """
+    Claims due jobs and runs up to concurrency of them at once in a pool of
+    threads or processes, see the module docstring
+    """
+    def __init__(self, concurrency=None, pool=None, poll_seconds=None):
+        self.concurrency = concurrency or settings.JOB_CONCURRENCY
+        self.pool = pool or settings.JOB_POOL
+        if self.pool not in POOLS:
+            raise ValueError(f'Unknown pool {self.pool}')
+        self.poll_seconds = poll_seconds if poll_seconds is not None \
+            else settings.JOB_POLL_SECONDS
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._requeued_at = 0
+
+    def stop(self):
+        """
+        Stops claiming jobs, the running ones are finished. Safe to call
+        from a signal handler
+        """
+        self.stopping = True
+        self._wake_up()
+
+    def _wake_up(self, *args):
+        os.write(self._wakeup_write, b'.')
+
+    def _executor(self):
+        if self.pool == THREAD:
+            return ThreadPoolExecutor(self.concurrency,
+                                      thread_name_prefix='job')
+        return ProcessPoolExecutor(
+            self.concurrency,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=processes.setup,
+            initargs=({alias: connections[alias].settings_dict['NAME']
+                       for alias in connections},),
+        )
+
+    def _listen(self):
+        connection.ensure_connection()
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {Job.objects.NOTIFY_CHANNEL}')
+
+    def _wait(self):
+        """
+        Waits for a notification, a job to finish, stop() or the poll
+        interval
+        """
+        database = connection.connection
+        readable, _, _ = select.select(
+            [self._wakeup_read, database], [], [], self.poll_seconds
+        )
+        if database in readable:
+            database.poll()
+            database.notifies.clear()
+        if self._wakeup_read in readable:
+            os.read(self._wakeup_read, 1024)
+
+    def _requeue_stale(self):
+        if time.monotonic() - self._requeued_at >= self.poll_seconds:
+            self._requeued_at = time.monotonic()
+            _, failed = Job.objects.requeue_stale(
+                timedelta(seconds=settings.JOB_TIMEOUT_SECONDS)
+            )
+            if failed:
+                logger.error('%d jobs timed out on their last attempt',
+                             failed)
+
+    def _collect(self, running):
+        for future in [future for future in running if future.done()]:
+            running.discard(future)
+            try:
+                job_registry.observe(*future.result())
+            except Exception:
+                # the job stays running, it is queued again once stale
+                logger.exception('Worker %s lost a job', self.name)
+
+    def run(self, burst=False):
+        """
+        Runs jobs until stop(), or until none is due when burst
+        """
+        running = set()
+        self._listen()
+        with self._executor() as executor:
+            while not self.stopping:
+                self._collect(running)
+                self._requeue_stale()
+                free = self.concurrency - len(running)
+                claimed = Job.objects.claim(self.name, free) if free else []
+                for job in claimed:
+                    future = executor.submit(_run, job.pk)
+                    future.add_done_callback(self._wake_up)
+                    running.add(future)
+                if burst and not running:
+                    break
+                if free and len(claimed) == free:
+                    # more may be due
+                    continue
+                self._wait()
+        self._collect(running)
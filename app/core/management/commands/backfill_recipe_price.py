@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from core.backfill import DEFAULT_BATCH_SIZE, backfill_price_decimal, \
+                          price_decimal_pending
+
+
+class Command(BaseCommand):
+    """Django command to copy float recipe prices to the decimal column"""
+    help = "Backfills core_recipe.price_decimal in bounded batches, run it " \
+           "between the price_decimal and swap migrations on large tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        if not price_decimal_pending(options['database']):
+            self.stdout.write(self.style.SUCCESS(
+                'Nothing to backfill, the decimal price is already in place'
+            ))
+            return
+
+        progress = None
+        for progress in backfill_price_decimal(options['database'],
+                                               options['batch_size']):
+            span = progress['last_id'] - progress['first_id'] + 1
+            done = progress['done_id'] - progress['first_id'] + 1
+            self.stdout.write(
+                f"{100 * done / span:5.1f}% "
+                f"ids up to {progress['done_id']}/{progress['last_id']}, "
+                f"{progress['updated']} rows updated, "
+                f"{progress['rows_per_second']:.0f} rows/s"
+            )
+
+        updated = progress['updated'] if progress else 0
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {updated} rows'))
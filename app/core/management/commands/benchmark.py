@@ -0,0 +1,195 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, \
+                              teardown_test_environment
+
+from benchmarks import compression, datagen, runner, startup
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the API against a throwaway database"""
+    help = "Runs the API benchmarks on a generated data set in a test " \
+           "database, saves the results as JSON and compares them with a " \
+           "baseline"
+
+    def add_arguments(self, parser):
+        defaults = datagen.DataSpec()
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--recipes', type=int, default=defaults.recipes,
+                            help='Recipes per user')
+        parser.add_argument('--tags', type=int, default=defaults.tags,
+                            help='Tags per user')
+        parser.add_argument('--ingredients', type=int,
+                            default=defaults.ingredients,
+                            help='Ingredients per user')
+        parser.add_argument('--density', type=float,
+                            default=defaults.density,
+                            help="Share of the user's tags and ingredients "
+                                 "attached to every recipe")
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--alloc-iterations', type=int, default=10)
+        parser.add_argument('--scenario', action='append',
+                            choices=list(runner.SCENARIOS), dest='scenarios',
+                            help='Run only this scenario, repeatable')
+        parser.add_argument('--partitions', type=int, default=0,
+                            help='Split the recipe tables into this many '
+                                 'hash partitions and compare with the '
+                                 'plain tables')
+        parser.add_argument('--compression', action='store_true',
+                            help='Measure the recipe list compressed at '
+                                 'several gzip and brotli levels')
+        parser.add_argument('--startup-runs', type=int, default=5,
+                            help='Start the commands of the start up '
+                                 'benchmark this many times each, 0 to '
+                                 'skip it')
+        parser.add_argument('--output', help='Save the results to this file')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='Fail if the results regress from the '
+                                 'results saved in this file')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed relative slowdown when comparing')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        spec = datagen.DataSpec(
+            users=options['users'],
+            recipes=options['recipes'],
+            tags=options['tags'],
+            ingredients=options['ingredients'],
+            density=options['density'],
+            seed=options['seed'],
+        )
+        results = self._run(spec, options, options['partitions'])
+        if options['partitions']:
+            unpartitioned = self._run(spec, options)
+            results['unpartitioned'] = unpartitioned['scenarios']
+
+        self.stdout.write(
+            f"{'scenario':<16}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'queries':>9}{'alloc KiB':>11}"
+        )
+        for name, metrics in results['scenarios'].items():
+            self.stdout.write(
+                f"{name:<16}{metrics['latency_p50_ms']:>9.2f}"
+                f"{metrics['latency_p95_ms']:>9.2f}"
+                f"{metrics['latency_p99_ms']:>9.2f}"
+                f"{metrics['queries']:>9}"
+                f"{metrics['alloc_peak_kib']:>11.1f}"
+            )
+        if options['partitions']:
+            self._write_partitioning(results)
+        if options['compression']:
+            self._write_compression(results['compression'])
+        if options['startup_runs']:
+            results['startup'] = startup.run(runs=options['startup_runs'])
+            self._write_startup(results['startup'])
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+            self.stdout.write(f"Results saved to {options['output']}")
+
+        if baseline is not None:
+            regressions = runner.compare(
+                baseline, results, options['tolerance']
+            )
+            for regression in regressions:
+                self.stderr.write(str(regression))
+            if regressions:
+                raise CommandError(
+                    f'{len(regressions)} regressions from the baseline'
+                )
+            self.stdout.write(self.style.SUCCESS('No regressions'))
+
+    def _write_partitioning(self, results):
+        """
+        Writes the latencies of the partitioned tables next to the ones of
+        the plain tables
+        """
+        partitions = results['environment']['partitions']
+        self.stdout.write(
+            f"\n{'scenario':<16}{'plain p50':>11}"
+            f"{f'{partitions} parts p50':>15}{'plain p95':>11}"
+            f"{f'{partitions} parts p95':>15}"
+        )
+        for name, metrics in results['scenarios'].items():
+            plain = results['unpartitioned'][name]
+            self.stdout.write(
+                f"{name:<16}{plain['latency_p50_ms']:>11.2f}"
+                f"{metrics['latency_p50_ms']:>15.2f}"
+                f"{plain['latency_p95_ms']:>11.2f}"
+                f"{metrics['latency_p95_ms']:>15.2f}"
+            )
+
+    def _write_compression(self, results):
+        """
+        Writes the size and CPU time of every compression level next to the
+        transfer time it saves
+        """
+        self.stdout.write(
+            f"\nrecipe list of {results['payload_size']} bytes\n"
+            f"{'encoding':<10}{'level':>6}{'bytes':>9}{'ratio':>7}"
+            f"{'comp ms':>9}{'decomp ms':>11}"
+            + ''.join(f"{f'saved@{mbps}M':>12}"
+                      for mbps in compression.BANDWIDTHS)
+        )
+        for level in results['levels']:
+            self.stdout.write(
+                f"{level['encoding']:<10}{level['level']:>6}"
+                f"{level['size']:>9}{level['ratio']:>7.2f}"
+                f"{level['compress_ms']:>9.3f}"
+                f"{level['decompress_ms']:>11.3f}"
+                + ''.join(f"{level['saved_ms'][str(mbps)]:>12.2f}"
+                          for mbps in compression.BANDWIDTHS)
+            )
+
+    def _write_startup(self, results):
+        """
+        Writes the start up time of the commands and what they import
+        """
+        self.stdout.write(
+            f"\n{'command':<16}{'wall ms':>9}{'import ms':>11}"
+            f"{'modules':>9}  slowest packages"
+        )
+        for name, metrics in results.items():
+            slowest = ', '.join(
+                f'{package} {ms:.0f}'
+                for package, ms in list(metrics['packages'].items())[:3]
+            )
+            self.stdout.write(
+                f"{name:<16}{metrics['wall_ms']:>9.0f}"
+                f"{metrics['import_ms']:>11.0f}{metrics['modules']:>9}"
+                f"  {slowest}"
+            )
+
+    def _run(self, spec, options, partitions=0):
+        """
+        Runs the benchmarks in a test database created for the run, the
+        configured database is never written to
+        """
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            return runner.run(
+                spec,
+                scenarios=options['scenarios'],
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                alloc_iterations=options['alloc_iterations'],
+                partitions=partitions,
+                compression_levels=(
+                    compression.LEVELS if options['compression'] else None
+                ),
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
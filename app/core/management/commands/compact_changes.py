@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Change
+
+
+class Command(BaseCommand):
+    """Django command to compact the change feed"""
+    help = "Numbers the committed changes and deletes the ones superseded " \
+           "by a later change of the same object"
+
+    def handle(self, *args, **options):
+        while Change.objects.sequence():
+            pass
+        deleted = Change.objects.compact()
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} changes'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from core import accounts
+
+
+class Command(BaseCommand):
+    """Django command to carry out the requested account deletions"""
+    help = "Deletes the accounts queued for deletion in bounded batches, " \
+           "resuming interrupted and failed deletions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=accounts.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        done = 0
+        for deletion in accounts.pending():
+            try:
+                for progress in accounts.delete_account(
+                        deletion, options['batch_size']):
+                    self.stdout.write(
+                        f"user {progress.user_id}: "
+                        f"{100 * progress.progress:5.1f}% "
+                        f"{progress.recipes_deleted} recipes, "
+                        f"{progress.tags_deleted} tags, "
+                        f"{progress.ingredients_deleted} ingredients, "
+                        f"{progress.images_released} images released"
+                    )
+            except Exception as error:
+                accounts.fail(deletion, error)
+                self.stderr.write(
+                    f'user {deletion.user_id}: failed, {error}'
+                )
+                continue
+            done += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {done} accounts'))
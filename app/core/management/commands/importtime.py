@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from benchmarks import startup
+
+
+class Command(BaseCommand):
+    """Django command to report what another command imports at start up"""
+    help = "Runs a manage.py command in a new interpreter with -X " \
+           "importtime and reports the packages and modules it spends " \
+           "its start up importing"
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('args', nargs='*', metavar='command',
+                            help='The command and its arguments, '
+                                 'wait_for_db by default. Put -- before '
+                                 'arguments starting with -')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Packages and modules listed')
+
+    def handle(self, *args, **options):
+        command = list(args) or ['wait_for_db']
+        wall_ms, imports = startup.profile(command)
+        limit = options['limit']
+
+        self.stdout.write(
+            f"{' '.join(command)}: {wall_ms:.0f} ms, "
+            f"{sum(module.self_us for module in imports) / 1000:.0f} ms "
+            f"importing {len(imports)} modules\n"
+        )
+        self.stdout.write(f"{'package':<40}{'ms':>9}")
+        for package, ms in list(startup.packages(imports).items())[:limit]:
+            self.stdout.write(f'{package:<40}{ms:>9.1f}')
+
+        # the modules the command imported itself, with their imports
+        self.stdout.write(f"\n{'module':<40}{'cumulative ms':>15}")
+        top = sorted((module for module in imports if module.depth == 0),
+                     key=lambda module: -module.cumulative_us)
+        for module in top[:limit]:
+            self.stdout.write(
+                f'{module.module:<40}{module.cumulative_us / 1000:>15.1f}'
+            )
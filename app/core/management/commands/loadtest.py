@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks import load
+
+
+class Command(BaseCommand):
+    """Django command to put a local server under concurrent load"""
+    help = "Runs asyncio virtual users against a local server following a " \
+           "ramp profile and reports throughput, errors and tail latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', nargs='?', default='http://127.0.0.1:8000',
+                            help='Base URL of a server on this machine')
+        parser.add_argument('--profile', default='smoke',
+                            help=f"One of {', '.join(load.PROFILES)} or "
+                                 f"users:seconds stages, e.g. 10:30,50:60")
+        parser.add_argument('--mix', default='mixed',
+                            choices=list(load.MIXES))
+        parser.add_argument('--think', type=float, default=0.5,
+                            help='Mean think time between actions, seconds')
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--report-interval', type=float, default=5.0)
+        parser.add_argument('--output', help='Save the summary to this file')
+
+    def handle(self, *args, **options):
+        try:
+            stages = load.parse_profile(options['profile'])
+            load.check_local(options['url'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        loop = asyncio.new_event_loop()
+        try:
+            summary = loop.run_until_complete(load.run_load(
+                options['url'].rstrip('/'),
+                stages,
+                load.MIXES[options['mix']],
+                think=options['think'],
+                seed=options['seed'],
+                report_interval=options['report_interval'],
+                report=self._report,
+            ))
+        finally:
+            loop.close()
+
+        self.stdout.write(
+            f"{'action':<10}{'requests':>10}{'rps':>9}{'errors':>9}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+        )
+        for action, metrics in summary['actions'].items():
+            self.stdout.write(
+                f"{action:<10}{metrics['requests']:>10}"
+                f"{metrics['throughput_rps']:>9.1f}"
+                f"{metrics['error_rate']:>9.1%}"
+                f"{metrics['latency_p50_ms']:>9.1f}"
+                f"{metrics['latency_p95_ms']:>9.1f}"
+                f"{metrics['latency_p99_ms']:>9.1f}"
+                f"{metrics['latency_max_ms']:>9.1f}"
+            )
+        self.stdout.write(
+            f"{summary['requests']} requests in "
+            f"{summary['duration_s']:.1f}s, "
+            f"{summary['throughput_rps']:.1f} rps, "
+            f"{summary['error_rate']:.1%} errors, "
+            f"p99 {summary['latency_p99_ms']:.1f} ms"
+        )
+        for sample in summary['error_samples']:
+            self.stderr.write(sample)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(summary, output, indent=2)
+            self.stdout.write(f"Summary saved to {options['output']}")
+
+    def _report(self, elapsed, users, requests, errors):
+        self.stdout.write(
+            f'{elapsed:6.0f}s {users:4} users {requests:6} requests '
+            f'{errors:4} errors'
+        )
@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from core import jobs
+from core.models import UserStats
+
+
+class Command(BaseCommand):
+    """Django command to recompute the denormalized user stats"""
+    help = "Recomputes the user stats from the recipe tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('emails', nargs='*',
+                            help="Only rebuild these users, default all")
+        parser.add_argument('--background', action='store_true',
+                            help="Queue a job for the worker instead")
+
+    def handle(self, *args, **options):
+        user_ids = None
+        if options['emails']:
+            user_ids = list(get_user_model().objects.filter(
+                email__in=options['emails']
+            ).values_list('id', flat=True))
+
+        if options['background']:
+            job = jobs.enqueue('rebuild_stats', user_ids=user_ids)
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.pk}'))
+            return
+
+        rows = UserStats.objects.rebuild(user_ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats of {rows} users'))
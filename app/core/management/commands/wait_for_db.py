@@ -7,6 +7,8 @@ from django.db import connections
 
 class Command(BaseCommand):
     """Django command to pause execution when database is unavailable"""
+    # the checks import the URLconf, every view, the admin and Pillow
+    requires_system_checks = False
 
     def handle(self, *args, **options):
         self.stdout.write("Waiting for database...")
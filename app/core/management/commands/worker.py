@@ -0,0 +1,85 @@
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import jobs
+from core.metrics import job_registry, scrape_allowed
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the job metrics of the worker for Prometheus to scrape"""
+
+    def do_GET(self):
+        if not scrape_allowed(self.client_address[0],
+                              self.headers.get('Authorization')):
+            self.send_error(403)
+            return
+        try:
+            body = (job_registry.render() + jobs.render_queue()).encode()
+        finally:
+            close_old_connections()
+        self.send_response(200)
+        self.send_header('Content-Type',
+                         'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    """Django command to run the background jobs"""
+    help = "Runs the queued background jobs in a pool of threads or " \
+           "processes until stopped with SIGTERM or SIGINT"
+    # the checks import the URLconf, the jobs don't need it
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int,
+                            default=settings.JOB_CONCURRENCY)
+        parser.add_argument('--pool', choices=jobs.POOLS,
+                            default=settings.JOB_POOL)
+        parser.add_argument('--poll', type=float,
+                            default=settings.JOB_POLL_SECONDS,
+                            help="Seconds between checks for due jobs "
+                                 "without a notification")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once no job is due")
+        parser.add_argument('--metrics-port', type=int,
+                            help="Serve the job metrics on this port")
+
+    def handle(self, *args, **options):
+        worker = jobs.Worker(options['concurrency'], options['pool'],
+                             options['poll'])
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                handlers[signum] = signal.signal(
+                    signum, lambda *args: worker.stop()
+                )
+
+        server = None
+        if options['metrics_port']:
+            server = ThreadingHTTPServer(('', options['metrics_port']),
+                                         MetricsHandler)
+            threading.Thread(target=server.serve_forever,
+                             daemon=True).start()
+
+        self.stdout.write(
+            f"Worker {worker.name}: {worker.pool} pool, concurrency "
+            f"{worker.concurrency}"
+        )
+        try:
+            worker.run(burst=options['burst'])
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            if server is not None:
+                server.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker.name} stopped'))
@@ -0,0 +1,213 @@
+"""
+In-process request and job metrics exposed in the Prometheus text format.
+
+Every series is a fixed set of histogram buckets keyed by (route, method),
+routes being URL pattern names and methods one of METHODS, any other verb
+a client sends being counted as 'other', or by job name for the jobs run
+by a worker, so memory stays constant no matter how many requests are
+served.
+
+The metrics are only served to the scrapers allowed by scrape_allowed().
+"""
+import hmac
+import ipaddress
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304
+)
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS')
+OTHER_METHOD = 'other'
+
+JOB_BUCKETS = (
+    0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0
+)
+
+
+def scrape_allowed(address, authorization):
+    """
+    Whether the client at address, sending the Authorization header value
+    authorization, may read the metrics: its address is in
+    METRICS_ALLOWED_IPS or it sends the bearer METRICS_TOKEN
+    """
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(
+            (authorization or '').encode(), f'Bearer {token}'.encode()):
+        return True
+    try:
+        client = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(client in ipaddress.ip_network(allowed, strict=False)
+               for allowed in settings.METRICS_ALLOWED_IPS)
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed upper bounds
+    """
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # one slot per bound plus +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def buckets(self):
+        """
+        Yields (upper bound label, cumulative count)
+        """
+        total = 0
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    'http_request_duration_seconds': (
+        'Time spent handling the request', DURATION_BUCKETS),
+    'http_request_db_seconds': (
+        'Time spent executing database queries', DURATION_BUCKETS),
+    'http_request_serialize_seconds': (
+        'Time spent rendering the response body', DURATION_BUCKETS),
+    'http_request_queries': (
+        'Number of database queries per request', QUERY_BUCKETS),
+    'http_response_size_bytes': (
+        'Size of the response body', SIZE_BUCKETS),
+}
+
+
+class Registry:
+    """
+    Thread safe store of the request histograms and status counters
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: {} for name in HISTOGRAMS}
+            self._statuses = {}
+
+    def observe(self, route, method, status, values):
+        """
+        Records one request, values maps histogram names to observations
+        """
+        if method not in METHODS:
+            method = OTHER_METHOD
+        key = (route, method)
+        with self._lock:
+            for name, value in values.items():
+                series = self._histograms[name]
+                if key not in series:
+                    series[key] = Histogram(HISTOGRAMS[name][1])
+                series[key].observe(value)
+            status_key = (route, method, str(status))
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+
+    def render(self):
+        """
+        Returns every series in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            lines.append('# HELP http_requests_total Requests by status')
+            lines.append('# TYPE http_requests_total counter')
+            for (route, method, status), count in sorted(
+                    self._statuses.items()):
+                lines.append(
+                    f'http_requests_total{{route="{route}",'
+                    f'method="{method}",status="{status}"}} {count}'
+                )
+            for name, (description, _) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for (route, method), histogram in sorted(
+                        self._histograms[name].items()):
+                    labels = f'route="{route}",method="{method}"'
+                    for bound, count in histogram.buckets():
+                        lines.append(
+                            f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+                        )
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(
+                        f'{name}_count{{{labels}}} {histogram.count}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+class JobRegistry:
+    """
+    Thread safe store of the outcomes, run times and queue waits of the
+    jobs run by a worker, see core.jobs
+    """
+    HISTOGRAMS = {
+        'job_duration_seconds': 'Time spent running the job',
+        'job_wait_seconds': 'Time the job was due before it started',
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: {} for name in self.HISTOGRAMS}
+            self._outcomes = {}
+
+    def observe(self, job, outcome, duration, wait):
+        with self._lock:
+            for name, value in (('job_duration_seconds', duration),
+                                ('job_wait_seconds', wait)):
+                series = self._histograms[name]
+                if job not in series:
+                    series[job] = Histogram(JOB_BUCKETS)
+                series[job].observe(value)
+            key = (job, outcome)
+            self._outcomes[key] = self._outcomes.get(key, 0) + 1
+
+    def render(self):
+        lines = [
+            '# HELP jobs_total Job attempts by outcome',
+            '# TYPE jobs_total counter',
+        ]
+        with self._lock:
+            for (job, outcome), count in sorted(self._outcomes.items()):
+                lines.append(
+                    f'jobs_total{{job="{job}",outcome="{outcome}"}} {count}'
+                )
+            for name, description in self.HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} histogram')
+                for job, histogram in sorted(self._histograms[name].items()):
+                    labels = f'job="{job}"'
+                    for bound, count in histogram.buckets():
+                        lines.append(
+                            f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+                        )
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(
+                        f'{name}_count{{{labels}}} {histogram.count}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+job_registry = JobRegistry()
@@ -0,0 +1,98 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from core.metrics import registry
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting the queries and the time they take,
+    it keeps two numbers instead of the queries so the memory used doesn't
+    depend on DEBUG or on the number of queries
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name
+
+
+class QueryMetricsMiddleware:
+    """
+    Records the duration, query count, database time, render time and
+    response size of every request in core.metrics and reports them to the
+    client in a Server-Timing header
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request._render_duration = 0.0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={timer.duration * 1000:.1f};'
+            f'desc="{timer.count} queries"',
+            f'render;dur={request._render_duration * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+        values = {
+            'http_request_duration_seconds': duration,
+            'http_request_db_seconds': timer.duration,
+            'http_request_serialize_seconds': request._render_duration,
+            'http_request_queries': timer.count,
+        }
+        route = _route(request)
+        if response.streaming:
+            # the body is produced after this returns, record at the end
+            response.streaming_content = self._counting(
+                response.streaming_content,
+                route, request.method, response.status_code, values
+            )
+        else:
+            values['http_response_size_bytes'] = len(response.content)
+            registry.observe(route, request.method, response.status_code,
+                             values)
+        return response
+
+    def _counting(self, content, route, method, status, values):
+        size = 0
+        for chunk in content:
+            size += len(chunk)
+            yield chunk
+        values['http_response_size_bytes'] = size
+        registry.observe(route, method, status, values)
+
+    def process_template_response(self, request, response):
+        """
+        DRF responses are rendered right after this hook, the post render
+        callback closes the measurement
+        """
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._render_duration = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
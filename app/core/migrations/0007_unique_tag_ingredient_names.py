@@ -0,0 +1,84 @@
+from django.db import migrations
+
+
+# every (user, lower(name)) group is merged into its oldest row
+DUPLICATES = """
+    SELECT id, MIN(id) OVER (PARTITION BY user_id, LOWER(name)) AS keep_id
+    FROM {table}
+"""
+
+MERGE_SQL = (
+    # point the M2M rows of the duplicates to the kept row
+    """
+    INSERT INTO {through} ({source}, {column})
+    SELECT DISTINCT assigned.{source}, duplicate.keep_id
+    FROM {through} assigned
+    JOIN (""" + DUPLICATES + """) duplicate ON duplicate.id = assigned.{column}
+    WHERE duplicate.id <> duplicate.keep_id
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    DELETE FROM {through} assigned
+    USING (""" + DUPLICATES + """) duplicate
+    WHERE assigned.{column} = duplicate.id
+      AND duplicate.id <> duplicate.keep_id
+    """,
+    """
+    DELETE FROM {table} named
+    USING (""" + DUPLICATES + """) duplicate
+    WHERE named.id = duplicate.id AND duplicate.id <> duplicate.keep_id
+    """,
+)
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """
+    Merges tags and ingredients with the same name (ignoring case) per user,
+    rewriting the recipe M2M rows with set based statements
+    """
+    recipe = apps.get_model('core', 'Recipe')
+    quote = schema_editor.quote_name
+    for field_name in ('tags', 'ingredients'):
+        field = recipe._meta.get_field(field_name)
+        for statement in MERGE_SQL:
+            schema_editor.execute(statement.format(
+                table=quote(field.related_model._meta.db_table),
+                through=quote(field.m2m_db_table()),
+                source=quote(field.m2m_column_name()),
+                column=quote(field.m2m_reverse_name()),
+            ))
+
+
+def unique_lower_name_index(table):
+    """
+    Returns the RunSQL building the unique (user_id, LOWER(name)) index of
+    the table without locking its writes. A build that failed leaves an
+    invalid index behind, which is dropped first so the migration can be
+    run again
+    """
+    name = f'{table}_user_id_lower_name_uniq'
+    return migrations.RunSQL(
+        [
+            f'DROP INDEX CONCURRENTLY IF EXISTS {name}',
+            f'CREATE UNIQUE INDEX CONCURRENTLY {name} '
+            f'ON {table} (user_id, LOWER(name))',
+        ],
+        f'DROP INDEX CONCURRENTLY IF EXISTS {name}',
+    )
+
+
+class Migration(migrations.Migration):
+    # the indexes are built concurrently so tags and ingredients stay
+    # writable meanwhile, the merge commits on its own before
+    atomic = False
+
+    dependencies = [
+        ('core', '0006_recipe_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_names,
+                             migrations.RunPython.noop, atomic=True),
+        unique_lower_name_index('core_tag'),
+        unique_lower_name_index('core_ingredient'),
+    ]
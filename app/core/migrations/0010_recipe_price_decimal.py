@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+# keeps price_decimal in sync while app servers still running the previous
+# release only write the float column; dropped again by the swap
+DUAL_WRITE_SQL = """
+    CREATE FUNCTION core_recipe_price_dual_write() RETURNS trigger AS $$
+    BEGIN
+        NEW.price_decimal := ROUND(NEW.price::numeric, 2);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER core_recipe_price_dual_write
+    BEFORE INSERT OR UPDATE OF price ON core_recipe
+    FOR EACH ROW EXECUTE PROCEDURE core_recipe_price_dual_write();
+"""
+
+DROP_DUAL_WRITE_SQL = """
+    DROP TRIGGER IF EXISTS core_recipe_price_dual_write ON core_recipe;
+    DROP FUNCTION IF EXISTS core_recipe_price_dual_write();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_recipe_ordering_indexes'),
+    ]
+
+    operations = [
+        # nullable without default, adding it doesn't rewrite the table
+        migrations.AddField(
+            model_name='recipe',
+            name='price_decimal',
+            field=models.DecimalField(decimal_places=2, max_digits=8,
+                                      null=True),
+        ),
+        migrations.RunSQL(DUAL_WRITE_SQL, DROP_DUAL_WRITE_SQL),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from core.backfill import backfill_price_decimal
+
+
+def backfill(apps, schema_editor):
+    """
+    Copies the rows the backfill_recipe_price command hasn't done yet,
+    run the command beforehand on large tables
+    """
+    for _ in backfill_price_decimal(schema_editor.connection.alias):
+        pass
+
+
+class Migration(migrations.Migration):
+    # every batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('core', '0010_recipe_price_decimal'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # a validated CHECK constraint lets postgres set NOT NULL in the swap
+    # without scanning the table under an exclusive lock; VALIDATE itself
+    # only blocks schema changes, not reads and writes
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_backfill_recipe_price'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'ALTER TABLE core_recipe '
+            'ADD CONSTRAINT core_recipe_price_decimal_not_null '
+            'CHECK (price_decimal IS NOT NULL) NOT VALID',
+            'ALTER TABLE core_recipe '
+            'DROP CONSTRAINT core_recipe_price_decimal_not_null',
+        ),
+        migrations.RunSQL(
+            'ALTER TABLE core_recipe '
+            'VALIDATE CONSTRAINT core_recipe_price_decimal_not_null',
+            migrations.RunSQL.noop,
+        ),
+    ]
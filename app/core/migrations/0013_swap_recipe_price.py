@@ -0,0 +1,98 @@
+from django.db import migrations, models
+
+
+# SET NOT NULL on the swapped column skips its scan of the table, made
+# under ACCESS EXCLUSIVE, only from PostgreSQL 12 on, where the CHECK
+# validated by 0012 proves the column has no NULL
+MIN_PG_VERSION = 120000
+
+
+def require_pg_version(apps, schema_editor):
+    version = schema_editor.connection.pg_version
+    if version < MIN_PG_VERSION:
+        raise RuntimeError(
+            f'Swapping the recipe price needs PostgreSQL 12 or later, the '
+            f'server runs {version}: SET NOT NULL would lock core_recipe '
+            f'for a scan of the whole table'
+        )
+
+
+RESTORE_DUAL_WRITE_SQL = """
+    CREATE FUNCTION core_recipe_price_dual_write() RETURNS trigger AS $$
+    BEGIN
+        NEW.price_decimal := ROUND(NEW.price::numeric, 2);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER core_recipe_price_dual_write
+    BEFORE INSERT OR UPDATE OF price ON core_recipe
+    FOR EACH ROW EXECUTE PROCEDURE core_recipe_price_dual_write();
+"""
+
+
+class Migration(migrations.Migration):
+    # on PostgreSQL 12+ every statement only touches the catalog, the swap
+    # holds its lock for milliseconds
+
+    dependencies = [
+        ('core', '0012_validate_recipe_price_decimal'),
+    ]
+
+    operations = [
+        migrations.RunPython(require_pg_version, migrations.RunPython.noop),
+        migrations.RunSQL(
+            """
+            DROP TRIGGER core_recipe_price_dual_write ON core_recipe;
+            DROP FUNCTION core_recipe_price_dual_write();
+            """,
+            RESTORE_DUAL_WRITE_SQL,
+        ),
+        migrations.RemoveIndex(
+            model_name='recipe',
+            name='core_recipe_user_price_idx',
+        ),
+        # lets a rollback add the float column back before refilling it
+        migrations.AlterField(
+            model_name='recipe',
+            name='price',
+            field=models.FloatField(null=True),
+        ),
+        migrations.RunSQL(
+            migrations.RunSQL.noop,
+            'UPDATE core_recipe SET price = price_decimal',
+        ),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='price',
+        ),
+        migrations.RenameField(
+            model_name='recipe',
+            old_name='price_decimal',
+            new_name='price',
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=8),
+        ),
+        migrations.RunSQL(
+            'ALTER TABLE core_recipe '
+            'DROP CONSTRAINT core_recipe_price_decimal_not_null',
+            'ALTER TABLE core_recipe '
+            'ADD CONSTRAINT core_recipe_price_decimal_not_null '
+            'CHECK (price IS NOT NULL) NOT VALID',
+        ),
+        migrations.AlterField(
+            model_name='userstats',
+            name='price_max',
+            field=models.DecimalField(decimal_places=2, max_digits=8,
+                                      null=True),
+        ),
+        migrations.AlterField(
+            model_name='userstats',
+            name='price_min',
+            field=models.DecimalField(decimal_places=2, max_digits=8,
+                                      null=True),
+        ),
+    ]
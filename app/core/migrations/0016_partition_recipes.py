@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import migrations
+
+from core import partitioning
+
+
+def partition_recipes(apps, schema_editor):
+    """
+    Splits the recipe tables when RECIPE_PARTITIONS is set, see
+    core.partitioning
+    """
+    if settings.RECIPE_PARTITIONS:
+        partitioning.partition_recipes(
+            schema_editor,
+            apps.get_model('core', 'Recipe'),
+            settings.RECIPE_PARTITIONS
+        )
+
+
+def unpartition_recipes(apps, schema_editor):
+    partitioning.unpartition_recipes(
+        schema_editor,
+        apps.get_model('core', 'Recipe')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_stored_files'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_recipes, unpartition_recipes),
+    ]
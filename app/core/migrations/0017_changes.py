@@ -0,0 +1,42 @@
+# Generated by Django 3.0.14 on 2026-10-19 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_partition_recipes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE SEQUENCE core_change_feed_seq',
+            'DROP SEQUENCE core_change_feed_seq',
+        ),
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('seq', models.BigIntegerField(null=True, unique=True)),
+                ('txid', models.BigIntegerField()),
+                ('model', models.CharField(max_length=20)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('deleted', 'Deleted')], max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('user_id', models.IntegerField()),
+                ('created', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(condition=models.Q(seq=None), fields=['txid', 'id'], name='core_change_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['model', 'object_id'], name='core_change_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['user_id', 'seq'], name='core_change_user_idx'),
+        ),
+    ]
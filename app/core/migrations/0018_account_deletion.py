@@ -0,0 +1,31 @@
+# Generated by Django 3.0.14 on 2026-10-19 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDeletion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField(unique=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('recipes_total', models.PositiveIntegerField(null=True)),
+                ('tags_total', models.PositiveIntegerField(null=True)),
+                ('ingredients_total', models.PositiveIntegerField(null=True)),
+                ('recipes_deleted', models.PositiveIntegerField(default=0)),
+                ('tags_deleted', models.PositiveIntegerField(default=0)),
+                ('ingredients_deleted', models.PositiveIntegerField(default=0)),
+                ('images_released', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('requested', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -1,9 +1,15 @@
 import os
 import uuid
-from django.db import models
+from collections import Counter
+from django.db import models, connections, router, transaction
+from django.db.models.expressions import RawSQL
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from django.conf import settings
+from django.contrib.postgres.fields import JSONField
+from django.utils import timezone
+
+from core.storage import recipe_image_storage
 
 
 def get_recipe_image_file_path(instance, filename):
@@ -60,6 +66,73 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
 
 
+class RecipeAttrManager(models.Manager):
+    """
+    Manager for the per user named objects (tags and ingredients) whose names
+    are unique per user regardless of case
+    """
+    GET_OR_CREATE_SQL = """
+        WITH names (name) AS (
+            SELECT DISTINCT ON (LOWER(name)) name
+            FROM UNNEST(%(names)s::varchar[]) AS name
+        ),
+        inserted AS (
+            INSERT INTO {table} (user_id, name)
+            SELECT %(user_id)s, name FROM names
+            ON CONFLICT (user_id, LOWER(name)) DO NOTHING
+            RETURNING id, name
+        )
+        SELECT id, name, TRUE FROM inserted
+        UNION ALL
+        SELECT existing.id, existing.name, FALSE
+        FROM {table} existing
+        JOIN names ON LOWER(existing.name) = LOWER(names.name)
+        WHERE existing.user_id = %(user_id)s
+    """
+
+    def get_or_create_names(self, user, names):
+        """
+        Resolves names to the user's objects, creating the missing ones,
+        with a single INSERT ... ON CONFLICT round trip.
+        Returns {lower cased name: object}
+        """
+        names = list(names)
+        found = {}
+        created = []
+        # a name committed by a concurrent request after our statement
+        # started is neither inserted nor visible, the retry picks it up
+        for _ in range(2):
+            missing = [name for name in names if name.lower() not in found]
+            if not missing:
+                break
+            connection = connections[self.db]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    self.GET_OR_CREATE_SQL.format(
+                        table=connection.ops.quote_name(
+                            self.model._meta.db_table
+                        )
+                    ),
+                    {'names': missing, 'user_id': user.pk},
+                )
+                rows = cursor.fetchall()
+            found.update(
+                (name.lower(), self.model(id=pk, name=name, user=user))
+                for pk, name, _ in rows
+            )
+            created += [pk for pk, _, inserted in rows if inserted]
+
+        if created:
+            # raw inserts don't send post_save, count and record them here
+            field = f'{self.model._meta.model_name}_count'
+            UserStats.objects.filter(user_id=user.pk).update(
+                **{field: models.F(field) + len(created)}
+            )
+            Change.objects.record(self.model, Change.CREATED, user.pk,
+                                  created)
+        return found
+
+
 class Tag(models.Model):
     """
         Model to store tags for the recipes
@@ -70,6 +143,8 @@ class Tag(models.Model):
         on_delete=models.CASCADE
     )
 
+    objects = RecipeAttrManager()
+
     def __str__(self):
         """
             string representation of tags
@@ -87,6 +162,8 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE
     )
 
+    objects = RecipeAttrManager()
+
     def __str__(self):
         """
             string representation of ingredients
@@ -94,6 +171,116 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeManager(models.Manager):
+    """
+    Manager for the recipes, copying them with set based statements
+    """
+    DUPLICATE_SQL = """
+        WITH sources AS (
+            SELECT recipe.*, source.position,
+                   nextval(pg_get_serial_sequence(%(table)s, 'id')) AS copy_id
+            FROM UNNEST(%(ids)s::integer[]) WITH ORDINALITY
+                AS source (id, position)
+            JOIN {recipe} recipe ON recipe.id = source.id
+            WHERE recipe.user_id = %(user_id)s
+        ),
+        recipes AS (
+            INSERT INTO {recipe} (
+                id, user_id, title, time_minutes, price, link, image
+            )
+            SELECT copy_id, user_id, COALESCE(%(title)s, title),
+                   time_minutes, price, link, image
+            FROM sources
+            RETURNING id, time_minutes, price
+        ),
+        tags AS (
+            INSERT INTO {recipe_tags} (recipe_id, tag_id)
+            SELECT sources.copy_id, copied.tag_id
+            FROM {recipe_tags} copied
+            JOIN sources ON sources.id = copied.recipe_id
+            RETURNING recipe_id, tag_id
+        ),
+        ingredients AS (
+            INSERT INTO {recipe_ingredients} (recipe_id, ingredient_id)
+            SELECT sources.copy_id, copied.ingredient_id
+            FROM {recipe_ingredients} copied
+            JOIN sources ON sources.id = copied.recipe_id
+        )
+        SELECT sources.id, sources.copy_id, sources.image,
+               recipes.time_minutes, recipes.price,
+               COALESCE(copied_tags.tag_ids, '{{}}')
+        FROM sources
+        JOIN recipes ON recipes.id = sources.copy_id
+        LEFT JOIN (
+            SELECT recipe_id, ARRAY_AGG(tag_id) AS tag_ids
+            FROM tags GROUP BY recipe_id
+        ) copied_tags ON copied_tags.recipe_id = sources.copy_id
+        ORDER BY sources.position
+    """
+
+    def duplicate(self, user, recipe_ids, title=None, share_image=True):
+        """
+        Copies the user's recipes with their tags and ingredients in one
+        INSERT ... SELECT round trip, ids of other users' recipes are
+        skipped. The copies share the image file with a new reference when
+        share_image and the storage counts references, get a copy of it
+        otherwise. Returns [(recipe id, copy id)] in the order given
+        """
+        from core import recommendations
+
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        through = {
+            name: quote(self.model._meta.get_field(name)
+                        .remote_field.through._meta.db_table)
+            for name in ('tags', 'ingredients')
+        }
+        sql = self.DUPLICATE_SQL.format(
+            recipe=quote(self.model._meta.db_table),
+            recipe_tags=through['tags'],
+            recipe_ingredients=through['ingredients'],
+        )
+        with transaction.atomic(using=self.db):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, {
+                    'table': quote(self.model._meta.db_table),
+                    'ids': list(dict.fromkeys(recipe_ids)),
+                    'user_id': user.pk,
+                    'title': title,
+                })
+                rows = cursor.fetchall()
+            if not rows:
+                return []
+
+            self._copy_images(rows, share_image)
+            copy_ids = [row[1] for row in rows]
+            # raw inserts don't send signals, count and record them here
+            UserStats.objects.add_recipes(
+                user.pk, [row[3:] for row in rows]
+            )
+            Change.objects.record(self.model, Change.CREATED, user.pk,
+                                  copy_ids)
+            recommendations.update_on_commit(user.pk, copy_ids)
+        return [(row[0], row[1]) for row in rows]
+
+    def _copy_images(self, rows, share_image):
+        storage = self.model._meta.get_field('image').storage
+        images = [(row[1], row[2]) for row in rows if row[2]]
+        if share_image and hasattr(storage, 'share'):
+            for image, count in Counter(image for _, image in images).items():
+                storage.share(image, count)
+            return
+        field = self.model._meta.get_field('image')
+        for copy_id, image in images:
+            with storage.open(image) as content:
+                name = storage.save(
+                    field.generate_filename(None, os.path.basename(image)),
+                    content
+                )
+            if name != image:
+                self.filter(pk=copy_id).update(image=name)
+
+
 class Recipe(models.Model):
     """
         Recipe models
@@ -104,12 +291,612 @@ class Recipe(models.Model):
     )
     title = models.CharField(max_length=255)
     time_minutes = models.IntegerField()
-    # price = models.FloatField(max_digits=5, decimal_places=2)
-    price = models.FloatField(max_length=5)
+    price = models.DecimalField(max_digits=8, decimal_places=2)
     link = models.CharField(max_length=255, blank=True)
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=get_recipe_image_file_path)
+    image = models.ImageField(null=True, upload_to=get_recipe_image_file_path,
+                              storage=recipe_image_storage)
+
+    objects = RecipeManager()
+
+    class Meta:
+        # match the orderings of the recipe list, so filtered and sorted
+        # pages are read from an index scan
+        indexes = [
+            models.Index(fields=['user', 'price', 'id'],
+                         name='core_recipe_user_price_idx'),
+            models.Index(fields=['user', 'time_minutes', 'id'],
+                         name='core_recipe_user_time_idx'),
+            models.Index(fields=['user', 'title', 'id'],
+                         name='core_recipe_user_title_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class UserStatsManager(models.Manager):
+    """
+    Manager to recompute the denormalized user stats from the source tables
+    """
+    REBUILD_SQL = """
+        INSERT INTO {stats} (
+            user_id, recipe_count, tag_count, ingredient_count,
+            time_minutes_total, price_min, price_max, tag_usage
+        )
+        SELECT
+            u.id,
+            COALESCE(recipes.recipe_count, 0),
+            COALESCE(tags.tag_count, 0),
+            COALESCE(ingredients.ingredient_count, 0),
+            COALESCE(recipes.time_minutes_total, 0),
+            recipes.price_min,
+            recipes.price_max,
+            COALESCE(usage.tag_usage, '{{}}'::jsonb)
+        FROM {user} u
+        LEFT JOIN (
+            SELECT user_id,
+                   COUNT(*) AS recipe_count,
+                   SUM(time_minutes) AS time_minutes_total,
+                   MIN(price) AS price_min,
+                   MAX(price) AS price_max
+            FROM {recipe} GROUP BY user_id
+        ) recipes ON recipes.user_id = u.id
+        LEFT JOIN (
+            SELECT user_id, COUNT(*) AS tag_count FROM {tag} GROUP BY user_id
+        ) tags ON tags.user_id = u.id
+        LEFT JOIN (
+            SELECT user_id, COUNT(*) AS ingredient_count
+            FROM {ingredient} GROUP BY user_id
+        ) ingredients ON ingredients.user_id = u.id
+        LEFT JOIN (
+            SELECT tag.user_id,
+                   jsonb_object_agg(tag.id, assigned.recipes) AS tag_usage
+            FROM {tag} tag
+            JOIN (
+                SELECT tag_id, COUNT(*) AS recipes
+                FROM {recipe_tags} GROUP BY tag_id
+            ) assigned ON assigned.tag_id = tag.id
+            GROUP BY tag.user_id
+        ) usage ON usage.user_id = u.id
+        {where}
+        ON CONFLICT (user_id) DO UPDATE SET
+            recipe_count = EXCLUDED.recipe_count,
+            tag_count = EXCLUDED.tag_count,
+            ingredient_count = EXCLUDED.ingredient_count,
+            time_minutes_total = EXCLUDED.time_minutes_total,
+            price_min = EXCLUDED.price_min,
+            price_max = EXCLUDED.price_max,
+            tag_usage = EXCLUDED.tag_usage
+    """
+
+    def rebuild(self, user_ids=None):
+        """
+        Recomputes the stats of the given users (all when None) with one set
+        based statement. Returns the number of rows written
+        """
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        where = ''
+        params = []
+        if user_ids is not None:
+            where = 'WHERE u.id = ANY(%s)'
+            params.append(list(user_ids))
+        sql = self.REBUILD_SQL.format(
+            stats=quote(self.model._meta.db_table),
+            user=quote(User._meta.db_table),
+            recipe=quote(Recipe._meta.db_table),
+            tag=quote(Tag._meta.db_table),
+            ingredient=quote(Ingredient._meta.db_table),
+            recipe_tags=quote(Recipe.tags.through._meta.db_table),
+            where=where,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def add_recipes(self, user_id, recipes):
+        """
+        Counts recipes written without the signals, [(time minutes, price,
+        tag ids)], into the user's stats row locked like the signals do
+        """
+        if not recipes:
+            return
+        with transaction.atomic(using=self.db):
+            stats = self.select_for_update().filter(user_id=user_id).first()
+            if stats is None:
+                return
+            stats.recipe_count += len(recipes)
+            stats.time_minutes_total += sum(minutes
+                                            for minutes, _, _ in recipes)
+            prices = [price for _, price, _ in recipes]
+            stats.price_min = min(
+                prices + [stats.price_min] if stats.price_min is not None
+                else prices
+            )
+            stats.price_max = max(
+                prices + [stats.price_max] if stats.price_max is not None
+                else prices
+            )
+            usage = Counter(tag_id for _, _, tag_ids in recipes
+                            for tag_id in tag_ids)
+            for tag_id, count in usage.items():
+                key = str(tag_id)
+                stats.tag_usage[key] = stats.tag_usage.get(key, 0) + count
+            stats.save()
+
+
+class UserStats(models.Model):
+    """
+        Denormalized per user counters, maintained by the signal handlers in
+        core.signals and repaired with the rebuild_stats command
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    recipe_count = models.PositiveIntegerField(default=0)
+    tag_count = models.PositiveIntegerField(default=0)
+    ingredient_count = models.PositiveIntegerField(default=0)
+    time_minutes_total = models.BigIntegerField(default=0)
+    price_min = models.DecimalField(max_digits=8, decimal_places=2,
+                                    null=True)
+    price_max = models.DecimalField(max_digits=8, decimal_places=2,
+                                    null=True)
+    # {tag id: number of recipes using the tag}
+    tag_usage = JSONField(default=dict)
+
+    objects = UserStatsManager()
+
+    @property
+    def time_minutes_avg(self):
+        """
+            average preparation time of the user's recipes
+        """
+        if not self.recipe_count:
+            return None
+        return self.time_minutes_total / self.recipe_count
+
+
+class StoredFileManager(models.Manager):
+    """
+    Reference counts of the files of the content addressed storages, a file
+    shared by many objects is stored once and deleted with its last reference
+    """
+    ACQUIRE_SQL = """
+        INSERT INTO {table} (name, size, refcount) VALUES (%s, %s, 1)
+        ON CONFLICT (name) DO UPDATE SET refcount = {table}.refcount + 1
+        RETURNING refcount
+    """
+    RELEASE_SQL = """
+        UPDATE {table} SET refcount = GREATEST(refcount - %s, 0)
+        WHERE name = %s
+        RETURNING refcount
+    """
+    SHARE_SQL = """
+        UPDATE {table} SET refcount = refcount + %s
+        WHERE name = %s
+        RETURNING refcount
+    """
+
+    def _execute(self, sql, params):
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql.format(
+                    table=connection.ops.quote_name(self.model._meta.db_table)
+                ),
+                params
+            )
+            return cursor.fetchone()
+
+    def acquire(self, name, size):
+        """
+        Adds a reference to the file, returns True if it is the only one
+        """
+        refcount, = self._execute(self.ACQUIRE_SQL, [name, size])
+        return refcount == 1
+
+    def share(self, name, count, size):
+        """
+        Adds count references to a stored file, for objects reusing it.
+        A file stored before the references were counted gets its row,
+        with its one reference, of the given size (a callable)
+        """
+        if self._execute(self.SHARE_SQL, [count, name]) is None:
+            self._execute(self.ACQUIRE_SQL, [name, size()])
+            self._execute(self.SHARE_SQL, [count, name])
+
+    def release(self, name, count=1):
+        """
+        Drops count references to the file, returns True if none is left
+        """
+        with transaction.atomic(using=self.db):
+            row = self._execute(self.RELEASE_SQL, [count, name])
+            if row is None:
+                # not counted, stored before the content addressed storage
+                return True
+            if row[0] > 0:
+                return False
+            self.filter(name=name).delete()
+            return True
+
+
+class StoredFile(models.Model):
+    """
+        A file of a content addressed storage and the number of references
+        to it
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+
+    objects = StoredFileManager()
+
+    def __str__(self):
+        return self.name
+
+
+class ChangeManager(models.Manager):
+    """
+    Outbox of the changes to recipes, tags and ingredients.
+
+    Entries are written in the transaction of the change and numbered
+    later: a sequence value taken while writing would let a transaction
+    commit with a lower number than one a consumer already read. sequence()
+    numbers the entries of the transactions older than any still running,
+    ordered by transaction, so the numbers of the feed only ever grow
+    """
+    SEQUENCE = 'core_change_feed_seq'
+    # any constant, it serializes the numbering
+    SEQUENCE_LOCK = 0x6368616e
+
+    RECORD_SQL = """
+        INSERT INTO {table} (txid, model, action, object_id, user_id, created)
+        SELECT txid_current(), %s, %s, object_id, %s, now()
+        FROM UNNEST(%s::integer[]) AS object_id
+    """
+    SEQUENCE_SQL = """
+        WITH pending AS (
+            SELECT id, nextval(%(sequence)s) AS seq
+            FROM {table}
+            WHERE seq IS NULL
+                AND txid < txid_snapshot_xmin(txid_current_snapshot())
+            ORDER BY txid, id
+            LIMIT %(limit)s
+        )
+        UPDATE {table} SET seq = pending.seq
+        FROM pending WHERE {table}.id = pending.id
+    """
+    # an entry followed by a later one of the same object tells nothing more
+    COMPACT_SQL = """
+        DELETE FROM {table} old
+        USING {table} newer
+        WHERE newer.model = old.model AND newer.object_id = old.object_id
+            AND old.seq IS NOT NULL AND newer.seq > old.seq
+    """
+
+    @property
+    def write_db(self):
+        """
+        The database written to, the primary even inside replica_reads()
+        """
+        return self._db or router.db_for_write(self.model)
+
+    def _execute(self, sql, params):
+        connection = connections[self.write_db]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql.format(
+                    table=connection.ops.quote_name(self.model._meta.db_table)
+                ),
+                params
+            )
+            return cursor.rowcount
+
+    def record(self, model, action, user_id, object_ids):
+        """
+        Adds an entry for every object of the model changed by the action
+        """
+        # imported here, it brings DRF in with it and the models are loaded
+        # by every process, the API ones import it anyway
+        from core import compression
+
+        object_ids = list(object_ids)
+        if object_ids:
+            self._execute(self.RECORD_SQL, [
+                model._meta.model_name, action, user_id, object_ids
+            ])
+            compression.invalidate(user_id)
+
+    def sequence(self, limit=10000):
+        """
+        Numbers up to `limit` committed entries, returns how many
+        """
+        with transaction.atomic(using=self.write_db):
+            with connections[self.write_db].cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)',
+                               [self.SEQUENCE_LOCK])
+            return self._execute(self.SEQUENCE_SQL, {
+                'sequence': self.SEQUENCE, 'limit': limit
+            })
+
+    def since(self, seq, limit, user_id=None):
+        """
+        Returns the entries numbered after seq, at most `limit`, only the
+        ones of the user if given
+        """
+        self.sequence()
+        entries = self.filter(seq__gt=seq)
+        if user_id is not None:
+            entries = entries.filter(user_id=user_id)
+        return entries.order_by('seq')[:limit]
+
+    def head(self):
+        """
+        Returns the number of the last entry, 0 if there is none
+        """
+        self.sequence()
+        return self.aggregate(seq=models.Max('seq'))['seq'] or 0
+
+    def current_txid(self):
+        """
+        Returns the id of the current transaction, the txid of its entries
+        """
+        with connections[self.write_db].cursor() as cursor:
+            cursor.execute('SELECT txid_current()')
+            return cursor.fetchone()[0]
+
+    def changed_since(self, model, object_id, seq, own_txids=()):
+        """
+        Returns whether the object changed after the entry numbered seq,
+        committed entries not numbered yet included, the entries of the
+        current transaction and of the own_txids excluded
+        """
+        return self.filter(
+            models.Q(seq__gt=seq) | models.Q(seq=None),
+            model=model._meta.model_name,
+            object_id=object_id,
+        ).exclude(txid=RawSQL('txid_current()', [])).exclude(
+            txid__in=own_txids
+        ).exists()
+
+    def compact(self):
+        """
+        Deletes the entries superseded by a later entry of the same object,
+        returns how many
+        """
+        return self._execute(self.COMPACT_SQL, [])
+
+
+class Change(models.Model):
+    """
+        Outbox entry of a recipe, tag or ingredient created, updated or
+        deleted. M2M changes are updates of the recipe
+    """
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    ACTIONS = (
+        (CREATED, 'Created'),
+        (UPDATED, 'Updated'),
+        (DELETED, 'Deleted'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    # position in the feed, null until numbered by ChangeManager.sequence()
+    seq = models.BigIntegerField(null=True, unique=True)
+    txid = models.BigIntegerField()
+    model = models.CharField(max_length=20)
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    object_id = models.IntegerField()
+    # kept after the user is deleted, consumers need the deletions
+    user_id = models.IntegerField()
+    created = models.DateTimeField()
+
+    objects = ChangeManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['txid', 'id'], name='core_change_pending_idx',
+                         condition=models.Q(seq=None)),
+            models.Index(fields=['model', 'object_id'],
+                         name='core_change_object_idx'),
+            models.Index(fields=['user_id', 'seq'],
+                         name='core_change_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.seq} {self.model} {self.object_id} {self.action}'
+
+
+class AccountDeletion(models.Model):
+    """
+        A requested deletion of a user account and its progress, carried out
+        in batches by its delete_account job, see core.accounts
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    # kept after the user is deleted
+    user_id = models.IntegerField(unique=True)
+    status = models.CharField(max_length=10, choices=STATUSES,
+                              default=PENDING)
+    # counted when the deletion starts
+    recipes_total = models.PositiveIntegerField(null=True)
+    tags_total = models.PositiveIntegerField(null=True)
+    ingredients_total = models.PositiveIntegerField(null=True)
+    recipes_deleted = models.PositiveIntegerField(default=0)
+    tags_deleted = models.PositiveIntegerField(default=0)
+    ingredients_deleted = models.PositiveIntegerField(default=0)
+    images_released = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    requested = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True)
+
+    @property
+    def progress(self):
+        """
+            share of the recipes, tags and ingredients deleted so far
+        """
+        if self.status == self.DONE:
+            return 1.0
+        if self.recipes_total is None:
+            return 0.0
+        total = self.recipes_total + self.tags_total + \
+            self.ingredients_total
+        deleted = self.recipes_deleted + self.tags_deleted + \
+            self.ingredients_deleted
+        return min(deleted / total, 1.0) if total else 0.0
+
+    def __str__(self):
+        return f'{self.user_id} {self.status}'
+
+
+class JobManager(models.Manager):
+    """
+    Queue of the background jobs, see core.jobs. Workers claim due jobs
+    with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers never
+    claim the same job nor wait for each other
+    """
+    NOTIFY_CHANNEL = 'core_job'
+
+    CLAIM_SQL = """
+        UPDATE {table} SET status = %(running)s, attempts = attempts + 1,
+                           worker = %(worker)s,
+                           started = statement_timestamp()
+        WHERE id IN (
+            SELECT id FROM {table}
+            WHERE status = %(queued)s AND run_at <= statement_timestamp()
+            ORDER BY run_at, id
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id
+    """
+    # jobs of workers that died while running them, failed once they used
+    # up their attempts
+    REQUEUE_SQL = """
+        UPDATE {table} SET status = %(queued)s, worker = ''
+        WHERE status = %(running)s
+            AND started < statement_timestamp() - %(timeout)s
+            AND attempts < max_attempts
+    """
+    FAIL_STALE_SQL = """
+        UPDATE {table} SET status = %(failed)s, worker = '',
+                           error = %(error)s,
+                           finished = statement_timestamp()
+        WHERE status = %(running)s
+            AND started < statement_timestamp() - %(timeout)s
+            AND attempts >= max_attempts
+    """
+
+    def _execute(self, sql, params):
+        connection = connections[self.db]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql.format(
+                    table=connection.ops.quote_name(self.model._meta.db_table)
+                ),
+                params
+            )
+            return cursor.fetchall() if cursor.description else \
+                cursor.rowcount
+
+    def enqueue(self, name, args=None, user_id=None, run_at=None,
+                max_attempts=None):
+        """
+        Queues a job in the current transaction, workers see it once
+        committed and are woken up then
+        """
+        job = self.create(
+            name=name, args=args or {}, user_id=user_id,
+            run_at=run_at or timezone.now(),
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        )
+        with connections[self.db].cursor() as cursor:
+            # delivered on commit
+            cursor.execute('SELECT pg_notify(%s, %s)',
+                           [self.NOTIFY_CHANNEL, name])
+        return job
+
+    def claim(self, worker, limit):
+        """
+        Marks up to limit due jobs as run by the worker, returns them
+        """
+        rows = self._execute(self.CLAIM_SQL, {
+            'running': self.model.RUNNING, 'queued': self.model.QUEUED,
+            'worker': worker, 'limit': limit,
+        })
+        return list(self.filter(pk__in=[pk for pk, in rows]).order_by('id'))
+
+    def requeue_stale(self, timeout):
+        """
+        Queues again the jobs running for longer than timeout, a timedelta,
+        the ones without attempts left fail. Returns the numbers of both
+        """
+        params = {
+            'queued': self.model.QUEUED, 'running': self.model.RUNNING,
+            'failed': self.model.FAILED, 'timeout': timeout,
+            'error': f'Ran for longer than {timeout} on its last attempt',
+        }
+        return (self._execute(self.REQUEUE_SQL, params),
+                self._execute(self.FAIL_STALE_SQL, params))
+
+
+class Job(models.Model):
+    """
+        A background job: the name of a task of core.jobs, its arguments
+        and the outcome of its attempts
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=50)
+    args = JSONField(default=dict)
+    # the user it is run for, kept after the user is deleted
+    user_id = models.IntegerField(null=True)
+    status = models.CharField(max_length=10, choices=STATUSES,
+                              default=QUEUED)
+    # not run before, pushed back by the retries
+    run_at = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField()
+    worker = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    result = JSONField(null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    objects = JobManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_at', 'id'], name='core_job_queued_idx',
+                         condition=models.Q(status='queued')),
+            models.Index(fields=['user_id', 'id'], name='core_job_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.id} {self.name} {self.status}'
@@ -0,0 +1,176 @@
+"""
+Hash partitioning of the recipe tables.
+
+With RECIPE_PARTITIONS set, migration 0016 turns the recipe table into a
+table partitioned by HASH (user_id) and the tag and ingredient through
+tables into tables partitioned by HASH (recipe_id), each split into that
+many partitions (core_recipe_p0, core_recipe_p1, ...). The recipe API
+always filters on the user and prefetches the M2M rows by recipe ids, so
+the planner only reads the partitions holding the rows asked for, and
+vacuum and index maintenance work on partitions a fraction of the size.
+
+PostgreSQL requires the partition key in every unique constraint: the
+primary key of the recipe table becomes (id, user_id), the ids still come
+from the same sequence. The through tables can't be keyed by the user as
+Django inserts their rows with the recipe and the tag or ingredient only,
+and no foreign key can reference the recipe ids alone anymore: the through
+rows rely on Django deleting them with their recipe, as it already does.
+
+Needs PostgreSQL 11 or later. Indexes of partitioned tables can't be
+created CONCURRENTLY, later index migrations of these tables lock them.
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+
+MIN_VERSION = 110000
+
+RELKIND_SQL = "SELECT relkind FROM pg_class WHERE oid = %s::regclass"
+
+# foreign keys and unique constraints, the primary key is rebuilt apart
+CONSTRAINTS_SQL = """
+    SELECT conname, pg_get_constraintdef(oid)
+    FROM pg_constraint
+    WHERE conrelid = %s::regclass AND contype IN ('f', 'u')
+    ORDER BY conname
+"""
+
+REFERENCES_SQL = """
+    SELECT conrelid::regclass::text, conname
+    FROM pg_constraint
+    WHERE confrelid = %s::regclass AND contype = 'f'
+"""
+
+# the indexes that don't back a constraint
+INDEXES_SQL = """
+    SELECT indexdef
+    FROM pg_indexes
+    WHERE schemaname = current_schema() AND tablename = %s
+        AND indexname NOT IN (
+            SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass
+        )
+    ORDER BY indexname
+"""
+
+
+def partition_keys(recipe_model):
+    """
+    Returns {table: partition key column} of the recipe tables
+    """
+    recipe_table = recipe_model._meta.db_table
+    keys = {recipe_table: recipe_model._meta.get_field('user').column}
+    for name in ('tags', 'ingredients'):
+        field = recipe_model._meta.get_field(name)
+        keys[field.m2m_db_table()] = field.m2m_column_name()
+    return keys
+
+
+def is_partitioned(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(RELKIND_SQL, [table])
+        return cursor.fetchone()[0] == 'p'
+
+
+def _rebuild(schema_editor, table, primary_key, key=None, partitions=0):
+    """
+    Replaces the table by a copy with the same rows, indexes and
+    constraints, partitioned by HASH (key) if a key is given
+    """
+    quote = schema_editor.quote_name
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CONSTRAINTS_SQL, [table])
+        constraints = cursor.fetchall()
+        cursor.execute(INDEXES_SQL, [table, table])
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+
+    new_table = quote(f'{table}__new')
+    layout = f' PARTITION BY HASH ({quote(key)})' if key else ''
+    schema_editor.execute(
+        f'CREATE TABLE {new_table} (LIKE {quote(table)} INCLUDING DEFAULTS '
+        f'INCLUDING CONSTRAINTS){layout}'
+    )
+    for remainder in range(partitions):
+        schema_editor.execute(
+            f'CREATE TABLE {quote(f"{table}_p{remainder}")} PARTITION OF '
+            f'{new_table} FOR VALUES WITH (MODULUS {partitions}, '
+            f'REMAINDER {remainder})'
+        )
+    schema_editor.execute(
+        f'INSERT INTO {new_table} SELECT * FROM {quote(table)}'
+    )
+    # the sequence would be dropped with the table owning it
+    schema_editor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+    schema_editor.execute(f'DROP TABLE {quote(table)}')
+    schema_editor.execute(
+        f'ALTER TABLE {new_table} RENAME TO {quote(table)}'
+    )
+    schema_editor.execute(
+        f'ALTER SEQUENCE {sequence} OWNED BY {quote(table)}.{quote("id")}'
+    )
+    schema_editor.execute(
+        f'ALTER TABLE {quote(table)} ADD CONSTRAINT '
+        f'{quote(f"{table}_pkey")} PRIMARY KEY '
+        f'({", ".join(quote(column) for column in primary_key)})'
+    )
+    for name, definition in constraints:
+        schema_editor.execute(
+            f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} '
+            f'{definition}'
+        )
+    # the definitions name the table, which has the same name again
+    for definition in indexes:
+        schema_editor.execute(definition)
+    schema_editor.execute(f'ANALYZE {quote(table)}')
+
+
+def partition_recipes(schema_editor, recipe_model, partitions):
+    """
+    Splits the recipe tables into `partitions` hash partitions, does
+    nothing if they are partitioned already
+    """
+    connection = schema_editor.connection
+    if connection.pg_version < MIN_VERSION:
+        raise ImproperlyConfigured(
+            'Partitioning the recipe tables needs PostgreSQL 11 or later'
+        )
+    keys = partition_keys(recipe_model)
+    recipe_table = recipe_model._meta.db_table
+    if is_partitioned(connection, recipe_table):
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(REFERENCES_SQL, [recipe_table])
+        references = cursor.fetchall()
+    # the tables can't be altered with deferred checks pending
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    for table, name in references:
+        schema_editor.execute(
+            f'ALTER TABLE {table} DROP CONSTRAINT '
+            f'{schema_editor.quote_name(name)}'
+        )
+
+    for table, key in keys.items():
+        _rebuild(schema_editor, table, ['id', key], key, partitions)
+
+
+def unpartition_recipes(schema_editor, recipe_model):
+    """
+    Turns the partitioned recipe tables back into plain tables with their
+    foreign keys to the recipes, does nothing if they aren't partitioned
+    """
+    connection = schema_editor.connection
+    recipe_table = recipe_model._meta.db_table
+    if not is_partitioned(connection, recipe_table):
+        return
+
+    schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    for table in partition_keys(recipe_model):
+        _rebuild(schema_editor, table, ['id'])
+
+    for name in ('tags', 'ingredients'):
+        through = recipe_model._meta.get_field(name).remote_field.through
+        field = through._meta.get_field(recipe_model._meta.model_name)
+        schema_editor.execute(schema_editor._create_fk_sql(
+            through, field, '_fk_%(to_table)s_%(to_column)s'
+        ))
@@ -0,0 +1,19 @@
+"""
+Set up of the worker processes of core.jobs. Imported by the processes
+before Django is set up, so it must not import models at module level
+"""
+
+
+def setup(databases):
+    """
+    Sets Django up in a new process, connecting to the databases of the
+    parent, {alias: name}. Aliases the settings don't define, like the
+    test replica of core.test_runner, aren't connected to
+    """
+    import django
+    from django.db import connections
+
+    django.setup()
+    for alias, name in databases.items():
+        if alias in connections.databases:
+            connections[alias].settings_dict['NAME'] = name
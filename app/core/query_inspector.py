@@ -0,0 +1,207 @@
+"""
+N+1 and slow query detection.
+
+Executed SQL is grouped by its shape, the statement with literals and
+placeholder lists normalized away, so the per-row queries issued while
+serializing a list show up as one shape executed many times. The first
+execution of every shape keeps the application stack that issued it.
+
+Every execution is timed too: the ones taking longer than the slow
+threshold are kept with their SQL, duration and application stack.
+
+Used by QueryInspectorTestMixin to fail tests and by
+QueryInspectorMiddleware to log query explosions and slow queries on
+staging.
+"""
+import logging
+import os
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 5
+DEFAULT_SLOW_MS = 100
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:(?:%s|\?)\s*,\s*)*(?:%s|\?)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """
+    Returns the shape of a statement: literals and placeholders become ?
+    and IN lists of any length collapse to (...)
+    """
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(...)', shape.replace('%s', '?'))
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def _application_stack():
+    """
+    Returns the frames of the project's own code, innermost last
+    """
+    base_dir = settings.BASE_DIR + os.sep
+    return [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir) and
+        'site-packages' not in frame.filename and
+        frame.filename != __file__
+    ]
+
+
+class RepeatedQuery:
+    """
+    A statement shape executed more times than the threshold
+    """
+    def __init__(self, shape, count, stack):
+        self.shape = shape
+        self.count = count
+        self.stack = stack
+
+    def __str__(self):
+        location = ''.join(traceback.format_list(self.stack[-5:]))
+        return f'{self.count}x {self.shape}\n{location}'
+
+
+class SlowQuery:
+    """
+    A statement taking longer than the slow threshold
+    """
+    def __init__(self, sql, duration_ms, stack):
+        self.sql = sql
+        self.duration_ms = duration_ms
+        self.stack = stack
+
+    def __str__(self):
+        location = ''.join(traceback.format_list(self.stack[-5:]))
+        return f'{self.duration_ms:.1f} ms {self.sql}\n{location}'
+
+
+class QueryInspector:
+    """
+    Database execute wrapper grouping the executed statements by shape and
+    keeping the ones slower than slow_ms
+    """
+    def __init__(self, slow_ms=DEFAULT_SLOW_MS):
+        self.shapes = {}
+        self.slow_ms = slow_ms
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = normalize_sql(sql)
+        seen = self.shapes.get(shape)
+        if seen is None:
+            self.shapes[shape] = [1, _application_stack()]
+        else:
+            seen[0] += 1
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if duration_ms > self.slow_ms:
+                self.slow.append(
+                    SlowQuery(sql, duration_ms, _application_stack())
+                )
+
+    @property
+    def query_count(self):
+        return sum(count for count, _ in self.shapes.values())
+
+    def repeated(self, threshold=DEFAULT_THRESHOLD):
+        """
+        Returns the shapes executed more than `threshold` times, most
+        repeated first
+        """
+        found = [
+            RepeatedQuery(shape, count, stack)
+            for shape, (count, stack) in self.shapes.items()
+            if count > threshold
+        ]
+        return sorted(found, key=lambda query: -query.count)
+
+    def slowest(self):
+        """
+        Returns the queries slower than slow_ms, slowest first
+        """
+        return sorted(self.slow, key=lambda query: -query.duration_ms)
+
+
+@contextmanager
+def inspect_queries(slow_ms=DEFAULT_SLOW_MS):
+    """
+    Yields a QueryInspector recording the queries of every connection
+    """
+    inspector = QueryInspector(slow_ms)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(inspector))
+        yield inspector
+
+
+class QueryInspectorTestMixin:
+    """
+    TestCase mixin failing on N+1 query patterns:
+
+        with self.assertNoNPlusOne():
+            self.client.get(RECIPE_URL)
+    """
+    nplusone_threshold = 3
+
+    @contextmanager
+    def assertNoNPlusOne(self, threshold=None):
+        threshold = self.nplusone_threshold if threshold is None \
+            else threshold
+        with inspect_queries() as inspector:
+            yield inspector
+        repeated = inspector.repeated(threshold)
+        if repeated:
+            self.fail(
+                'N+1 queries detected:\n' +
+                '\n'.join(str(query) for query in repeated)
+            )
+
+
+class QueryInspectorMiddleware:
+    """
+    Logs a warning for every request repeating a statement shape more than
+    QUERY_INSPECTOR_THRESHOLD times, and for every query of a request taking
+    longer than QUERY_INSPECTOR_SLOW_MS. Only enabled with
+    QUERY_INSPECTOR_ENABLED, meant for staging
+    """
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSPECTOR_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(
+            settings, 'QUERY_INSPECTOR_THRESHOLD', DEFAULT_THRESHOLD
+        )
+        self.slow_ms = getattr(
+            settings, 'QUERY_INSPECTOR_SLOW_MS', DEFAULT_SLOW_MS
+        )
+
+    def __call__(self, request):
+        with inspect_queries(self.slow_ms) as inspector:
+            response = self.get_response(request)
+        for query in inspector.repeated(self.threshold):
+            logger.warning(
+                'N+1 queries on %s %s: %s',
+                request.method, request.path, query
+            )
+        for query in inspector.slowest():
+            logger.warning(
+                'Slow query on %s %s: %s',
+                request.method, request.path, query
+            )
+        return response
@@ -0,0 +1,200 @@
+"""
+Token bucket rate limiting of the API.
+
+Every client has a bucket per scope: 'read' for the safe methods, 'write'
+for the others and 'upload' for the views or actions with that
+throttle_scope. A bucket holds as many requests as the scope's rate of
+DEFAULT_THROTTLE_RATES allows per period ('600/min' holds 600 requests and
+refills one every 0.1s). Clients are told apart by their token, or by their
+user without one, anonymous clients by their IP address, NUM_PROXIES
+deciding which X-Forwarded-For entry is theirs as for the DRF throttles.
+
+A bucket is kept as the time it will be full again (the GCRA form of the
+token bucket), so taking a token is one lookup, some arithmetic and one
+store. LocalBuckets keeps them in the process, every process having its own
+budget. CacheBuckets keeps them in the default cache, shared between the
+processes, but without a lock: concurrent requests of a client may take a
+token from the same state and let a few more requests through.
+RATE_LIMIT_STORE picks one.
+
+Rejected requests get a 429 with Retry-After from DRF, every throttled
+response the RateLimit-Limit, RateLimit-Remaining, RateLimit-Reset and
+RateLimit-Policy headers of its bucket, see add_headers().
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+READ = 'read'
+WRITE = 'write'
+UPLOAD = 'upload'
+
+BUCKET_KEY = 'rate-limit:{}'
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_rates = {}
+
+
+def parse_rate(rate):
+    """
+    Returns (requests, period seconds) of a DRF rate like '600/min'
+    """
+    parsed = _rates.get(rate)
+    if parsed is None:
+        requests, period = rate.split('/')
+        parsed = _rates[rate] = (int(requests), PERIODS[period[0]])
+    return parsed
+
+
+def _take(full_at, now, interval, capacity):
+    """
+    Takes a token from a bucket full at full_at, refilled every interval
+    seconds. Returns (new full_at or None if empty, remaining tokens,
+    seconds to wait for a token)
+    """
+    full_at = max(full_at or now, now) + interval
+    excess = full_at - now - interval * capacity
+    if excess > 0:
+        return None, 0, excess
+    return full_at, int(-excess / interval), 0.0
+
+
+class LocalBuckets:
+    """
+    The buckets of this process. Buckets that filled up again are dropped
+    every SWEEP_EVERY takes, memory follows the number of active clients
+    """
+    SWEEP_EVERY = 1024
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._full_at = {}
+        self._takes = 0
+
+    def take(self, key, interval, capacity):
+        """
+        Returns (allowed, remaining tokens, seconds until full, seconds to
+        wait for a token)
+        """
+        now = self.clock()
+        with self._lock:
+            full_at, remaining, wait = _take(self._full_at.get(key), now,
+                                             interval, capacity)
+            if full_at is None:
+                return False, remaining, self._full_at[key] - now, wait
+            self._full_at[key] = full_at
+            self._takes += 1
+            if self._takes % self.SWEEP_EVERY == 0:
+                self._sweep(now)
+        return True, remaining, full_at - now, wait
+
+    def _sweep(self, now):
+        self._full_at = {
+            key: full_at for key, full_at in self._full_at.items()
+            if full_at > now
+        }
+
+    def clear(self):
+        with self._lock:
+            self._full_at = {}
+
+
+class CacheBuckets:
+    """
+    The buckets in the default cache, expiring once full again. The wall
+    clock is the one the processes share
+    """
+    clock = staticmethod(time.time)
+
+    def take(self, key, interval, capacity):
+        now = self.clock()
+        key = BUCKET_KEY.format(key)
+        previous = cache.get(key)
+        full_at, remaining, wait = _take(previous, now, interval, capacity)
+        if full_at is None:
+            return False, remaining, previous - now, wait
+        cache.set(key, full_at, math.ceil(full_at - now))
+        return True, remaining, full_at - now, wait
+
+
+local_buckets = LocalBuckets()
+cache_buckets = CacheBuckets()
+
+
+def buckets():
+    return cache_buckets if settings.RATE_LIMIT_STORE == 'cache' \
+        else local_buckets
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles the requests of a client per scope, see the module docstring
+    """
+    def get_scope(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        return READ if request.method in SAFE_METHODS else WRITE
+
+    def get_client(self, request):
+        key = getattr(request.auth, 'key', None)
+        if key:
+            return f'token:{key}'
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+
+        capacity, period = parse_rate(rate)
+        allowed, remaining, reset, wait = buckets().take(
+            f'{scope}:{self.get_client(request)}', period / capacity,
+            capacity
+        )
+        # on the Django request, the one the response headers are added from
+        request._request.rate_limit = (capacity, remaining, reset, period)
+        self.wait_seconds = wait
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def add_headers(request, response):
+    """
+    Adds the RateLimit headers of the request's bucket to the response
+    """
+    rate_limit = getattr(request, 'rate_limit', None)
+    if rate_limit is not None:
+        limit, remaining, reset, period = rate_limit
+        response['RateLimit-Limit'] = str(limit)
+        response['RateLimit-Remaining'] = str(remaining)
+        response['RateLimit-Reset'] = str(math.ceil(reset))
+        response['RateLimit-Policy'] = f'{limit};w={period}'
+    return response
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Adds the RateLimit headers to the responses of the Django stack
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return add_headers(request, response)
@@ -0,0 +1,293 @@
+"""
+"Recipes like this one" from the tags and ingredients of a user's recipes.
+
+The recipes of a user are the rows of a sparse binary incidence matrix
+whose columns are the tags and then the ingredients they use. Two recipes
+are as similar as the Jaccard index (shared over combined tags and
+ingredients) or the cosine of their rows, RECOMMENDATIONS_METRIC, computed
+for many rows at once as one sparse matrix product, which only scores the
+recipes sharing something.
+
+The RECOMMENDATIONS_TOP_K nearest neighbors of every recipe of a user, at
+most MAX_TOP_K, are cached as [(neighbor id, score), ...] under a key per
+recipe, so an entry stays small whatever the number of recipes. They are
+built in one go by the first request of the user, a recipe whose entry is
+evicted later gets its own computed again. The keys carry a version of the
+user's neighbors, dropping it drops them all. M2M changes update the cached
+neighbors once committed instead of rebuilding them, see update(). Updates
+are read-modify-write of the cache entries, one lost to a concurrent update
+leaves neighbors stale for RECOMMENDATIONS_CACHE_SECONDS at most. The
+updates only reach the other processes through a shared cache, see
+settings.SHARED_CACHE.
+
+numpy and scipy are imported by the functions computing with them: this
+module is imported with the models, by core.signals, and most processes
+never compute neighbors.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.models import Recipe
+
+
+JACCARD = 'jaccard'
+COSINE = 'cosine'
+METRICS = (JACCARD, COSINE)
+
+# user id, version, recipe id
+NEIGHBORS_KEY = 'recipe-neighbors:{}:{}:{}'
+VERSION_KEY = 'recipe-neighbors-version:{}'
+
+# neighbors kept per recipe whatever RECOMMENDATIONS_TOP_K says, keeps
+# every entry far below the 1 MB items of memcached
+MAX_TOP_K = 100
+
+# rows multiplied at once when building, bounds the memory of the product
+BLOCK_SIZE = 1024
+# more recipes changed at once are rebuilt on the next request instead
+MAX_UPDATED = 64
+
+
+def top_k():
+    return min(settings.RECOMMENDATIONS_TOP_K, MAX_TOP_K)
+
+
+def _keys(user_id, version, recipe_ids):
+    """
+    Returns {cache key: recipe id} of the neighbors of the recipes
+    """
+    return {NEIGHBORS_KEY.format(user_id, version, recipe_id): recipe_id
+            for recipe_id in recipe_ids}
+
+
+def cached(user_id, recipe_ids):
+    """
+    Returns {recipe id: neighbors} of the recipes with cached neighbors,
+    None if the user has none cached
+    """
+    version = cache.get(VERSION_KEY.format(user_id))
+    if version is None:
+        return None
+    keys = _keys(user_id, version, recipe_ids)
+    return {keys[key]: entry for key, entry in cache.get_many(keys).items()}
+
+
+def incidence(user_id):
+    """
+    Returns the ids of the user's recipes using any tag or ingredient and
+    their incidence matrix, a row per recipe
+    """
+    import numpy as np
+    from scipy import sparse
+
+    pairs = []
+    for name in ('tags', 'ingredients'):
+        field = Recipe._meta.get_field(name)
+        target = f'{field.m2m_reverse_field_name()}_id'
+        rows = field.remote_field.through.objects.filter(
+            recipe__user_id=user_id
+        ).values_list('recipe_id', target)
+        pairs.append(np.array(list(rows), dtype=np.int64).reshape(-1, 2))
+
+    recipe_ids, rows = np.unique(
+        np.concatenate([pair[:, 0] for pair in pairs]), return_inverse=True
+    )
+    columns = []
+    offset = 0
+    for pair in pairs:
+        targets, target_columns = np.unique(pair[:, 1], return_inverse=True)
+        columns.append(target_columns + offset)
+        offset += len(targets)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, np.concatenate(columns))),
+        shape=(len(recipe_ids), offset)
+    )
+    return recipe_ids, matrix
+
+
+def similarities(matrix, rows, metric=None):
+    """
+    Returns (row, column, score) arrays of the nonzero similarities of the
+    given rows to every row of the matrix, `row` indexing into rows
+    """
+    import numpy as np
+
+    metric = metric or settings.RECOMMENDATIONS_METRIC
+    shared = (matrix[rows] @ matrix.T).tocoo()
+    sizes = np.asarray(matrix.sum(axis=1)).ravel()
+    left = sizes[rows][shared.row]
+    right = sizes[shared.col]
+    if metric == COSINE:
+        scores = shared.data / np.sqrt(left * right)
+    else:
+        scores = shared.data / (left + right - shared.data)
+    return shared.row, shared.col, scores
+
+
+def top_neighbors(recipe_ids, matrix, rows, k):
+    """
+    Returns {recipe id: [(neighbor id, score), ...]} of the k best
+    neighbors of the given rows, best first
+    """
+    import numpy as np
+
+    row, column, score = similarities(matrix, rows)
+    others = rows[row] != column
+    row, column, score = row[others], column[others], score[others]
+
+    # by row, best score first, ties broken by id
+    order = np.lexsort((column, -score, row))
+    row, column, score = row[order], column[order], score[order]
+    rank = np.arange(len(row)) - np.searchsorted(row, row)
+    best = rank < k
+
+    neighbors = {recipe_id: [] for recipe_id in recipe_ids[rows].tolist()}
+    for index, neighbor, value in zip(row[best].tolist(),
+                                      recipe_ids[column[best]].tolist(),
+                                      score[best].tolist()):
+        neighbors[int(recipe_ids[rows[index]])].append((neighbor, value))
+    return neighbors
+
+
+def build(user_id):
+    """
+    Returns the neighbors of every recipe of the user
+    """
+    import numpy as np
+
+    recipe_ids, matrix = incidence(user_id)
+    k = top_k()
+    neighbors = {}
+    for start in range(0, len(recipe_ids), BLOCK_SIZE):
+        rows = np.arange(start, min(start + BLOCK_SIZE, len(recipe_ids)))
+        neighbors.update(top_neighbors(recipe_ids, matrix, rows, k))
+    return neighbors
+
+
+def neighbors(recipe):
+    """
+    Returns the [(neighbor id, score), ...] of a recipe, best first
+    """
+    import numpy as np
+
+    user_id = recipe.user_id
+    timeout = settings.RECOMMENDATIONS_CACHE_SECONDS
+    version = cache.get(VERSION_KEY.format(user_id))
+    if version is None:
+        entries = build(user_id)
+        # a new version, whatever was cached before
+        version = time.time_ns()
+        cache.set_many({
+            key: entries[recipe_id] for key, recipe_id in
+            _keys(user_id, version, entries).items()
+        }, timeout)
+        cache.set(VERSION_KEY.format(user_id), version, timeout)
+        return entries.get(recipe.pk, [])
+
+    key = NEIGHBORS_KEY.format(user_id, version, recipe.pk)
+    entry = cache.get(key)
+    if entry is None:
+        ids, matrix = incidence(user_id)
+        rows = np.flatnonzero(ids == recipe.pk)
+        entry = top_neighbors(ids, matrix, rows, top_k()).get(recipe.pk, []) \
+            if len(rows) else []
+        cache.set(key, entry, timeout)
+    return entry
+
+
+def update(user_id, recipe_ids):
+    """
+    Updates the cached neighbors of the user after the tags or ingredients
+    of the recipes changed, or the recipes were deleted.
+
+    The changed recipes get their neighbors computed again. The others with
+    cached neighbors keep them with the changed recipes moved in or out by
+    their new scores, unless a changed recipe they had lost score: another
+    recipe may now be better, these are computed again too.
+    """
+    import numpy as np
+
+    version = cache.get(VERSION_KEY.format(user_id))
+    if version is None:
+        return
+    changed = set(recipe_ids)
+    if len(changed) > MAX_UPDATED:
+        forget(user_id)
+        return
+
+    ids, matrix = incidence(user_id)
+    index = {recipe_id: row for row, recipe_id in enumerate(ids.tolist())}
+    keys = _keys(user_id, version, index)
+    entries = {keys[key]: entry
+               for key, entry in cache.get_many(keys).items()}
+    changed_rows = np.array(
+        sorted(index[recipe_id] for recipe_id in changed
+               if recipe_id in index),
+        dtype=np.int64
+    )
+
+    # the new score of every recipe with each changed recipe
+    scores = {}
+    if len(changed_rows):
+        row, column, score = similarities(matrix, changed_rows)
+        for changed_id, other_id, value in zip(
+                ids[changed_rows[row]].tolist(), ids[column].tolist(),
+                score.tolist()):
+            if changed_id != other_id:
+                scores.setdefault(other_id, {})[changed_id] = value
+
+    k = top_k()
+    updated = {}
+    recompute = []
+    for recipe_id, current in entries.items():
+        if recipe_id in changed:
+            continue
+        new_scores = scores.get(recipe_id, {})
+        if any(new_scores.get(neighbor, 0) < score
+               for neighbor, score in current if neighbor in changed):
+            recompute.append(index[recipe_id])
+            continue
+        if new_scores:
+            kept = [(neighbor, score) for neighbor, score in current
+                    if neighbor not in changed]
+            updated[recipe_id] = sorted(
+                kept + list(new_scores.items()),
+                key=lambda pair: (-pair[1], pair[0])
+            )[:k]
+
+    rows = np.concatenate([changed_rows, np.array(recompute, dtype=np.int64)])
+    if len(rows):
+        updated.update(top_neighbors(ids, matrix, rows, k))
+    timeout = settings.RECOMMENDATIONS_CACHE_SECONDS
+    cache.set_many({
+        key: updated[recipe_id] for key, recipe_id in
+        _keys(user_id, version, updated).items()
+    }, timeout)
+    # deleted or without tags and ingredients now
+    cache.delete_many(list(_keys(user_id, version, changed - set(index))))
+
+
+def update_on_commit(user_id, recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: update(user_id, recipe_ids))
+
+
+def forget(user_id):
+    """
+    Drops the cached neighbors of the user, they are built again by the
+    next request
+    """
+    cache.delete(VERSION_KEY.format(user_id))
+
+
+def invalidate(user_id):
+    """
+    Drops the neighbors of the user once the transaction commits, for bulk
+    writes
+    """
+    transaction.on_commit(lambda: forget(user_id))
@@ -0,0 +1,196 @@
+"""
+Read replica routing.
+
+Reads only go to a replica inside replica_reads(), which ReplicaReadsMixin
+enters for the safe requests of the recipe API once the user is
+authenticated; everything else, token lookups included, uses the primary.
+The replica is picked at the first read of the block and keeps serving its
+reads, so the queries of a request see the same snapshot.
+A user who wrote through the API is pinned to the primary for
+DATABASE_REPLICA_PIN_SECONDS so their next reads see their own writes even
+if the replicas lag behind.
+
+Replicas are picked round robin or by least replication lag, replicas
+lagging more than DATABASE_REPLICA_MAX_LAG or failing the lag check are
+skipped, with the primary as the last resort. Without replicas configured
+the router leaves every read to Django's default.
+"""
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+logger = logging.getLogger(__name__)
+
+# the _ReplicaBlock of the replica_reads() block running, if any
+_replica_block = ContextVar('replica_block', default=None)
+
+PIN_KEY = 'replica-pin:{}'
+
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+"""
+
+
+class _ReplicaBlock:
+    """
+    The replica the reads of a replica_reads() block go to, picked at the
+    first of them
+    """
+    alias = None
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """
+    Lets the reads of the block go to a replica, the same for all of them
+    """
+    token = _replica_block.set(_ReplicaBlock() if enabled else None)
+    try:
+        yield
+    finally:
+        _replica_block.reset(token)
+
+
+def pin_to_primary(user_id):
+    cache.set(PIN_KEY.format(user_id), True,
+              settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return cache.get(PIN_KEY.format(user_id), False)
+
+
+class ReplicaSelector:
+    """
+    Picks the replica of a read, caching the replication lag of every
+    replica for DATABASE_REPLICA_LAG_CHECK_INTERVAL seconds
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._turns = itertools.count()
+        self._lags = {}
+
+    def measure_lag(self, alias):
+        """
+        Returns the replication lag of a replica in seconds, None if it
+        can't be checked
+        """
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            logger.warning('Replica %s failed the lag check', alias,
+                           exc_info=True)
+            return None
+
+    def lag(self, alias):
+        now = time.monotonic()
+        lag, checked = self._lags.get(alias, (None, None))
+        if checked is None or \
+                now - checked > settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL:
+            lag = self.measure_lag(alias)
+            self._lags[alias] = (lag, now)
+        return lag
+
+    def healthy(self, replicas):
+        """
+        Returns {alias: lag} of the replicas within the allowed lag
+        """
+        lags = {alias: self.lag(alias) for alias in replicas}
+        return {
+            alias: lag for alias, lag in lags.items()
+            if lag is not None and lag <= settings.DATABASE_REPLICA_MAX_LAG
+        }
+
+    def round_robin(self, replicas):
+        """
+        Returns the replicas starting with the one whose turn it is
+        """
+        with self._lock:
+            start = next(self._turns) % len(replicas)
+        return replicas[start:] + replicas[:start]
+
+    def select(self, replicas):
+        """
+        Returns the replica to read from, the primary if none is usable
+        """
+        healthy = self.healthy(replicas)
+        if not healthy:
+            return DEFAULT_DB_ALIAS
+        if settings.DATABASE_REPLICA_SELECTION == 'least_lag':
+            return min(healthy, key=lambda alias: (healthy[alias], alias))
+        for alias in self.round_robin(replicas):
+            if alias in healthy:
+                return alias
+        return DEFAULT_DB_ALIAS
+
+
+selector = ReplicaSelector()
+
+
+class ReplicaRouter:
+    """
+    Sends the reads made inside replica_reads() to the replica of the
+    block, everything else to the primary. Replicas get their schema through
+    replication
+    """
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        block = _replica_block.get()
+        if not replicas or block is None:
+            return None
+        if block.alias is None:
+            block.alias = selector.select(replicas)
+        return block.alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaReadsMixin:
+    """
+    APIView mixin reading from the replicas for the safe requests of users
+    who aren't pinned to the primary, and pinning users who write
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        if request.method in SAFE_METHODS and not (
+                user.is_authenticated and is_pinned(user.pk)):
+            self._replica_block = replica_reads()
+            self._replica_block.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        block = getattr(self, '_replica_block', None)
+        if block is not None:
+            self._replica_block = None
+            block.__exit__(None, None, None)
+        elif request.method not in SAFE_METHODS and \
+                response.status_code < 400 and request.user.is_authenticated:
+            # the writes of the view are committed by now
+            pin_to_primary(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,319 @@
+"""
+Signal handlers keeping the denormalized UserStats rows in sync with the
+recipes, tags and ingredients of every user.
+
+Every handler locks the user's stats row with SELECT ... FOR UPDATE inside
+the transaction of the triggering write, so concurrent writes of the same
+user are applied one after the other and a rolled back write leaves the
+stats untouched. Users without a stats row (created before the stats
+existed, or being deleted) are skipped, their row is built from scratch the
+first time it is requested.
+
+The recipe handlers also drop the storage reference to the image a recipe
+replaced or was deleted with, see core.storage.
+
+Every change to a recipe, tag or ingredient is written to the Change outbox
+in the transaction of the change, M2M changes as updates of the recipes,
+see core.models.ChangeManager. Bulk writes skipping the signals record
+their changes themselves.
+
+The cached neighbors of core.recommendations are updated after the commit
+of every change to the tags or ingredients of recipes.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.db.models.signals import pre_save, post_save, pre_delete, \
+                                     post_delete, m2m_changed
+from django.dispatch import receiver
+
+from core import recommendations
+from core.models import Recipe, Tag, Ingredient, UserStats, Change
+
+
+def _locked_stats(user_id):
+    """
+    Returns the user's stats row locked until the end of the transaction,
+    None if the user has no stats row
+    """
+    return UserStats.objects.select_for_update().filter(
+        user_id=user_id
+    ).first()
+
+
+def _refresh_price_range(stats):
+    """
+    Recomputes the price range from the user's recipes, needed when the
+    cheapest or the most expensive recipe changes
+    """
+    prices = Recipe.objects.filter(user_id=stats.user_id).aggregate(
+        price_min=Min('price'),
+        price_max=Max('price'),
+    )
+    stats.price_min = prices['price_min']
+    stats.price_max = prices['price_max']
+
+
+def _widen_price_range(stats, price):
+    if stats.price_min is None or price < stats.price_min:
+        stats.price_min = price
+    if stats.price_max is None or price > stats.price_max:
+        stats.price_max = price
+
+
+def _count_tag_usage(stats, tag_ids, delta):
+    usage = stats.tag_usage
+    for tag_id in tag_ids:
+        key = str(tag_id)
+        count = usage.get(key, 0) + delta
+        if count > 0:
+            usage[key] = count
+        else:
+            usage.pop(key, None)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_user_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.create(user=instance)
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_values(sender, instance, **kwargs):
+    """
+    Keeps the stored values of an updated recipe to apply the difference
+    """
+    instance._previous_values = None
+    if instance.pk is not None:
+        # with the partition key, see core.partitioning
+        instance._previous_values = Recipe.objects.filter(
+            pk=instance.pk, user_id=instance.user_id
+        ).values('time_minutes', 'price', 'image').first()
+
+
+@receiver(post_save, sender=Recipe)
+def count_saved_recipe(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_values', None)
+    with transaction.atomic():
+        stats = _locked_stats(instance.user_id)
+        if stats is None:
+            return
+        if created or previous is None:
+            stats.recipe_count += 1
+            stats.time_minutes_total += instance.time_minutes
+            _widen_price_range(stats, instance.price)
+        else:
+            stats.time_minutes_total += \
+                instance.time_minutes - previous['time_minutes']
+            if previous['price'] in (stats.price_min, stats.price_max):
+                _refresh_price_range(stats)
+            else:
+                _widen_price_range(stats, instance.price)
+        stats.save()
+
+
+@receiver(post_save, sender=Recipe)
+def release_replaced_image(sender, instance, **kwargs):
+    """
+    Cleared images aren't released here, FieldFile.delete() releases them
+    """
+    previous = getattr(instance, '_previous_values', None)
+    if previous and previous['image'] and instance.image and \
+            previous['image'] != instance.image.name:
+        instance.image.storage.delete(previous['image'])
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(sender, instance, **kwargs):
+    if instance.image:
+        instance.image.storage.delete(instance.image.name)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_recipe_tags(sender, instance, **kwargs):
+    """
+    The M2M rows are gone in post_delete, so the tags are read beforehand
+    """
+    instance._stats_tag_ids = list(
+        instance.tags.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(sender, instance, **kwargs):
+    with transaction.atomic():
+        stats = _locked_stats(instance.user_id)
+        if stats is None:
+            return
+        stats.recipe_count = max(stats.recipe_count - 1, 0)
+        stats.time_minutes_total -= instance.time_minutes
+        if instance.price in (stats.price_min, stats.price_max):
+            _refresh_price_range(stats)
+        _count_tag_usage(
+            stats, getattr(instance, '_stats_tag_ids', ()), -1
+        )
+        stats.save()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def count_created_attr(sender, instance, created, **kwargs):
+    if not created:
+        return
+    field = f'{sender._meta.model_name}_count'
+    with transaction.atomic():
+        stats = _locked_stats(instance.user_id)
+        if stats is None:
+            return
+        setattr(stats, field, getattr(stats, field) + 1)
+        stats.save(update_fields=[field])
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def count_deleted_attr(sender, instance, **kwargs):
+    field = f'{sender._meta.model_name}_count'
+    with transaction.atomic():
+        stats = _locked_stats(instance.user_id)
+        if stats is None:
+            return
+        setattr(stats, field, max(getattr(stats, field) - 1, 0))
+        if sender is Tag:
+            stats.tag_usage.pop(str(instance.pk), None)
+        stats.save()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def count_tag_usage(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Tracks how many recipes use every tag, for changes made from both
+    sides of the relation (recipe.tags and tag.recipe_set)
+    """
+    if action == 'pre_clear':
+        related = instance.recipe_set if reverse else instance.tags
+        instance._stats_cleared = list(related.values_list('id', flat=True))
+        return
+    if action == 'pre_remove':
+        # pk_set may contain objects that aren't related at all
+        related = instance.recipe_set if reverse else instance.tags
+        instance._stats_removed = list(
+            related.filter(pk__in=pk_set).values_list('id', flat=True)
+        )
+        return
+    if action == 'post_add':
+        ids, delta = pk_set, 1
+    elif action == 'post_remove':
+        ids, delta = instance._stats_removed, -1
+    elif action == 'post_clear':
+        ids, delta = instance._stats_cleared, -1
+    else:
+        return
+    if not ids:
+        return
+
+    with transaction.atomic():
+        stats = _locked_stats(instance.user_id)
+        if stats is None:
+            return
+        if reverse:
+            # the instance is a tag, ids are recipes
+            _count_tag_usage(stats, [instance.pk], delta * len(ids))
+        else:
+            _count_tag_usage(stats, ids, delta)
+        stats.save(update_fields=['tag_usage'])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def record_saved(sender, instance, created, **kwargs):
+    action = Change.CREATED if created else Change.UPDATED
+    Change.objects.record(sender, action, instance.user_id, [instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def record_deleted(sender, instance, **kwargs):
+    Change.objects.record(sender, Change.DELETED, instance.user_id,
+                          [instance.pk])
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_attr_recipes(sender, instance, **kwargs):
+    """
+    The M2M rows of a deleted tag or ingredient are deleted without
+    m2m_changed, its recipes are recorded as updated in post_delete
+    """
+    instance._changed_recipe_ids = list(
+        instance.recipe_set.values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def record_attr_recipes(sender, instance, **kwargs):
+    # recipes deleted along with the object were recorded as deleted
+    recipe_ids = Recipe.objects.filter(
+        pk__in=getattr(instance, '_changed_recipe_ids', ())
+    ).values_list('id', flat=True)
+    Change.objects.record(Recipe, Change.UPDATED, instance.user_id,
+                          recipe_ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def record_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Records the recipes whose tags or ingredients changed, from both sides
+    of the relation
+    """
+    if action in ('post_add', 'post_remove') and not pk_set:
+        return
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Change.objects.record(Recipe, Change.UPDATED, instance.user_id,
+                                  [instance.pk])
+        return
+    if action == 'pre_clear':
+        instance._changed_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    elif action in ('post_add', 'post_remove'):
+        Change.objects.record(Recipe, Change.UPDATED, instance.user_id,
+                              pk_set)
+    elif action == 'post_clear':
+        Change.objects.record(Recipe, Change.UPDATED, instance.user_id,
+                              instance._changed_recipe_ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_recommendations(sender, instance, action, reverse, pk_set,
+                           **kwargs):
+    if action in ('post_add', 'post_remove') and not pk_set:
+        return
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            recommendations.update_on_commit(instance.user_id, [instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        recommendations.update_on_commit(instance.user_id, pk_set)
+    elif action == 'post_clear':
+        # remembered by record_m2m_change
+        recommendations.update_on_commit(instance.user_id,
+                                         instance._changed_recipe_ids)
+
+
+@receiver(post_delete, sender=Recipe)
+def update_deleted_recommendations(sender, instance, **kwargs):
+    recommendations.update_on_commit(instance.user_id, [instance.pk])
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_attr_recommendations(sender, instance, **kwargs):
+    # remembered by remember_attr_recipes
+    recommendations.update_on_commit(
+        instance.user_id, getattr(instance, '_changed_recipe_ids', ())
+    )
@@ -0,0 +1,348 @@
+"""
+Content addressed storages for uploaded files.
+
+A file is named after the SHA-256 of its content, sharded into two levels of
+subdirectories (uploads/recipe/ab/cd/abcd...ef.jpg) so no directory grows
+too large. Identical uploads resolve to the same name and are stored once,
+core.models.StoredFile counts the references so deleting a file only
+removes it with its last reference.
+
+The upload is hashed while it is spooled to a temporary file, which is then
+moved into place in one step: readers never see a partially written file.
+The reference counts follow the transactions, the file of a rolled back
+upload stays on disk unreferenced and is reused by the next identical one.
+
+ContentAddressedStorage keeps the files under MEDIA_ROOT,
+S3ContentAddressedStorage in an S3 compatible bucket through a boto3 style
+client; LocalS3Client is a stand-in for such a client over a local
+directory, for development and tests. MemoryContentAddressedStorage keeps
+them in the memory of the process, for the fast test profile.
+"""
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage, \
+                                      get_storage_class
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.deconstruct import deconstructible
+
+
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+def content_name(name, digest):
+    """
+    Returns the content addressed name of a file stored as `name`, keeping
+    its directory and extension
+    """
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    shards = [
+        digest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH]
+        for level in range(SHARD_LEVELS)
+    ]
+    return '/'.join(filter(None, [directory, *shards, digest + extension]))
+
+
+class ContentAddressedMixin:
+    """
+    Naming, deduplication and reference counting of the content addressed
+    storages. Backends store the blobs with blob_exists(), store_blob()
+    and delete_blob()
+    """
+    temp_dir = None
+
+    def get_available_name(self, name, max_length=None):
+        # the final name only depends on the content, see _save()
+        return name
+
+    def _save(self, name, content):
+        from core.models import StoredFile
+
+        digest = hashlib.sha256()
+        size = 0
+        temp = tempfile.NamedTemporaryFile(dir=self.temp_dir, delete=False)
+        try:
+            with temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+
+            name = content_name(name, digest.hexdigest())
+            # the blob of the first reference is always written, a delete of
+            # the previous last reference may not have removed it yet
+            if StoredFile.objects.acquire(name, size) or \
+                    not self.blob_exists(name):
+                self.store_blob(temp.name, name)
+        finally:
+            if os.path.exists(temp.name):
+                os.remove(temp.name)
+        return name
+
+    def share(self, name, count=1):
+        """
+        Adds references to a stored file for count more objects using it,
+        the file isn't copied
+        """
+        from core.models import StoredFile
+
+        StoredFile.objects.share(name, count, lambda: self.size(name))
+
+    def delete(self, name):
+        """
+        Drops a reference, the blob is removed after the commit if it was
+        the last one
+        """
+        self.release(name)
+
+    def release(self, name, count=1):
+        """
+        Drops the references of count objects deleted at once, see delete()
+        """
+        from core.models import StoredFile
+
+        if StoredFile.objects.release(name, count):
+            transaction.on_commit(lambda: self._delete_unreferenced(name))
+
+    def _delete_unreferenced(self, name):
+        from core.models import StoredFile
+
+        # referenced again by an upload committed in the meantime
+        if not StoredFile.objects.filter(name=name).exists():
+            self.delete_blob(name)
+
+
+@deconstructible
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+    """
+    Content addressed storage in a local directory, MEDIA_ROOT by default
+    """
+    @property
+    def temp_dir(self):
+        # on the same file system as the files, so rename is atomic
+        path = os.path.join(self.location, '.incoming')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def blob_exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def store_blob(self, temp_path, name):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(temp_path, self.file_permissions_mode)
+        os.replace(temp_path, path)
+
+    def delete_blob(self, name):
+        FileSystemStorage.delete(self, name)
+
+
+def _not_found(error):
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code') in ('404', 'NoSuchKey')
+
+
+@deconstructible
+class S3ContentAddressedStorage(ContentAddressedMixin, Storage):
+    """
+    Content addressed storage in an S3 compatible bucket. The client is a
+    boto3 S3 client for RECIPE_IMAGE_S3_ENDPOINT unless one is given
+    """
+    def __init__(self, bucket=None, base_url=None, client=None):
+        self.bucket = bucket or settings.RECIPE_IMAGE_S3_BUCKET
+        self.base_url = base_url if base_url is not None \
+            else settings.RECIPE_IMAGE_S3_BASE_URL
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client(
+                's3', endpoint_url=settings.RECIPE_IMAGE_S3_ENDPOINT or None
+            )
+        return self._client
+
+    def blob_exists(self, name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=name)
+        except Exception as error:
+            if _not_found(error):
+                return False
+            raise
+        return True
+
+    def store_blob(self, temp_path, name):
+        content_type = mimetypes.guess_type(name)[0] or \
+            'application/octet-stream'
+        with open(temp_path, 'rb') as body:
+            self.client.put_object(Bucket=self.bucket, Key=name, Body=body,
+                                   ContentType=content_type)
+
+    def delete_blob(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=name)
+
+    def _open(self, name, mode='rb'):
+        body = self.client.get_object(Bucket=self.bucket, Key=name)['Body']
+        try:
+            return ContentFile(body.read(), name=name)
+        finally:
+            body.close()
+
+    def exists(self, name):
+        return self.blob_exists(name)
+
+    def size(self, name):
+        response = self.client.head_object(Bucket=self.bucket, Key=name)
+        return response['ContentLength']
+
+    def url(self, name):
+        return urljoin(self.base_url, name)
+
+
+@deconstructible
+class MemoryContentAddressedStorage(ContentAddressedMixin, Storage):
+    """
+    Content addressed storage keeping the blobs in memory, nothing is
+    written under MEDIA_ROOT
+    """
+    def __init__(self, base_url=None):
+        self.base_url = base_url if base_url is not None \
+            else settings.MEDIA_URL
+        self.blobs = {}
+
+    def blob_exists(self, name):
+        return name in self.blobs
+
+    def store_blob(self, temp_path, name):
+        with open(temp_path, 'rb') as temp:
+            self.blobs[name] = temp.read()
+
+    def delete_blob(self, name):
+        self.blobs.pop(name, None)
+
+    def _open(self, name, mode='rb'):
+        try:
+            return ContentFile(self.blobs[name], name=name)
+        except KeyError:
+            raise FileNotFoundError(name)
+
+    def exists(self, name):
+        return name in self.blobs
+
+    def size(self, name):
+        return len(self.blobs[name])
+
+    def url(self, name):
+        return urljoin(self.base_url, name)
+
+
+class LocalS3Error(Exception):
+    """
+    Error shaped like botocore's ClientError
+    """
+    def __init__(self, code, key):
+        super().__init__(f'{code}: {key}')
+        self.response = {'Error': {'Code': code, 'Key': key}}
+
+
+class LocalS3Client:
+    """
+    The part of the boto3 S3 client used by S3ContentAddressedStorage,
+    storing the objects of every bucket in a directory under root
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path),
+                                         delete=False) as temp:
+            if isinstance(Body, bytes):
+                temp.write(Body)
+            else:
+                shutil.copyfileobj(Body, temp)
+        os.replace(temp.name, path)
+        return {}
+
+    def head_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise LocalS3Error('404', Key)
+        return {'ContentLength': os.path.getsize(path)}
+
+    def get_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise LocalS3Error('NoSuchKey', Key)
+        return {'Body': open(path, 'rb'),
+                'ContentLength': os.path.getsize(path)}
+
+    def delete_object(self, Bucket, Key):
+        # like S3, deleting a missing key is not an error
+        try:
+            os.remove(self._path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+        return {}
+
+
+def export_storage():
+    """
+    Storage of the files written by the export jobs, under EXPORT_ROOT and
+    never served, the user downloads them through the job
+    """
+    return FileSystemStorage(location=settings.EXPORT_ROOT)
+
+
+class RecipeImageStorage:
+    """
+    Proxy to the RECIPE_IMAGE_STORAGE storage, created on first use.
+    Migrations refer to the proxy, so changing the setting needs none
+    """
+    _backend = None
+
+    def __getattr__(self, name):
+        if self._backend is None:
+            self._backend = get_storage_class(
+                settings.RECIPE_IMAGE_STORAGE
+            )()
+        return getattr(self._backend, name)
+
+    def __deepcopy__(self, memo):
+        # model states copy their fields, keep the proxy
+        return self
+
+    def deconstruct(self):
+        return 'core.storage.RecipeImageStorage', (), {}
+
+    def __eq__(self, other):
+        return isinstance(other, RecipeImageStorage)
+
+    def __hash__(self):
+        return hash(RecipeImageStorage)
+
+
+recipe_image_storage = RecipeImageStorage()
+
+
+@receiver(setting_changed)
+def reset_recipe_image_storage(setting, **kwargs):
+    if setting == 'RECIPE_IMAGE_STORAGE':
+        recipe_image_storage._backend = None
@@ -0,0 +1,33 @@
+"""
+Background tasks of the core app, run by the worker command, see core.jobs
+"""
+from core import accounts
+from core.jobs import task
+from core.models import AccountDeletion, UserStats
+
+
+@task('delete_account')
+def delete_account(deletion_id):
+    """
+    Carries out a queued account deletion, resumed where it stopped by the
+    retries
+    """
+    deletion = AccountDeletion.objects.get(pk=deletion_id)
+    if deletion.status != AccountDeletion.DONE:
+        try:
+            for deletion in accounts.delete_account(deletion):
+                pass
+        except Exception as error:
+            accounts.fail(deletion, error)
+            raise
+    return {
+        'recipes': deletion.recipes_deleted,
+        'tags': deletion.tags_deleted,
+        'ingredients': deletion.ingredients_deleted,
+        'images': deletion.images_released,
+    }
+
+
+@task('rebuild_stats')
+def rebuild_stats(user_ids=None):
+    return {'users': UserStats.objects.rebuild(user_ids)}
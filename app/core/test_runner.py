@@ -0,0 +1,79 @@
+"""
+Test runner applying the fast test profile, TEST_FAST_PROFILE.
+
+The profile swaps what is slow by design for what is cheap in tests: MD5
+password hashing instead of PBKDF2, which every create_user() pays for, and
+recipe images kept in memory instead of MEDIA_ROOT. Tests of a storage or
+of the hashing itself set theirs with override_settings.
+
+`manage.py test --parallel [N]` runs the tests in N processes, every one
+with its own copy of the test database (test_<name>_<n>, cloned from the
+migrated one by Django), so they don't see each other's writes. Test cases
+with run_serially set run after them in the main process: the ones that
+need no other transaction running on the server (the change feed numbering
+waits for all of them, whatever their database) or processes of their own.
+
+The routing tests read from TEST_REPLICA, a second test database on the
+primary server standing in for a replica: the settings only define the
+replicas of DB_REPLICA_HOSTS.
+"""
+from unittest import TestSuite
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+FAST_PROFILE = {
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+    'RECIPE_IMAGE_STORAGE': 'core.storage.MemoryContentAddressedStorage',
+}
+
+TEST_REPLICA = 'replica'
+
+
+class FastTestRunner(DiscoverRunner):
+    """
+    DiscoverRunner with the fast profile, see the module docstring
+    """
+    _profile = None
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        if settings.TEST_FAST_PROFILE:
+            # before the processes of --parallel fork, they inherit it
+            self._profile = override_settings(**FAST_PROFILE)
+            self._profile.enable()
+
+    def setup_databases(self, **kwargs):
+        # the connections read this very dict, before or after this
+        default = settings.DATABASES['default']
+        settings.DATABASES.setdefault(TEST_REPLICA, {
+            **default,
+            'TEST': {'NAME': f"test_{default['NAME']}_replica"},
+        })
+        return super().setup_databases(**kwargs)
+
+    def build_suite(self, *args, **kwargs):
+        parallel, self.parallel = self.parallel, 1
+        suite = super().build_suite(*args, **kwargs)
+        self.parallel = parallel
+        if parallel <= 1:
+            return suite
+
+        serial = [test for test in suite
+                  if getattr(test, 'run_serially', False)]
+        rest = self.test_suite(test for test in suite
+                               if not getattr(test, 'run_serially', False))
+        parallel_suite = self.parallel_test_suite(rest, parallel,
+                                                  self.failfast)
+        # tests are spread over the processes by test case
+        self.parallel = min(parallel, len(parallel_suite.subsuites))
+        if self.parallel <= 1:
+            return suite
+        return TestSuite([parallel_suite, self.test_suite(serial)])
+
+    def teardown_test_environment(self, **kwargs):
+        if self._profile is not None:
+            self._profile.disable()
+        super().teardown_test_environment(**kwargs)
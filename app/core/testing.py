@@ -0,0 +1,61 @@
+"""
+Fixture factories shared by the tests of the apps.
+
+AuthenticatedApiTestCase creates its user once per test case in
+setUpTestData, inside the transaction the tests of the case roll back to,
+instead of once per test. Every test gets its own copy of the instance, so
+tests may change it.
+"""
+import copy
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+
+
+def create_user(email='testemail@teamalif.com', password='testpass123',
+                **params):
+    return get_user_model().objects.create_user(email=email,
+                                                password=password, **params)
+
+
+def sample_tag(user, name='Vegetable'):
+    return Tag.objects.create(user=user, name=name)
+
+
+def sample_ingredient(user, name='Carrot'):
+    return Ingredient.objects.create(user=user, name=name)
+
+
+def sample_recipe(user, tags=(), ingredients=(), **params):
+    defaults = {
+        'title': 'Sample Recipe',
+        'time_minutes': 10,
+        'price': 5.00,
+    }
+    defaults.update(params)
+    recipe = Recipe.objects.create(user=user, **defaults)
+    if tags:
+        recipe.tags.set(tags)
+    if ingredients:
+        recipe.ingredients.set(ingredients)
+    return recipe
+
+
+class AuthenticatedApiTestCase(TestCase):
+    """
+    TestCase with self.user, created once for the test case, and an API
+    client authenticated as them
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+
+    def setUp(self):
+        # the class attribute is shared by the tests
+        self.user = copy.deepcopy(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
@@ -0,0 +1,134 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db.models.signals import post_delete
+from django.test import TestCase
+
+from core import accounts, jobs
+from core.models import AccountDeletion, Change, Ingredient, Job, Recipe, \
+                        StoredFile, Tag
+from core.testing import create_user, sample_recipe
+
+
+class AccountDeletionTests(TestCase):
+    """Test the batched deletion of accounts"""
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        media_root = self.settings(MEDIA_ROOT=location)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+        self.user = create_user()
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(user=self.user,
+                                                    name='Salt')
+        for number in range(3):
+            recipe = sample_recipe(self.user, title=f'Recipe {number}')
+            recipe.tags.add(self.tag)
+            recipe.ingredients.add(self.ingredient)
+        self.deletion = accounts.request_deletion(self.user)
+
+    def delete(self, batch_size=2):
+        return [
+            (progress.recipes_deleted, progress.tags_deleted,
+             progress.ingredients_deleted)
+            for progress in accounts.delete_account(self.deletion,
+                                                    batch_size)
+        ]
+
+    def test_delete_in_batches(self):
+        """Test the account is deleted in batches with its progress and the
+        deletions recorded"""
+        other = create_user(email='other@teamalif.com')
+        kept = sample_recipe(other)
+        kept.tags.add(self.tag)
+
+        progress = self.delete()
+
+        self.assertEqual(progress, [(2, 0, 0), (3, 0, 0), (3, 1, 0),
+                                    (3, 1, 1), (3, 1, 1)])
+        self.deletion.refresh_from_db()
+        self.assertEqual(self.deletion.status, AccountDeletion.DONE)
+        self.assertEqual(self.deletion.progress, 1.0)
+        self.assertFalse(
+            get_user_model().objects.filter(pk=self.user.pk).exists()
+        )
+        self.assertEqual(list(Recipe.objects.all()), [kept])
+        self.assertFalse(kept.tags.exists())
+        self.assertFalse(Tag.objects.exists())
+        self.assertFalse(Ingredient.objects.exists())
+        deleted = Change.objects.filter(user_id=self.user.pk,
+                                        action=Change.DELETED)
+        self.assertEqual(sorted(deleted.values_list('model', flat=True)),
+                         ['ingredient', 'recipe', 'recipe', 'recipe', 'tag'])
+        self.assertTrue(Change.objects.filter(
+            user_id=other.pk, object_id=kept.pk, action=Change.UPDATED
+        ).exists())
+
+    def test_images_released(self):
+        """Test the references to the images of the recipes are dropped"""
+        recipe = Recipe.objects.filter(user=self.user).first()
+        recipe.image.save('curry.jpg', ContentFile(b'image'))
+        Recipe.objects.duplicate(self.user, [recipe.id])
+        self.assertEqual(StoredFile.objects.get().refcount, 2)
+
+        self.delete()
+
+        self.deletion.refresh_from_db()
+        self.assertEqual(self.deletion.images_released, 2)
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_other_receivers_run(self):
+        """Test recipes are deleted through the ORM when other receivers
+        listen to their deletes"""
+        deleted = []
+
+        def receiver(sender, instance, **kwargs):
+            deleted.append(instance.pk)
+
+        post_delete.connect(receiver, sender=Recipe)
+        self.addCleanup(post_delete.disconnect, receiver, sender=Recipe)
+
+        self.delete()
+
+        self.assertEqual(len(deleted), 3)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_command(self):
+        """Test the command carries out the pending deletions"""
+        out = StringIO()
+        call_command('delete_accounts', batch_size=2, stdout=out)
+
+        self.assertIn(f'user {self.user.pk}:  40.0%', out.getvalue())
+        self.assertIn('Deleted 1 accounts', out.getvalue())
+        self.assertFalse(accounts.pending().exists())
+
+    def test_command_failure(self):
+        """Test a failed deletion is recorded and resumed later"""
+        with patch('core.accounts._delete_recipes',
+                   side_effect=RuntimeError('boom')):
+            call_command('delete_accounts', stdout=StringIO(),
+                         stderr=StringIO())
+
+        self.deletion.refresh_from_db()
+        self.assertEqual(self.deletion.status, AccountDeletion.FAILED)
+        self.assertEqual(self.deletion.error, 'boom')
+        self.assertEqual(list(accounts.pending()), [self.deletion])
+
+    def test_job(self):
+        """Test the queued job carries out the deletion"""
+        job, = Job.objects.claim('worker', 1)
+
+        jobs.execute(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result['recipes'], 3)
+        self.assertFalse(accounts.pending().exists())
@@ -0,0 +1,144 @@
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from benchmarks import datagen, runner, startup
+from core import partitioning
+from core.models import Recipe, UserStats
+
+
+class BenchmarkTests(TestCase):
+
+    def setUp(self):
+        self.spec = datagen.DataSpec(
+            users=2, recipes=5, tags=4, ingredients=5, density=0.5
+        )
+
+    def test_generate_data(self):
+        """Test the data generator creates the requested data set"""
+        users = datagen.generate(self.spec)
+
+        self.assertEqual(len(users), 2)
+        self.assertEqual(Recipe.objects.count(), 10)
+        recipe = Recipe.objects.filter(user=users[0]).first()
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertEqual(recipe.ingredients.count(), 2)
+        self.assertEqual(UserStats.objects.get(user=users[0]).recipe_count, 5)
+        self.assertTrue(users[1].check_password(datagen.PASSWORD))
+
+    def test_run_scenarios(self):
+        """Test running scenarios reports their metrics"""
+        results = runner.run(
+            self.spec, scenarios=['recipe_detail', 'token_login'],
+            iterations=3, warmup=1, alloc_iterations=1
+        )
+
+        self.assertEqual(
+            set(results['scenarios']), {'recipe_detail', 'token_login'}
+        )
+        metrics = results['scenarios']['recipe_detail']
+        self.assertGreater(metrics['queries'], 0)
+        self.assertGreater(metrics['alloc_peak_kib'], 0)
+        self.assertLessEqual(metrics['latency_p50_ms'],
+                             metrics['latency_p99_ms'])
+
+    def test_run_on_partitions(self):
+        """Test the scenarios can run on partitioned recipe tables"""
+        results = runner.run(
+            self.spec, scenarios=['recipe_list'], iterations=2, warmup=0,
+            alloc_iterations=1, partitions=2
+        )
+
+        self.assertEqual(results['environment']['partitions'], 2)
+        self.assertTrue(
+            partitioning.is_partitioned(connection, Recipe._meta.db_table)
+        )
+        self.assertGreater(results['scenarios']['recipe_list']['queries'], 0)
+
+    def test_compare_detects_regressions(self):
+        """Test comparing with a baseline reports only real regressions"""
+        baseline = {'scenarios': {'recipe_list': {
+            'latency_p50_ms': 10.0, 'latency_p95_ms': 20.0,
+            'queries': 4, 'alloc_peak_kib': 100.0,
+        }}}
+        results = {'scenarios': {
+            'recipe_list': {
+                'latency_p50_ms': 11.5, 'latency_p95_ms': 40.0,
+                'queries': 5, 'alloc_peak_kib': 90.0,
+            },
+            'recipe_create': {
+                'latency_p50_ms': 100.0, 'latency_p95_ms': 100.0,
+                'queries': 50, 'alloc_peak_kib': 100.0,
+            },
+        }}
+
+        regressions = runner.compare(baseline, results, tolerance=0.2)
+
+        self.assertEqual(
+            {(r.scenario, r.metric) for r in regressions},
+            {('recipe_list', 'latency_p95_ms'), ('recipe_list', 'queries')}
+        )
+
+    def test_compare_startup(self):
+        """Test the start up of the commands is compared when measured"""
+        baseline = {'scenarios': {}, 'startup': {'wait_for_db': {
+            'wall_ms': 500.0, 'import_ms': 300.0,
+        }}}
+        results = {'scenarios': {}, 'startup': {'wait_for_db': {
+            'wall_ms': 560.0, 'import_ms': 400.0,
+        }}}
+
+        regressions = runner.compare(baseline, results, tolerance=0.2)
+
+        self.assertEqual(
+            [(r.scenario, r.metric) for r in regressions],
+            [('wait_for_db', 'import_ms')]
+        )
+        self.assertEqual(runner.compare({'scenarios': {}}, results), [])
+
+    def test_percentile(self):
+        """Test percentiles interpolate between ranks"""
+        values = [4, 1, 3, 2]
+
+        self.assertEqual(runner.percentile(values, 0), 1)
+        self.assertEqual(runner.percentile(values, 50), 2.5)
+        self.assertEqual(runner.percentile(values, 100), 4)
+
+
+class StartupTests(SimpleTestCase):
+
+    def test_parse(self):
+        """Test the -X importtime output is parsed with the nesting"""
+        imports = startup.parse(
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       120 |        120 |     numpy.version\n'
+            'import time:      2000 |       2120 |   numpy\n'
+            'import time:       500 |        500 | core.signals\n'
+        )
+
+        self.assertEqual(
+            [(i.module, i.depth, i.cumulative_us) for i in imports],
+            [('numpy.version', 2, 120), ('numpy', 1, 2120),
+             ('core.signals', 0, 500)]
+        )
+        self.assertEqual(startup.packages(imports),
+                         {'numpy': 2.12, 'core': 0.5})
+
+    def test_wait_for_db_starts_lean(self):
+        """Test wait_for_db imports neither the API stack nor the
+        recommendation and image libraries"""
+        # against the test database, not the one of the environment
+        database = connection.settings_dict
+        _, imports = startup.profile(['wait_for_db'], env={
+            'DB_HOST': database['HOST'],
+            'DB_NAME': database['NAME'],
+            'DB_USER': database['USER'],
+            'DB_PASS': database['PASSWORD'],
+        })
+
+        packages = {module.package for module in imports}
+        for package in ('numpy', 'scipy', 'PIL'):
+            self.assertNotIn(package, packages)
+        modules = {module.module for module in imports}
+        for module in ('rest_framework.views', 'rest_framework.serializers',
+                       'core.admin'):
+            self.assertNotIn(module, modules)
@@ -1,3 +1,4 @@
+from io import StringIO
 from unittest.mock import patch
 
 from django.core.management import call_command
@@ -21,3 +22,21 @@ class CommandTests(TestCase):
             gi.side_effect = [OperationalError] * 5 + [True]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
+
+    def test_backfill_recipe_price_after_swap(self):
+        """Test the price backfill has nothing to do once swapped"""
+        out = StringIO()
+        call_command('backfill_recipe_price', stdout=out)
+        self.assertIn('Nothing to backfill', out.getvalue())
+
+    def test_importtime(self):
+        """Test the import time report of a command"""
+        out = StringIO()
+        # help loads the command without running it, no database needed
+        call_command('importtime', 'help', 'wait_for_db', limit=3,
+                     stdout=out)
+
+        report = out.getvalue()
+        self.assertIn('help wait_for_db: ', report)
+        self.assertIn('django', report)
+        self.assertIn('django.core.management', report)
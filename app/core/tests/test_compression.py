@@ -0,0 +1,141 @@
+import gzip
+import json
+import shutil
+import tempfile
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.core.cache import _create_cache, cache
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import compression
+from core.testing import AuthenticatedApiTestCase, sample_recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class CompressionTests(TestCase):
+    """Test the negotiated response compression"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def compress(self, response, accept_encoding='gzip'):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return compression.compress_response(request, response)
+
+    def test_negotiate(self):
+        """Test the encoding the client prefers among the supported ones
+        is picked"""
+        self.assertEqual(compression.negotiate('gzip, deflate'), 'gzip')
+        self.assertEqual(compression.negotiate('*'),
+                         compression.available_encodings()[0])
+        self.assertIsNone(compression.negotiate('gzip;q=0, deflate'))
+        self.assertIsNone(compression.negotiate(''))
+
+    @skipUnless(compression.brotli, 'brotli is not installed')
+    def test_negotiate_brotli(self):
+        """Test brotli is preferred unless weighted lower"""
+        self.assertEqual(compression.negotiate('gzip, br'), 'br')
+        self.assertEqual(compression.negotiate('gzip, br;q=0.5'), 'gzip')
+
+    def test_small_response_sent_as_is(self):
+        """Test responses under the minimum size aren't compressed"""
+        response = self.compress(HttpResponse(
+            b'{}', content_type='application/json'
+        ))
+
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, b'{}')
+
+    def test_large_response_compressed(self):
+        """Test large JSON responses are gzipped for clients accepting it"""
+        content = json.dumps([{'title': 'Curry'}] * 200).encode()
+
+        response = self.compress(HttpResponse(
+            content, content_type='application/json'
+        ))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(response.content), content)
+
+    def test_streaming_response_compressed(self):
+        """Test streaming responses are compressed chunk by chunk"""
+        chunks = [b'{"title": "Curry"}\n' * 100] * 5
+
+        response = self.compress(StreamingHttpResponse(
+            iter(chunks), content_type='application/x-ndjson'
+        ))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response)),
+                         b''.join(chunks))
+
+
+@override_settings(RESPONSE_CACHE_SECONDS=60)
+class CompressedCacheTests(AuthenticatedApiTestCase):
+    """Test the cache of compressed list responses"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for number in range(30):
+            sample_recipe(self.user, title=f'Recipe {number}')
+
+    def test_hit_skips_queries(self):
+        """Test a cached list is sent compressed without querying"""
+        first = self.client.get(RECIPES_URL, HTTP_ACCEPT_ENCODING='gzip')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(RECIPES_URL,
+                                     HTTP_ACCEPT_ENCODING='gzip')
+
+        # only the savepoint of the atomic request is left
+        self.assertFalse([query for query in queries
+                          if 'SAVEPOINT' not in query['sql']])
+        self.assertEqual(second['Content-Encoding'], 'gzip')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second.data, first.data)
+
+    def test_cached_per_encoding(self):
+        """Test clients not accepting gzip get plain responses"""
+        self.client.get(RECIPES_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertFalse(res.has_header('Content-Encoding'))
+        self.assertEqual(len(json.loads(res.content)), 30)
+
+    def test_changes_invalidate(self):
+        """Test writes of the user leave the cached responses behind"""
+        self.client.get(RECIPES_URL)
+
+        sample_recipe(self.user, title='Curry')
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 31)
+        self.assertEqual(res.data[0]['title'], 'Curry')
+
+    def test_changes_invalidate_other_processes(self):
+        """Test a write through one cache instance reaches the others"""
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        backend = 'django.core.cache.backends.filebased.FileBasedCache'
+        # a cache instance per process, sharing the files like memcached
+        reader = _create_cache(backend, LOCATION=location)
+        writer = _create_cache(backend, LOCATION=location)
+
+        with patch('core.compression.cache', reader):
+            self.client.get(RECIPES_URL)
+        with patch('core.compression.cache', writer):
+            sample_recipe(self.user, title='Curry')
+        with patch('core.compression.cache', reader):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data), 31)
+        self.assertEqual(res.data[0]['title'], 'Curry')
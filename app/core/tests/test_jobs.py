@@ -0,0 +1,174 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.metrics import job_registry
+from core.models import Job, UserStats
+
+
+def register(name, function):
+    jobs.tasks()[name] = function
+
+
+class JobQueueTests(TestCase):
+    """Test queueing, claiming and running jobs"""
+
+    def setUp(self):
+        job_registry.reset()
+        self.calls = []
+        register('test_record', lambda **args: self.calls.append(args) or 1)
+        self.addCleanup(jobs.TASKS.pop, 'test_record')
+
+    def test_enqueue_unknown_task(self):
+        """Test jobs of unregistered tasks are refused"""
+        with self.assertRaises(ValueError):
+            jobs.enqueue('missing')
+
+    def test_claim_once(self):
+        """Test a claimed job isn't claimed again and future jobs wait"""
+        job = jobs.enqueue('test_record', value=1)
+        jobs.enqueue('test_record',
+                     run_at=timezone.now() + timedelta(hours=1))
+
+        claimed = Job.objects.claim('worker', 10)
+
+        self.assertEqual(claimed, [job])
+        self.assertEqual(claimed[0].status, Job.RUNNING)
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(Job.objects.claim('other', 10), [])
+
+    def test_execute(self):
+        """Test a job runs its task with its arguments"""
+        job = jobs.enqueue('test_record', value=1)
+        Job.objects.claim('worker', 1)
+
+        name, outcome, _, _ = jobs.execute(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((name, outcome), ('test_record', jobs.SUCCEEDED))
+        self.assertEqual(self.calls, [{'value': 1}])
+        self.assertEqual((job.status, job.result), (Job.DONE, 1))
+        self.assertIsNotNone(job.finished)
+
+    @override_settings(JOB_BACKOFF_SECONDS=10, JOB_MAX_ATTEMPTS=2)
+    def test_retry_with_backoff(self):
+        """Test a failing job is retried later, then fails for good"""
+        def fail():
+            raise RuntimeError('boom')
+
+        register('test_fail', fail)
+        self.addCleanup(jobs.TASKS.pop, 'test_fail')
+        job = jobs.enqueue('test_fail')
+
+        Job.objects.claim('worker', 1)
+        retried = jobs.execute(job.pk)[1]
+        job.refresh_from_db()
+        self.assertEqual((retried, job.status), (jobs.RETRIED, Job.QUEUED))
+        self.assertGreaterEqual(job.run_at,
+                                timezone.now() + timedelta(seconds=4))
+        self.assertIn('RuntimeError: boom', job.error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        Job.objects.claim('worker', 1)
+        failed = jobs.execute(job.pk)[1]
+        job.refresh_from_db()
+        self.assertEqual((failed, job.status), (jobs.FAILED, Job.FAILED))
+        self.assertEqual(job.attempts, 2)
+
+    @override_settings(JOB_BACKOFF_SECONDS=10, JOB_BACKOFF_MAX_SECONDS=60)
+    def test_backoff(self):
+        """Test the backoff doubles up to the max, with jitter"""
+        for attempts, (low, high) in ((1, (5, 10)), (2, (10, 20)),
+                                      (5, (30, 60))):
+            self.assertTrue(low <= jobs.backoff(attempts) <= high)
+
+    def test_requeue_stale(self):
+        """Test jobs running for too long are queued again"""
+        job = jobs.enqueue('test_record')
+        Job.objects.claim('worker', 1)
+        Job.objects.filter(pk=job.pk).update(
+            started=timezone.now() - timedelta(hours=2)
+        )
+
+        requeued = Job.objects.requeue_stale(timedelta(hours=1))
+
+        job.refresh_from_db()
+        self.assertEqual((requeued, job.status), ((1, 0), Job.QUEUED))
+
+    def test_stale_last_attempt_fails(self):
+        """Test stale jobs without attempts left fail instead"""
+        job = jobs.enqueue('test_record')
+        Job.objects.filter(pk=job.pk).update(max_attempts=1)
+        Job.objects.claim('worker', 1)
+        Job.objects.filter(pk=job.pk).update(
+            started=timezone.now() - timedelta(hours=2)
+        )
+
+        requeued = Job.objects.requeue_stale(timedelta(hours=1))
+
+        job.refresh_from_db()
+        self.assertEqual((requeued, job.status), ((0, 1), Job.FAILED))
+        self.assertIn('last attempt', job.error)
+        self.assertIsNotNone(job.finished)
+
+    def test_queue_metrics(self):
+        """Test the queue depth is rendered by task and status"""
+        jobs.enqueue('test_record')
+        jobs.enqueue('test_record')
+
+        metrics = jobs.render_queue()
+
+        self.assertIn('jobs_pending{job="test_record",status="queued"} 2',
+                      metrics)
+        self.assertIn('job_oldest_wait_seconds{job="test_record"}', metrics)
+
+
+class WorkerTests(TransactionTestCase):
+    """Test the worker running the queued jobs"""
+    # the process pool can't be started from a process of --parallel
+    run_serially = True
+
+    def setUp(self):
+        job_registry.reset()
+        self.user = get_user_model().objects.create_user(
+            'test@teamalif.com',
+            'testpass'
+        )
+        UserStats.objects.filter(user=self.user).delete()
+
+    def test_thread_pool(self):
+        """Test the worker runs the jobs in its threads until none is due"""
+        queued = [jobs.enqueue('rebuild_stats', user_ids=[self.user.pk])
+                  for _ in range(3)]
+
+        jobs.Worker(concurrency=2, pool=jobs.THREAD,
+                    poll_seconds=0.1).run(burst=True)
+
+        self.assertEqual(
+            [job.status for job in Job.objects.filter(
+                pk__in=[job.pk for job in queued])],
+            [Job.DONE] * 3
+        )
+        self.assertTrue(UserStats.objects.filter(user=self.user).exists())
+        self.assertIn(
+            'jobs_total{job="rebuild_stats",outcome="succeeded"} 3',
+            job_registry.render()
+        )
+
+    def test_process_pool(self):
+        """Test the worker runs the jobs in processes of their own"""
+        job = jobs.enqueue('rebuild_stats', user_ids=[self.user.pk])
+
+        out = StringIO()
+        call_command('worker', burst=True, pool=jobs.PROCESS, concurrency=1,
+                     poll=0.1, stdout=out)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.result, {'users': 1})
+        self.assertIn('process pool, concurrency 1', out.getvalue())
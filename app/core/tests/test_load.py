@@ -0,0 +1,56 @@
+import asyncio
+
+from django.test import LiveServerTestCase, SimpleTestCase
+
+from benchmarks import load
+
+
+class LoadProfileTests(SimpleTestCase):
+
+    def test_parse_profile(self):
+        """Test ramp profiles are read from names and stage specs"""
+        self.assertEqual(load.parse_profile('smoke'), load.PROFILES['smoke'])
+        self.assertEqual(load.parse_profile('10:30,0:5'),
+                         [(10, 30.0), (0, 5.0)])
+        with self.assertRaises(ValueError):
+            load.parse_profile('ten:30')
+        with self.assertRaises(ValueError):
+            load.parse_profile('10:0')
+
+    def test_target_users_ramps_linearly(self):
+        """Test the user count moves linearly between stages"""
+        stages = [(10, 10), (10, 5), (0, 10)]
+
+        self.assertEqual(load.target_users(stages, 0), 0)
+        self.assertEqual(load.target_users(stages, 5), 5)
+        self.assertEqual(load.target_users(stages, 12), 10)
+        self.assertEqual(load.target_users(stages, 20), 5)
+        self.assertEqual(load.target_users(stages, 30), 0)
+
+    def test_only_local_servers(self):
+        """Test non loopback targets are refused"""
+        self.assertEqual(load.check_local('http://127.0.0.1:8000'),
+                         ('127.0.0.1', 8000))
+        with self.assertRaises(ValueError):
+            load.check_local('http://10.1.2.3:8000')
+        with self.assertRaises(ValueError):
+            load.check_local('https://127.0.0.1')
+
+
+class LoadRunTests(LiveServerTestCase):
+
+    def test_run_load(self):
+        """Test virtual users run the mix without errors"""
+        loop = asyncio.new_event_loop()
+        try:
+            summary = loop.run_until_complete(load.run_load(
+                self.live_server_url, [(2, 1.5)], load.MIXES['mixed'],
+                think=0.01, seed=1
+            ))
+        finally:
+            loop.close()
+
+        self.assertEqual(summary['errors'], 0, summary['error_samples'])
+        self.assertIn('login', summary['actions'])
+        self.assertGreater(summary['actions']['create']['requests'], 0)
+        self.assertGreater(summary['throughput_rps'], 0)
@@ -0,0 +1,95 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.metrics import Histogram, registry
+
+
+class MetricsTests(TestCase):
+    """Tests for the request metrics middleware and endpoint"""
+
+    def setUp(self) -> None:
+        registry.reset()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@teamalif.com',
+            password='testpass123',
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_header(self):
+        """Test responses report database and render timings"""
+        res = self.client.get(reverse('recipe:recipe-list'))
+
+        self.assertIn('db;dur=', res['Server-Timing'])
+        self.assertIn('render;dur=', res['Server-Timing'])
+        self.assertIn('total;dur=', res['Server-Timing'])
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.0/8'])
+    def test_metrics_endpoint(self):
+        """Test requests are exposed per route in Prometheus format"""
+        self.client.get(reverse('recipe:recipe-list'))
+        self.client.get(reverse('recipe:recipe-list'))
+
+        res = self.client.get(reverse('metrics'))
+        body = res.content.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(
+            'http_requests_total{route="recipe:recipe-list",'
+            'method="GET",status="200"} 2',
+            body
+        )
+        self.assertIn(
+            'http_request_queries_count{route="recipe:recipe-list",'
+            'method="GET"} 2',
+            body
+        )
+
+    def test_metrics_forbidden(self):
+        """Test clients neither allowed nor sending the token are refused"""
+        res = self.client.get(reverse('metrics'))
+
+        self.assertEqual(res.status_code, 403)
+
+        with override_settings(METRICS_TOKEN='secret',
+                               METRICS_ALLOWED_IPS=['10.0.0.0/8']):
+            res = self.client.get(reverse('metrics'),
+                                  HTTP_AUTHORIZATION='Bearer wrong')
+
+        self.assertEqual(res.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """Test scrapers sending the bearer token are served"""
+        res = self.client.get(reverse('metrics'),
+                              HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(res.status_code, 200)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.0/8'])
+    def test_unknown_methods_share_a_series(self):
+        """Test verbs outside the known methods are counted as other"""
+        for method in ('BREW', 'PROPFIND', 'X-' * 50):
+            self.client.generic(method, reverse('recipe:recipe-list'))
+
+        body = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn(
+            'http_requests_total{route="recipe:recipe-list",'
+            'method="other",status="405"} 3',
+            body
+        )
+        self.assertNotIn('BREW', body)
+
+    def test_histogram_buckets_cumulative(self):
+        """Test histogram buckets count every value at or below the bound"""
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 9):
+            histogram.observe(value)
+
+        self.assertEqual(list(histogram.buckets()),
+                         [(1, 2), (5, 3), ('+Inf', 4)])
+        self.assertEqual(histogram.sum, 13)
@@ -1,6 +1,7 @@
 from unittest.mock import patch
 
 
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from core import models
@@ -69,6 +70,32 @@ class ModelTest(TestCase):
 
         self.assertEqual(str(ingredient), ingredient.name)
 
+    def test_tag_name_unique_per_user_ignoring_case(self):
+        """
+            Test a user can't have two tags differing only in case
+        """
+        user = self.sample_user()
+        models.Tag.objects.create(user=user, name='Vegan')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            models.Tag.objects.create(user=user, name='VEGAN')
+
+    def test_get_or_create_names(self):
+        """
+            Test resolving names creates only the missing objects
+        """
+        user = self.sample_user()
+        carrot = models.Ingredient.objects.create(user=user, name='Carrot')
+
+        objects = models.Ingredient.objects.get_or_create_names(
+            user, ['carrot', 'Salt', 'salt']
+        )
+
+        self.assertEqual(set(objects), {'carrot', 'salt'})
+        self.assertEqual(objects['carrot'].id, carrot.id)
+        self.assertEqual(objects['salt'].name, 'Salt')
+        self.assertEqual(models.Ingredient.objects.count(), 2)
+
     def test_recipe_str(self):
         """
             Test string representation of recipe model
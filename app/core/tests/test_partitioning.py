@@ -0,0 +1,109 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import partitioning
+from core.models import Recipe, Tag
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+
+
+class PartitioningTests(TransactionTestCase):
+    """Test the recipe API on hash partitioned recipe tables"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@teamalif.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Curry', time_minutes=5, price=1
+        )
+        self.recipe.tags.add(self.tag)
+
+        with connection.schema_editor() as editor:
+            partitioning.partition_recipes(editor, Recipe, 4)
+        self.addCleanup(self.restore)
+
+    def unpartition(self):
+        with connection.schema_editor() as editor:
+            partitioning.unpartition_recipes(editor, Recipe)
+
+    def restore(self):
+        """
+        Leaves the tables as the migrations made them for the other tests
+        """
+        self.unpartition()
+        if settings.RECIPE_PARTITIONS:
+            with connection.schema_editor() as editor:
+                partitioning.partition_recipes(editor, Recipe,
+                                               settings.RECIPE_PARTITIONS)
+
+    def test_tables_partitioned(self):
+        """Test the recipe tables are split with their rows kept"""
+        for table in partitioning.partition_keys(Recipe):
+            self.assertTrue(partitioning.is_partitioned(connection, table))
+
+        self.assertEqual(
+            list(Recipe.objects.values_list('title', 'tags__name')),
+            [('Curry', 'Vegan')]
+        )
+
+    def test_recipe_api(self):
+        """Test recipes are created, read and deleted through the API"""
+        res = self.client.post(RECIPE_URL, {
+            'title': 'Soup', 'time_minutes': 10, 'price': '3.00',
+            'tags': [self.tag.id],
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertGreater(res.data['id'], self.recipe.id)
+
+        res = self.client.get(RECIPE_URL, {'tags': self.tag.id})
+        self.assertEqual([r['title'] for r in res.data], ['Soup', 'Curry'])
+
+        url = reverse('recipe:recipe-detail', args=[self.recipe.id])
+        self.assertEqual(self.client.delete(url).status_code,
+                         status.HTTP_204_NO_CONTENT)
+        self.assertFalse(
+            Recipe.tags.through.objects.filter(
+                recipe_id=self.recipe.id
+            ).exists()
+        )
+
+    def test_list_reads_one_partition(self):
+        """Test the recipe list is pruned to the partition of the user"""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(RECIPE_URL)
+        sql = next(query['sql'] for query in queries
+                   if query['sql'].startswith('SELECT "core_recipe"'))
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}')
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        self.assertEqual(len(set(re.findall(r'core_recipe_p\d', plan))), 1)
+
+    def test_unpartition(self):
+        """Test the plain tables come back with their foreign keys"""
+        self.unpartition()
+
+        self.assertFalse(partitioning.is_partitioned(connection,
+                                                     'core_recipe'))
+        with connection.cursor() as cursor:
+            cursor.execute(partitioning.REFERENCES_SQL, ['core_recipe'])
+            self.assertEqual(
+                sorted(table for table, _ in cursor.fetchall()),
+                ['core_recipe_ingredients', 'core_recipe_tags']
+            )
@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.models import Tag
+from core.query_inspector import QueryInspectorMiddleware, \
+                                 QueryInspectorTestMixin, inspect_queries, \
+                                 normalize_sql
+
+
+def sleep(seconds):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_sleep(%s)', [seconds])
+
+
+class QueryInspectorTests(QueryInspectorTestMixin, TestCase):
+    """Tests for the N+1 and slow query detector"""
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(
+            email='test@teamalif.com',
+            password='testpass123',
+        )
+
+    def test_normalize_sql(self):
+        """Test literals and IN lists don't change the shape"""
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE id IN (%s, %s) AND x = 'a'"),
+            normalize_sql("SELECT * FROM t WHERE id IN (%s) AND x = 'bb'"),
+        )
+        self.assertEqual(
+            normalize_sql('SELECT  *\n FROM t WHERE id = 42'),
+            'SELECT * FROM t WHERE id = ?'
+        )
+
+    def test_repeated_shapes_reported_with_stack(self):
+        """Test per row queries are reported with the code issuing them"""
+        tags = [Tag(user=self.user, name=f'Tag {i}') for i in range(5)]
+        Tag.objects.bulk_create(tags)
+
+        with inspect_queries() as inspector:
+            for tag in Tag.objects.all():
+                tag.recipe_set.count()
+
+        repeated = inspector.repeated(threshold=3)
+        self.assertEqual(len(repeated), 1)
+        self.assertEqual(repeated[0].count, 5)
+        self.assertEqual(repeated[0].stack[-1].filename, __file__)
+
+    def test_mixin_fails_on_n_plus_one(self):
+        """Test the assertion fails when a shape repeats too often"""
+        with self.assertRaises(AssertionError):
+            with self.assertNoNPlusOne(threshold=1):
+                Tag.objects.filter(name='a').exists()
+                Tag.objects.filter(name='b').exists()
+
+    def test_slow_queries_timed(self):
+        """Test only the queries over the threshold are kept, timed"""
+        with inspect_queries(slow_ms=20) as inspector:
+            Tag.objects.exists()
+            sleep(0.05)
+
+        slow = inspector.slowest()
+        self.assertEqual(len(slow), 1)
+        self.assertIn('pg_sleep', slow[0].sql)
+        self.assertGreaterEqual(slow[0].duration_ms, 50)
+        self.assertEqual(slow[0].stack[-1].name, 'sleep')
+
+    @override_settings(QUERY_INSPECTOR_ENABLED=True,
+                       QUERY_INSPECTOR_SLOW_MS=20)
+    def test_middleware_logs_slow_queries(self):
+        """Test the middleware logs the slow queries of a request"""
+        def view(request):
+            sleep(0.05)
+            return HttpResponse()
+
+        middleware = QueryInspectorMiddleware(view)
+        with self.assertLogs('core.query_inspector', 'WARNING') as logs:
+            middleware(RequestFactory().get('/api/recipe/recipes/'))
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Slow query on GET /api/recipe/recipes/',
+                      logs.output[0])
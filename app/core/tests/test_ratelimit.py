@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import ratelimit
+from core.models import Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+
+def rates(**scopes):
+    return {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+        'read': '100/min', 'write': '100/min', 'upload': '100/min', **scopes
+    }}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class BucketTests(TestCase):
+    """Test the token buckets"""
+
+    def setUp(self):
+        self.buckets = ratelimit.LocalBuckets()
+        self.buckets.clock = self.clock = FakeClock()
+
+    def take(self, key='client'):
+        # 3 tokens, one more every 10 seconds
+        return self.buckets.take(key, 10, 3)
+
+    def test_burst_then_refill(self):
+        """Test a full bucket lets a burst through, then one request per
+        refill"""
+        self.assertEqual([self.take()[:2] for _ in range(3)],
+                         [(True, 2), (True, 1), (True, 0)])
+
+        allowed, remaining, reset, wait = self.take()
+        self.assertFalse(allowed)
+        self.assertEqual((remaining, reset, wait), (0, 30, 10))
+
+        self.clock.now += 10
+        self.assertTrue(self.take()[0])
+        self.assertFalse(self.take()[0])
+
+    def test_clients_apart(self):
+        """Test every client has its own bucket"""
+        for _ in range(3):
+            self.take('client')
+
+        self.assertTrue(self.take('other')[0])
+
+    def test_full_buckets_swept(self):
+        """Test buckets that filled up again are dropped"""
+        self.buckets.SWEEP_EVERY = 2
+        self.take('client')
+        self.clock.now += 30
+        self.take('other')
+
+        self.assertEqual(list(self.buckets._full_at), ['other'])
+
+    def test_cache_buckets(self):
+        """Test the buckets kept in the cache"""
+        cache.clear()
+        buckets = ratelimit.CacheBuckets()
+        buckets.clock = clock = FakeClock()
+
+        results = [buckets.take('client', 10, 2)[0] for _ in range(3)]
+        clock.now += 10
+
+        self.assertEqual(results, [True, True, False])
+        self.assertTrue(buckets.take('client', 10, 2)[0])
+
+
+class RateLimitApiTests(TestCase):
+    """Test the rate limits of the API"""
+
+    def setUp(self):
+        ratelimit.local_buckets.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@teamalif.com',
+            'testpass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    @override_settings(REST_FRAMEWORK=rates(read='2/min'))
+    def test_reads_limited(self):
+        """Test reads over the budget are rejected with Retry-After"""
+        first = self.client.get(RECIPES_URL)
+        self.client.get(RECIPES_URL)
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(first['RateLimit-Limit'], '2')
+        self.assertEqual(first['RateLimit-Remaining'], '1')
+        self.assertEqual(first['RateLimit-Policy'], '2;w=60')
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '30')
+        self.assertEqual(res['RateLimit-Remaining'], '0')
+
+    @override_settings(REST_FRAMEWORK=rates(read='1/min', write='1/min'))
+    def test_budgets_per_scope_and_token(self):
+        """Test reads, writes and other tokens have their own budgets"""
+        self.client.get(RECIPES_URL)
+
+        res = self.client.post(RECIPES_URL, {
+            'title': 'Curry', 'time_minutes': 5, 'price': '1.00'
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        other = get_user_model().objects.create_user('other@teamalif.com',
+                                                     'testpass')
+        client = APIClient()
+        client.force_authenticate(other)
+        self.assertEqual(client.get(RECIPES_URL).status_code,
+                         status.HTTP_200_OK)
+
+    @override_settings(REST_FRAMEWORK=rates(upload='1/min'))
+    def test_uploads_limited(self):
+        """Test image uploads have the upload budget"""
+        recipe = Recipe.objects.create(user=self.user, title='Curry',
+                                       time_minutes=5, price=1)
+        url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+
+        self.client.post(url, {'image': 'notimage'})
+        res = self.client.post(url, {'image': 'notimage'})
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.client.get(RECIPES_URL).status_code,
+                         status.HTTP_200_OK)
+
+    @override_settings(REST_FRAMEWORK=rates(write='1/min'))
+    def test_anonymous_per_ip(self):
+        """Test anonymous clients are limited per IP address"""
+        client = APIClient()
+        payload = {'email': 'test@teamalif.com', 'password': 'testpass'}
+
+        client.post(TOKEN_URL, payload, REMOTE_ADDR='10.0.0.1')
+        limited = client.post(TOKEN_URL, payload, REMOTE_ADDR='10.0.0.1')
+        other = client.post(TOKEN_URL, payload, REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(limited.status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(other.status_code, status.HTTP_200_OK)
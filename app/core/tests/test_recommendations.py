@@ -0,0 +1,106 @@
+import random
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import _create_cache, cache
+from django.test import TransactionTestCase, override_settings
+
+from core import recommendations
+from core.models import Ingredient, Recipe, Tag
+
+
+class RecommendationsTests(TransactionTestCase):
+    """Test the cached recipe neighbors"""
+
+    def setUp(self):
+        cache.clear()
+        self.random = random.Random(7)
+        self.user = get_user_model().objects.create_user(
+            'test@teamalif.com',
+            'testpass'
+        )
+        self.tags = [Tag.objects.create(user=self.user, name=f'Tag {n}')
+                     for n in range(6)]
+        self.ingredients = [
+            Ingredient.objects.create(user=self.user, name=f'Ingredient {n}')
+            for n in range(6)
+        ]
+        self.recipes = [
+            Recipe.objects.create(user=self.user, title=f'Recipe {n}',
+                                  time_minutes=5, price=1)
+            for n in range(20)
+        ]
+        for recipe in self.recipes:
+            recipe.tags.set(self.random.sample(self.tags, 2))
+            recipe.ingredients.set(self.random.sample(self.ingredients, 2))
+
+    def cached(self):
+        return recommendations.cached(
+            self.user.id, [recipe.id for recipe in self.recipes]
+        )
+
+    def test_updates_match_rebuild(self):
+        """Test incremental updates keep the neighbors a rebuild finds"""
+        recommendations.neighbors(self.recipes[0])
+
+        for _ in range(30):
+            recipe = self.random.choice(self.recipes)
+            change = self.random.randrange(3)
+            if change == 0:
+                recipe.tags.set(self.random.sample(self.tags, 2))
+            elif change == 1:
+                self.random.choice(self.ingredients).recipe_set.add(recipe)
+            else:
+                recipe.ingredients.clear()
+
+            self.assertEqual(self.cached(),
+                             recommendations.build(self.user.id))
+
+    def test_updates_reach_other_processes(self):
+        """Test neighbors updated through one cache instance are shared"""
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        backend = 'django.core.cache.backends.filebased.FileBasedCache'
+        # a cache instance per process, sharing the files like memcached
+        reader = _create_cache(backend, LOCATION=location)
+        writer = _create_cache(backend, LOCATION=location)
+
+        with patch('core.recommendations.cache', reader):
+            recommendations.neighbors(self.recipes[0])
+        with patch('core.recommendations.cache', writer):
+            self.recipes[0].tags.set(self.tags[:3])
+        with patch('core.recommendations.cache', reader):
+            self.assertEqual(self.cached(),
+                             recommendations.build(self.user.id))
+
+    def test_bulk_changes_rebuilt(self):
+        """Test changing many recipes at once drops the neighbors"""
+        recommendations.neighbors(self.recipes[0])
+
+        recommendations.update(self.user.id, range(
+            recommendations.MAX_UPDATED + 1
+        ))
+
+        self.assertIsNone(self.cached())
+
+    def test_evicted_recipe_computed_alone(self):
+        """Test a recipe whose neighbors were evicted gets them again"""
+        recommendations.neighbors(self.recipes[0])
+        version = cache.get(
+            recommendations.VERSION_KEY.format(self.user.id)
+        )
+        recipe = self.recipes[3]
+        cache.delete(recommendations.NEIGHBORS_KEY.format(
+            self.user.id, version, recipe.id
+        ))
+
+        self.assertEqual(recommendations.neighbors(recipe),
+                         recommendations.build(self.user.id)[recipe.id])
+        self.assertEqual(self.cached(), recommendations.build(self.user.id))
+
+    @override_settings(RECOMMENDATIONS_TOP_K=10 ** 6)
+    def test_top_k_capped(self):
+        """Test the neighbors kept per recipe are capped"""
+        self.assertEqual(recommendations.top_k(), recommendations.MAX_TOP_K)
@@ -0,0 +1,167 @@
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import routers
+from core.models import Recipe
+from core.test_runner import TEST_REPLICA
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+SYNC_URL = reverse('recipe:sync')
+
+
+@override_settings(DATABASE_REPLICAS=[TEST_REPLICA])
+class ReplicaRoutingTests(TestCase):
+    """Test reads of the recipe API against a second local database"""
+    databases = {'default', TEST_REPLICA}
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@teamalif.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        # the "replica" has the user and a recipe the primary doesn't have
+        get_user_model().objects.using(TEST_REPLICA).bulk_create(
+            [get_user_model()(id=self.user.id, email=self.user.email)]
+        )
+        Recipe.objects.using(TEST_REPLICA).bulk_create([
+            Recipe(user_id=self.user.id, title='Replicated', time_minutes=5,
+                   price=1)
+        ])
+
+    def titles(self):
+        res = self.client.get(RECIPE_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe['title'] for recipe in res.data]
+
+    def test_reads_use_replica(self):
+        """Test safe requests read from the replica"""
+        self.assertEqual(self.titles(), ['Replicated'])
+
+    def test_writes_pin_user_to_primary(self):
+        """Test users read their own writes from the primary"""
+        res = self.client.post(RECIPE_URL, {
+            'title': 'Fresh', 'time_minutes': 5, 'price': '2.00'
+        })
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(
+            Recipe.objects.using(TEST_REPLICA).filter(title='Fresh').exists()
+        )
+
+        self.assertEqual(self.titles(), ['Fresh'])
+
+        cache.clear()
+        self.assertEqual(self.titles(), ['Replicated'])
+
+    def test_lagging_replica_skipped(self):
+        """Test reads fall back to the primary when replicas lag"""
+        with patch.object(routers.selector, 'measure_lag', return_value=60):
+            routers.selector._lags.clear()
+            self.assertEqual(self.titles(), [])
+        routers.selector._lags.clear()
+
+    def test_replica_picked_once_per_request(self):
+        """Test all the reads of a request go to the replica picked first"""
+        with patch.object(routers.selector, 'select',
+                          wraps=routers.selector.select) as select, \
+                CaptureQueriesContext(connections[TEST_REPLICA]) as queries:
+            self.titles()
+
+        self.assertEqual(select.call_count, 1)
+        self.assertGreater(len(queries), 1)
+
+    def test_other_reads_use_primary(self):
+        """Test reads outside the recipe API stay on the primary"""
+        self.assertFalse(
+            Recipe.objects.filter(title='Replicated').exists()
+        )
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        """Test the router leaves reads alone without replicas"""
+        with routers.replica_reads():
+            self.assertIsNone(routers.ReplicaRouter().db_for_read(Recipe))
+
+
+@override_settings(DATABASE_REPLICAS=[TEST_REPLICA])
+class ReplicaSyncTests(TransactionTestCase):
+    """Test the sync of offline clients against a second local database"""
+    databases = {'default', TEST_REPLICA}
+    # the change feed waits for the transactions of every database
+    run_serially = True
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@teamalif.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        get_user_model().objects.using(TEST_REPLICA).bulk_create(
+            [get_user_model()(id=self.user.id, email=self.user.email)]
+        )
+        Recipe.objects.using(TEST_REPLICA).bulk_create([
+            Recipe(user_id=self.user.id, title='Replicated', time_minutes=5,
+                   price=1)
+        ])
+
+    def pull(self):
+        res = self.client.get(SYNC_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [recipe['title'] for recipe in res.data['recipes']]
+
+    def test_pull_after_push_reads_primary(self):
+        """Test a pull right after a push sees the pushed changes"""
+        self.assertEqual(self.pull(), ['Replicated'])
+
+        res = self.client.post(SYNC_URL, {'token': 0, 'changes': [
+            {'model': 'recipes', 'action': 'create',
+             'data': {'title': 'Fresh', 'time_minutes': 5, 'price': '2.00',
+                      'tags': [], 'ingredients': []}}
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'][0]['status'], 'applied')
+        self.assertEqual(self.pull(), ['Fresh'])
+
+
+class ReplicaSelectorTests(TestCase):
+
+    def setUp(self):
+        self.selector = routers.ReplicaSelector()
+        self.lags = {'replica_1': 0.5, 'replica_2': 0.1, 'replica_3': None}
+        self.selector.measure_lag = self.lags.get
+
+    def test_round_robin(self):
+        """Test replicas take turns, skipping the unhealthy ones"""
+        replicas = ['replica_1', 'replica_2', 'replica_3']
+
+        picked = [self.selector.select(replicas) for _ in range(4)]
+
+        self.assertEqual(
+            picked, ['replica_1', 'replica_2', 'replica_1', 'replica_1']
+        )
+
+    @override_settings(DATABASE_REPLICA_SELECTION='least_lag')
+    def test_least_lag(self):
+        """Test the least lagging replica is picked"""
+        self.assertEqual(
+            self.selector.select(['replica_1', 'replica_2']), 'replica_2'
+        )
+
+    def test_no_healthy_replica(self):
+        """Test the primary is used without a healthy replica"""
+        self.assertEqual(self.selector.select(['replica_3']), 'default')
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TransactionTestCase
+
+from core import storage
+from core.models import Recipe, StoredFile
+
+
+class ContentNameTests(TransactionTestCase):
+
+    def test_content_name_is_sharded(self):
+        """Test names keep the directory and extension, sharded by hash"""
+        digest = 'abcdef' + '0' * 58
+
+        name = storage.content_name('uploads/recipe/x.JPG', digest)
+
+        self.assertEqual(name, f'uploads/recipe/ab/cd/{digest}.jpg')
+
+
+class ContentAddressedStorageTests(TransactionTestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        media_root = self.settings(
+            MEDIA_ROOT=self.location,
+            RECIPE_IMAGE_STORAGE='core.storage.ContentAddressedStorage'
+        )
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.storage = storage.recipe_image_storage
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+
+    def test_identical_files_stored_once(self):
+        """Test identical uploads share one reference counted file"""
+        first = self.storage.save('uploads/a.jpg', ContentFile(b'image'))
+        second = self.storage.save('uploads/b.jpg', ContentFile(b'image'))
+        other = self.storage.save('uploads/c.jpg', ContentFile(b'other'))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(StoredFile.objects.get(name=first).refcount, 2)
+        with self.storage.open(first) as stored:
+            self.assertEqual(stored.read(), b'image')
+        self.assertEqual(os.listdir(self.storage.temp_dir), [])
+
+    def test_deleted_with_last_reference(self):
+        """Test a file is only deleted with its last reference"""
+        name = self.storage.save('uploads/a.jpg', ContentFile(b'image'))
+        self.storage.save('uploads/b.jpg', ContentFile(b'image'))
+
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_recipes_share_images(self):
+        """Test deleting a recipe keeps the image other recipes use"""
+        user = get_user_model().objects.create_user('test@teamalif.com',
+                                                    'testpass')
+        recipes = [
+            Recipe.objects.create(user=user, title='Tea', time_minutes=5,
+                                  price=1)
+            for _ in range(2)
+        ]
+        for recipe in recipes:
+            recipe.image.save('tea.jpg', ContentFile(b'image'))
+        name = recipes[0].image.name
+
+        recipes[0].delete()
+        self.assertTrue(self.storage.exists(name))
+
+        recipes[1].delete()
+        self.assertFalse(self.storage.exists(name))
+
+
+class S3ContentAddressedStorageTests(TransactionTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.storage = storage.S3ContentAddressedStorage(
+            bucket='images',
+            base_url='https://cdn.example.com/',
+            client=storage.LocalS3Client(self.root),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_store_and_delete(self):
+        """Test the S3 storage against the local stand-in"""
+        name = self.storage.save('uploads/a.png', ContentFile(b'image'))
+        self.assertEqual(name, self.storage.save('uploads/b.png',
+                                                 ContentFile(b'image')))
+
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), 5)
+        self.assertEqual(self.storage.open(name).read(), b'image')
+        self.assertEqual(self.storage.url(name),
+                         f'https://cdn.example.com/{name}')
+
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+
+
+class MemoryContentAddressedStorageTests(TransactionTestCase):
+
+    def test_store_and_delete(self):
+        """Test the in-memory storage of the fast test profile"""
+        memory = storage.MemoryContentAddressedStorage(base_url='/media/')
+        name = memory.save('uploads/a.png', ContentFile(b'image'))
+        self.assertEqual(name, memory.save('uploads/b.png',
+                                           ContentFile(b'image')))
+
+        self.assertEqual(memory.open(name).read(), b'image')
+        self.assertEqual(memory.url(name), f'/media/{name}')
+
+        memory.delete(name)
+        self.assertTrue(memory.exists(name))
+        memory.delete(name)
+        self.assertFalse(memory.exists(name))
+        self.assertEqual(memory.blobs, {})
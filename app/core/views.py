@@ -0,0 +1,20 @@
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+
+from core import jobs
+from core.metrics import registry, scrape_allowed
+
+
+@require_GET
+def metrics(request):
+    """
+    Exposes the request metrics and the job queue depth for Prometheus to
+    scrape, to the clients allowed by METRICS_ALLOWED_IPS and METRICS_TOKEN
+    """
+    if not scrape_allowed(request.META.get('REMOTE_ADDR'),
+                          request.META.get('HTTP_AUTHORIZATION')):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render() + jobs.render_queue(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,113 @@
+"""
+Async versions of the recipe list, detail and image upload endpoints, served
+by core.asgi.AsyncViewsHandler under ASGI. They go through RecipeViewSet for
+authentication, permissions, filtering and serialization, and the handler
+runs the function they return within the Django middleware, so both versions
+behave the same; only the blocking work runs in the bounded thread pool.
+"""
+from functools import partial
+
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.asgi import db_sync_to_async, read_body
+
+from .views import RecipeViewSet
+
+
+def _viewset(request, action, **kwargs):
+    """
+    Returns a RecipeViewSet set up for the request like its dispatch() does,
+    with the attributes the router sets for the action
+    """
+    initkwargs = getattr(getattr(RecipeViewSet, action), 'kwargs', {})
+    view = RecipeViewSet(action_map={request.method.lower(): action},
+                         args=(), kwargs=kwargs, format_kwarg=None,
+                         **initkwargs)
+    view.request = view.initialize_request(request, **kwargs)
+    view.headers = view.default_response_headers
+    return view
+
+
+def _finalize(view, response):
+    return view.finalize_response(view.request, response).render()
+
+
+def _dispatch(request, action, **kwargs):
+    """
+    Runs one action of the viewset and returns the rendered response
+    """
+    view = _viewset(request, action, **kwargs)
+    try:
+        view.initial(view.request, **kwargs)
+        response = getattr(view, action)(view.request, **kwargs)
+    except Exception as exc:
+        response = view.handle_exception(exc)
+    return _finalize(view, response)
+
+
+async def recipe_list(request):
+    return partial(_dispatch, action='list')
+
+
+async def recipe_detail(request, pk):
+    return partial(_dispatch, action='retrieve', pk=pk)
+
+
+def _authorize_upload(request, pk):
+    """
+    Returns (view, recipe, None) if the user may upload an image for the
+    recipe, (view, None, error response) otherwise
+    """
+    view = _viewset(request, 'upload_image', pk=pk)
+    try:
+        view.initial(view.request, pk=pk)
+        return view, view.get_object(), None
+    except Exception as exc:
+        return view, None, _finalize(view, view.handle_exception(exc))
+
+
+def _save_upload(view, recipe, request):
+    """
+    Parses the multipart body and verifies the image, then stores the file
+    and saves the recipe in one transaction: the storage counts the
+    references of the file in the database, they are rolled back with a
+    failed save
+    """
+    serializer = view.get_serializer(recipe, data=view.request.data)
+    if not serializer.is_valid():
+        return _finalize(view, Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        ))
+    image = serializer.validated_data['image']
+    with transaction.atomic():
+        recipe.image.save(image.name, image, save=False)
+        recipe.save(update_fields=['image'])
+    return _finalize(view, Response(
+        view.get_serializer(recipe).data,
+        status=status.HTTP_200_OK
+    ))
+
+
+async def upload_image(request, pk):
+    """
+    Checks the token and the recipe before receiving the upload, then keeps
+    a thread only while parsing, writing and saving the image
+    """
+    view, recipe, error = await db_sync_to_async(_authorize_upload)(
+        request, pk
+    )
+    if error is not None:
+        return lambda request: error
+
+    await read_body(request)
+    return partial(_save_upload, view, recipe)
+
+
+VIEWS = {
+    ('recipe:recipe-list', 'GET'): recipe_list,
+    ('recipe:recipe-detail', 'GET'): recipe_detail,
+    ('recipe:recipe-upload-image', 'POST'): upload_image,
+}
@@ -0,0 +1,38 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Recipe
+from recipe import transfer
+
+
+class Command(BaseCommand):
+    """Django command to export a user's recipes as NDJSON or CSV"""
+    help = "Exports the recipes of a user as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('--format', dest='fmt', choices=transfer.FORMATS,
+                            default=transfer.NDJSON)
+        parser.add_argument('--output', default='-',
+                            help="File to write to, '-' for stdout")
+        parser.add_argument('--chunk-size', type=int,
+                            default=transfer.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user with email {options['email']}")
+
+        lines = transfer.export_recipes(
+            Recipe.objects.filter(user=user),
+            options['fmt'],
+            options['chunk_size'],
+        )
+        if options['output'] == '-':
+            sys.stdout.writelines(lines)
+        else:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
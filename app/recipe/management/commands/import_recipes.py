@@ -0,0 +1,42 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from recipe import transfer
+
+
+class Command(BaseCommand):
+    """Django command to import recipes for a user from NDJSON or CSV"""
+    help = "Imports recipes for a user from an NDJSON or CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='fmt', choices=transfer.FORMATS,
+                            help="Defaults to the extension of the file")
+        parser.add_argument('--chunk-size', type=int,
+                            default=transfer.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(email=options['email'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user with email {options['email']}")
+
+        fmt = options['fmt'] or \
+            os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if fmt not in transfer.FORMATS:
+            raise CommandError("Unable to detect the format, use --format")
+
+        with open(options['path'], newline='', encoding='utf-8') as lines:
+            result = transfer.import_recipes(
+                user, lines, fmt, options['chunk_size']
+            )
+
+        for error in result['errors']:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} recipes, "
+            f"skipped {result['invalid']} invalid rows"
+        ))
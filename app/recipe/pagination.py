@@ -0,0 +1,16 @@
+from rest_framework.pagination import CursorPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+        Keyset pagination for recipes, only used when the client asks for
+        a page_size so plain list requests keep returning every recipe.
+        Pages follow the ordering chosen by the view, which always ends with
+        the id so rows with equal values keep a stable position
+    """
+    page_size = None
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        return view.get_ordering()
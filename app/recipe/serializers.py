@@ -1,9 +1,33 @@
+from django.utils.text import capfirst
+
 from rest_framework import serializers
 
-from core.models import Tag, Ingredient, Recipe
+from core.models import Tag, Ingredient, Recipe, UserStats, Change
+
+from . import sync
 
 
-class TagSerializer(serializers.ModelSerializer):
+class UniqueNameMixin:
+    """
+        Rejects names the current user already has, ignoring case
+    """
+    def validate_name(self, value):
+        user = self.context['request'].user
+        existing = self.Meta.model.objects.filter(
+            user=user,
+            name__iexact=value
+        )
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError(
+                f'{capfirst(self.Meta.model._meta.verbose_name)} with this '
+                f'name already exists'
+            )
+        return value
+
+
+class TagSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """
         Serializer for the Tag objects
     """
@@ -13,7 +37,7 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """
     Serializer for Ingredients
     """
@@ -23,6 +47,37 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class TagCountSerializer(TagSerializer):
+    """
+        Serializer for tags annotated with the number of recipes using them
+    """
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ('recipe_count',)
+
+
+class IngredientCountSerializer(IngredientSerializer):
+    """
+    Serializer for ingredients annotated with the number of recipes using them
+    """
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ('recipe_count',)
+
+
+class BulkNameSerializer(serializers.Serializer):
+    """
+        Serializer for a list of tag or ingredient names to resolve in bulk
+    """
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False,
+        max_length=1000
+    )
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """
         Serializer for the recipe objects
@@ -43,6 +98,8 @@ class RecipeSerializer(serializers.ModelSerializer):
             'link'
         )
         read_only_fields = ('id',)
+        # prices stay JSON numbers, the decimal keeps them exact in between
+        extra_kwargs = {'price': {'coerce_to_string': False}}
 
 
 class RecipeDetailSerializer(RecipeSerializer):
@@ -53,6 +110,66 @@ class RecipeDetailSerializer(RecipeSerializer):
     tags = TagSerializer(many=True, read_only=True)
 
 
+class SimilarRecipeSerializer(RecipeSerializer):
+    """
+        Serializer for a recipe similar to another one, with its similarity
+    """
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('similarity',)
+
+
+class SimilarQuerySerializer(serializers.Serializer):
+    """
+        Serializer for the query parameters of the similar recipes
+    """
+    limit = serializers.IntegerField(min_value=1, required=False)
+
+
+class DuplicateSerializer(serializers.Serializer):
+    """
+        Serializer for the options of a recipe copy, the copies share the
+        image of the recipe unless `share_image` is false
+    """
+    title = serializers.CharField(max_length=255, required=False)
+    share_image = serializers.BooleanField(default=True)
+
+
+class BulkDuplicateSerializer(serializers.Serializer):
+    """
+        Serializer for the recipes to copy at once
+    """
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1, max_length=100
+    )
+    share_image = serializers.BooleanField(default=True)
+
+
+class RecipeImportSerializer(serializers.ModelSerializer):
+    """
+        Serializer to validate imported recipes, tags and ingredients are
+        given by name instead of id
+    """
+    ingredients = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False,
+        default=list
+    )
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        required=False,
+        default=list
+    )
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'title', 'ingredients', 'tags', 'time_minutes', 'price', 'link'
+        )
+
+
 class ImageUploadSerializer(serializers.ModelSerializer):
     """
         Serializer to upload an image to the recipe object
@@ -61,3 +178,100 @@ class ImageUploadSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ('id', 'image')
         read_only_fields = ('id',)
+
+
+class UserStatsSerializer(serializers.ModelSerializer):
+    """
+        Serializer for the per user summary counters
+    """
+    time_minutes_avg = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = UserStats
+        fields = (
+            'recipe_count', 'tag_count', 'ingredient_count',
+            'time_minutes_avg', 'price_min', 'price_max', 'tag_usage'
+        )
+        read_only_fields = fields
+        extra_kwargs = {
+            'price_min': {'coerce_to_string': False},
+            'price_max': {'coerce_to_string': False},
+        }
+
+
+class ChangeSerializer(serializers.ModelSerializer):
+    """
+        Serializer for the entries of the change feed
+    """
+    class Meta:
+        model = Change
+        fields = ('seq', 'model', 'action', 'object_id', 'user_id',
+                  'created')
+        read_only_fields = fields
+
+
+class ChangeQuerySerializer(serializers.Serializer):
+    """
+        Serializer for the query parameters of the change feed
+    """
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000,
+                                     default=100)
+
+
+class SyncQuerySerializer(serializers.Serializer):
+    """
+        Serializer for the query parameters of a sync pull, everything is
+        pulled without a token, page by page with the cursors of the pages
+    """
+    token = serializers.IntegerField(min_value=0, required=False)
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000,
+                                     default=500)
+
+    def validate_cursor(self, value):
+        try:
+            name = sync.parse_cursor(value)[1]
+        except ValueError:
+            raise serializers.ValidationError('Not a sync cursor')
+        if name not in ('tags', 'ingredients', 'recipes'):
+            raise serializers.ValidationError('Not a sync cursor')
+        return value
+
+    def validate(self, attrs):
+        if 'token' in attrs and 'cursor' in attrs:
+            raise serializers.ValidationError(
+                'The cursor pages the pull without a token'
+            )
+        return attrs
+
+
+class SyncChangeSerializer(serializers.Serializer):
+    """
+        Serializer for one client change of a sync push, `data` is checked
+        by the serializer of the object
+    """
+    model = serializers.ChoiceField(choices=('tags', 'ingredients',
+                                             'recipes'))
+    action = serializers.ChoiceField(choices=sync.ACTIONS)
+    id = serializers.IntegerField(required=False)
+    data = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        if attrs['action'] != sync.CREATE and 'id' not in attrs:
+            raise serializers.ValidationError(
+                {'id': 'Required to update or delete'}
+            )
+        return attrs
+
+
+class SyncPushSerializer(serializers.Serializer):
+    """
+        Serializer for the client changes of a sync push
+    """
+    token = serializers.IntegerField(min_value=0)
+    changes = serializers.ListField(
+        child=SyncChangeSerializer(),
+        allow_empty=False,
+        max_length=500
+    )
@@ -0,0 +1,187 @@
+"""
+Delta sync of a user's recipes, tags and ingredients for offline clients.
+
+The sync token is a number of the change feed (core.models.Change). pull()
+returns the objects changed after it as they are now and the ids of the
+deleted ones as tombstones, for a batch of at most `limit` changes at a
+time. Without a token it pages through everything the user has, `limit`
+objects at a time in id order, each page with the cursor of the next one;
+the last page hands out the token of the end of the feed as it was before
+the first page, so what changed while paging is pulled again as a delta.
+
+push() applies a batch of client changes through the viewsets of the API,
+so they are validated, scoped to the user and recorded like any API write.
+An update or delete of an object changed on the server after the client's
+token is a conflict, changes applied by the same batch aside: it isn't
+applied and the current object is returned for the client to merge. The
+token to pull from next is moved past the batch's own changes when nothing
+else of the user changed since the client's token.
+
+Both work with {name: viewset} of the synced objects, the viewsets being
+set up for the request, see SyncApiView.
+"""
+from django.db import transaction
+
+from core.models import Change
+
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+ACTIONS = (CREATE, UPDATE, DELETE)
+# the viewset action needed for every action, clients can't change what
+# the API doesn't let them change
+VIEWSET_ACTIONS = {
+    CREATE: 'create',
+    UPDATE: 'partial_update',
+    DELETE: 'destroy',
+}
+
+APPLIED = 'applied'
+CONFLICT = 'conflict'
+INVALID = 'invalid'
+
+
+def _model(view):
+    return view.get_queryset().model
+
+
+def make_cursor(head, name, after):
+    """
+    Returns the cursor of a snapshot page: the objects of `name` with ids
+    after `after`, then the ones of the next names, up to the feed entry
+    numbered head
+    """
+    return f'{head}:{name}:{after}'
+
+
+def parse_cursor(cursor):
+    """
+    Returns (head, name, after) of a cursor, ValueError if it isn't one
+    """
+    head, name, after = cursor.split(':')
+    return int(head), name, int(after)
+
+
+def snapshot(views, limit, cursor=None):
+    """
+    Returns a page of at most `limit` objects of everything, by name, from
+    the cursor on. The last page has the token to send next, the others
+    the cursor of the next page and more set
+    """
+    if cursor is None:
+        # taken first, changes made while paging are pulled again later
+        head, start, after = Change.objects.head(), next(iter(views)), 0
+    else:
+        head, start, after = parse_cursor(cursor)
+    names = list(views)
+    result = {name: [] for name in names}
+    result['deleted'] = {name: [] for name in names}
+
+    left = limit
+    for name in names[names.index(start):]:
+        view = views[name]
+        objects = list(view.get_queryset().filter(pk__gt=after)
+                       .order_by('pk')[:left + 1])
+        if len(objects) > left:
+            objects = objects[:left]
+            if objects:
+                after = objects[-1].pk
+            result[name] = view.get_serializer(objects, many=True).data
+            result.update(cursor=make_cursor(head, name, after), more=True)
+            return result
+        result[name] = view.get_serializer(objects, many=True).data
+        left -= len(objects)
+        after = 0
+
+    result.update(token=head, more=False)
+    return result
+
+
+def pull(views, user, token=None, limit=500, cursor=None):
+    """
+    Returns the objects changed after the token, by name, with the deleted
+    ids under 'deleted', the token to send next and whether more changes
+    wait. Without a token it returns the snapshot page of the cursor
+    """
+    if token is None:
+        return snapshot(views, limit, cursor)
+
+    changes = list(Change.objects.since(token, limit + 1, user_id=user.pk))
+    more = len(changes) > limit
+    changes = changes[:limit]
+    changed = {}
+    for change in changes:
+        changed.setdefault(change.model, set()).add(change.object_id)
+
+    result = {'deleted': {}}
+    for name, view in views.items():
+        ids = changed.get(_model(view)._meta.model_name, set())
+        objects = list(view.get_queryset().filter(pk__in=ids)) if ids \
+            else []
+        result[name] = view.get_serializer(objects, many=True).data
+        result['deleted'][name] = sorted(ids - {obj.pk for obj in objects})
+    result.update(token=changes[-1].seq if changes else token, more=more)
+    return result
+
+
+def _apply(view, token, change, own_txids):
+    """
+    Applies one client change, returns its result. Changes recorded by the
+    transactions of own_txids don't conflict
+    """
+    if not hasattr(view, VIEWSET_ACTIONS[change['action']]):
+        return {'status': INVALID,
+                'errors': f"Can't {change['action']} {change['model']}"}
+    if change['action'] == CREATE:
+        serializer = view.get_serializer(data=change.get('data', {}))
+        if not serializer.is_valid():
+            return {'status': INVALID, 'errors': serializer.errors}
+        view.perform_create(serializer)
+        return {'status': APPLIED, 'id': serializer.instance.pk}
+
+    object_id = change['id']
+    # a concurrent write of the object commits before the check
+    instance = view.get_queryset().select_for_update(of=('self',)).filter(
+        pk=object_id
+    ).first()
+    if instance is None or \
+            Change.objects.changed_since(_model(view), object_id, token,
+                                         own_txids):
+        current = view.get_serializer(instance).data if instance else None
+        return {'status': CONFLICT, 'id': object_id, 'current': current}
+
+    if change['action'] == DELETE:
+        view.perform_destroy(instance)
+        return {'status': APPLIED, 'id': object_id}
+    serializer = view.get_serializer(instance, data=change.get('data', {}),
+                                     partial=True)
+    if not serializer.is_valid():
+        return {'status': INVALID, 'id': object_id,
+                'errors': serializer.errors}
+    view.perform_update(serializer)
+    return {'status': APPLIED, 'id': object_id}
+
+
+def push(views, user, token, changes):
+    """
+    Applies the client changes made since the token in their order, each on
+    its own. Returns their results in the same order and the token to pull
+    from next: the head of the feed if the user's changes after the token
+    are all the batch's own, the token given otherwise
+    """
+    results = []
+    own_txids = []
+    for index, change in enumerate(changes):
+        with transaction.atomic():
+            result = _apply(views[change['model']], token, change,
+                            own_txids)
+            if result['status'] == APPLIED:
+                own_txids.append(Change.objects.current_txid())
+        results.append({'index': index, **result})
+
+    head = Change.objects.head()
+    others = Change.objects.filter(
+        user_id=user.pk, seq__gt=token, seq__lte=head
+    ).exclude(txid__in=own_txids).exists()
+    return results, token if others else head
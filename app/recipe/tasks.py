@@ -0,0 +1,42 @@
+"""
+Background tasks of the recipe app, run by the worker command, see
+core.jobs
+"""
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from core import jobs
+from core.jobs import task
+from core.models import Recipe
+from core.storage import export_storage
+from recipe import transfer
+
+
+@task('export_recipes')
+def export_recipes(user_id, fmt=transfer.NDJSON):
+    """
+    Writes the user's recipes to a file of the export storage, downloaded
+    by the user through the job (user.views.JobFileView) until it is
+    deleted, EXPORT_RETENTION_SECONDS later
+    """
+    queryset = Recipe.objects.filter(user_id=user_id)
+    with tempfile.TemporaryFile('w+b') as temp:
+        for line in transfer.export_recipes(queryset, fmt):
+            temp.write(line.encode())
+        temp.seek(0)
+        name = export_storage().save(f'{uuid.uuid4()}.{fmt}', File(temp))
+    expires = timezone.now() + \
+        timedelta(seconds=settings.EXPORT_RETENTION_SECONDS)
+    jobs.enqueue('delete_export', run_at=expires, path=name)
+    return {'file': name, 'expires': expires.isoformat()}
+
+
+@task('delete_export')
+def delete_export(path):
+    export_storage().delete(path)
+    return {'deleted': path}
@@ -0,0 +1,218 @@
+import io
+import json
+import tempfile
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from PIL import Image
+
+from django.db import DatabaseError
+from django.test import TransactionTestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+
+from core.asgi import AsyncViewsHandler
+from core.metrics import registry
+from core.models import Recipe, StoredFile, Tag
+from core.testing import create_user, sample_recipe
+from recipe.async_views import VIEWS
+
+
+RECIPE_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+
+
+def image_upload_url(recipe_id):
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AsyncRecipeViewsTests(TransactionTestCase):
+    """Test the async recipe views served by the ASGI handler"""
+
+    def setUp(self):
+        self.application = AsyncViewsHandler(VIEWS)
+        self.user = create_user()
+        self.token = Token.objects.create(user=self.user)
+
+    def request(self, method, path, body=b'', content_type=None,
+                query_string=b'', token=True, send_body=True,
+                root_path=''):
+        """
+        Sends a request to the ASGI application, returns (status, body),
+        the response headers are kept in self.response_headers
+        """
+        headers = [(b'content-length', str(len(body)).encode())]
+        if content_type:
+            headers.append((b'content-type', content_type.encode()))
+        if token:
+            headers.append(
+                (b'authorization', f'Token {self.token.key}'.encode())
+            )
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'root_path': root_path,
+            'query_string': query_string,
+            'headers': headers,
+            'server': ('testserver', 80),
+        }
+
+        async def communicate():
+            communicator = ApplicationCommunicator(self.application, scope)
+            await communicator.send_input({
+                'type': 'http.request',
+                'body': body if send_body else b'',
+                'more_body': not send_body,
+            })
+            start = await communicator.receive_output(10)
+            self.response_headers = {
+                name.decode().lower(): value.decode()
+                for name, value in start['headers']
+            }
+            content = b''
+            while True:
+                message = await communicator.receive_output(10)
+                content += message.get('body', b'')
+                if not message.get('more_body', False):
+                    break
+            await communicator.wait()
+            return start['status'], content
+
+        return async_to_sync(communicate)()
+
+    def upload(self, recipe, image, **kwargs):
+        body = encode_multipart(BOUNDARY, {'image': image})
+        return self.request('POST', image_upload_url(recipe.id), body,
+                            content_type=MULTIPART_CONTENT, **kwargs)
+
+    def test_mounted_under_prefix(self):
+        """Test async routes resolve below the root path of the app"""
+        sample_recipe(self.user, title='Curry')
+
+        view, match = self.application.resolve_async({
+            'path': f'/prefix{RECIPE_URL}', 'root_path': '/prefix',
+            'method': 'GET',
+        })
+        status, content = self.request('GET', f'/prefix{RECIPE_URL}',
+                                       root_path='/prefix')
+
+        self.assertIsNotNone(view)
+        self.assertEqual(match.view_name, 'recipe:recipe-list')
+        self.assertEqual(status, 200)
+        self.assertEqual([r['title'] for r in json.loads(content)],
+                         ['Curry'])
+
+    def test_list_recipes(self):
+        """Test the async list filters like the viewset"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(self.user, title='Curry')
+        recipe.tags.add(tag)
+        sample_recipe(self.user, title='Steak')
+        other = create_user(email='other@teamalif.com')
+        sample_recipe(other)
+
+        status, content = self.request(
+            'GET', RECIPE_URL, query_string=f'tags={tag.id}'.encode()
+        )
+
+        self.assertEqual(status, 200, content)
+        self.assertEqual([r['title'] for r in json.loads(content)],
+                         ['Curry'])
+
+    def test_detail_requires_ownership(self):
+        """Test recipes of other users are not found"""
+        other = create_user(email='other@teamalif.com')
+        recipe = sample_recipe(other)
+        url = reverse('recipe:recipe-detail', args=[recipe.id])
+
+        status, _ = self.request('GET', url)
+        self.assertEqual(status, 404)
+
+        status, _ = self.request('GET', url, token=False)
+        self.assertEqual(status, 401)
+
+    def test_upload_image(self):
+        """Test uploading an image through the async view"""
+        recipe = sample_recipe(self.user)
+        image = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(image, format='JPEG')
+        image.name = 'image.jpg'
+        image.seek(0)
+
+        status, content = self.upload(recipe, image)
+
+        recipe.refresh_from_db()
+        self.assertEqual(status, 200, content)
+        self.assertIn('image', json.loads(content))
+        self.assertTrue(recipe.image.storage.exists(recipe.image.name))
+
+    def test_upload_failed_save_releases_file(self):
+        """Test the file reference is rolled back with a failed save"""
+        recipe = sample_recipe(self.user)
+        image = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(image, format='JPEG')
+        image.name = 'image.jpg'
+        image.seek(0)
+
+        with patch.object(Recipe, 'save', side_effect=DatabaseError):
+            status, _ = self.upload(recipe, image)
+
+        self.assertEqual(status, 500)
+        self.assertFalse(StoredFile.objects.filter(refcount__gt=0).exists())
+
+    def test_upload_invalid_image(self):
+        """Test an invalid image is rejected"""
+        recipe = sample_recipe(self.user)
+        image = io.BytesIO(b'noimage')
+        image.name = 'image.jpg'
+
+        status, _ = self.upload(recipe, image)
+
+        self.assertEqual(status, 400)
+
+    def test_upload_rejected_before_body(self):
+        """Test unauthenticated uploads are refused without the body"""
+        recipe = sample_recipe(self.user)
+        image = io.BytesIO(b'x' * 1024)
+        image.name = 'image.jpg'
+
+        status, _ = self.upload(recipe, image, token=False, send_body=False)
+
+        self.assertEqual(status, 401)
+
+    def test_other_routes_use_django_stack(self):
+        """Test endpoints without an async view are still served"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        status, content = self.request('GET', TAG_URL)
+
+        self.assertEqual(status, 200, content)
+        self.assertEqual(json.loads(content)[0]['name'], 'Vegan')
+
+    def test_same_middleware_as_django_stack(self):
+        """Test async responses get the headers of the Django middleware
+        and are recorded in the metrics"""
+        registry.reset()
+        sample_recipe(self.user)
+
+        status, _ = self.request('GET', RECIPE_URL)
+        res = self.client.get(RECIPE_URL,
+                              HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(set(self.response_headers),
+                         {name.lower() for name, _ in res.items()})
+        self.assertEqual(self.response_headers['x-content-type-options'],
+                         'nosniff')
+        self.assertIn('ratelimit-remaining', self.response_headers)
+        self.assertIn('server-timing', self.response_headers)
+        self.assertIn(
+            'http_requests_total{route="recipe:recipe-list",'
+            'method="GET",status="200"} 2',
+            registry.render()
+        )
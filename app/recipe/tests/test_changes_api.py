@@ -0,0 +1,117 @@
+import io
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Change, Tag, Ingredient
+from core.testing import create_user, sample_recipe
+
+
+CHANGES_URL = reverse('recipe:changes')
+
+
+class ChangeFeedApiTests(TransactionTestCase):
+    """Test the change feed of the recipes, tags and ingredients"""
+    # the change feed waits for the transactions of every database
+    run_serially = True
+
+    def setUp(self):
+        self.user = create_user()
+        self.admin = get_user_model().objects.create_superuser(
+            'admin@teamalif.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def changes(self, **params):
+        res = self.client.get(CHANGES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [
+            (change['model'], change['action'], change['object_id'])
+            for change in res.data['changes']
+        ]
+
+    def test_admin_required(self):
+        """Test the feed is only readable by staff users"""
+        self.client.force_authenticate(self.user)
+
+        res = self.client.get(CHANGES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_changes_in_order(self):
+        """Test saves, M2M changes and deletes are listed in order"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(tag)
+        recipe.title = 'Curry'
+        recipe.save()
+        tag_id = tag.id
+        tag.delete()
+
+        self.assertEqual(self.changes(), [
+            ('tag', 'created', tag_id),
+            ('recipe', 'created', recipe.id),
+            ('recipe', 'updated', recipe.id),
+            ('recipe', 'updated', recipe.id),
+            ('tag', 'deleted', tag_id),
+            ('recipe', 'updated', recipe.id),
+        ])
+
+    def test_batches(self):
+        """Test the feed is read in batches from the returned number"""
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=name)
+            for name in ('Salt', 'Pepper', 'Kale')
+        ]
+
+        res = self.client.get(CHANGES_URL, {'limit': 2})
+        self.assertTrue(res.data['more'])
+        res = self.client.get(CHANGES_URL, {'since': res.data['next']})
+
+        self.assertFalse(res.data['more'])
+        self.assertEqual([c['object_id'] for c in res.data['changes']],
+                         [ingredients[2].id])
+
+    def test_uncommitted_changes_held_back(self):
+        """Test changes are only numbered once their transaction is over"""
+        with transaction.atomic():
+            sample_recipe(self.user)
+            self.assertFalse(Change.objects.since(0, 10))
+
+        self.assertEqual(len(Change.objects.since(0, 10)), 1)
+
+    def test_reverse_m2m_change(self):
+        """Test recipes changed from the tag side are recorded"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe = sample_recipe(self.user)
+
+        tag.recipe_set.add(recipe)
+        tag.recipe_set.clear()
+
+        self.assertEqual(self.changes()[-2:], [
+            ('recipe', 'updated', recipe.id),
+            ('recipe', 'updated', recipe.id),
+        ])
+
+    def test_compact_changes(self):
+        """Test compacting keeps the last change of every object"""
+        recipe = sample_recipe(self.user)
+        recipe.save()
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        tag_id = tag.id
+        tag.delete()
+
+        call_command('compact_changes', stdout=io.StringIO())
+
+        self.assertEqual(self.changes(), [
+            ('recipe', 'updated', recipe.id),
+            ('tag', 'deleted', tag_id),
+        ])
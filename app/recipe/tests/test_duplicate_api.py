@@ -0,0 +1,136 @@
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.core.files.base import ContentFile
+from django.urls import reverse
+
+from rest_framework import status
+
+from core.models import Change, Ingredient, Recipe, StoredFile, Tag, \
+                        UserStats
+from core.testing import AuthenticatedApiTestCase, create_user, \
+                         sample_recipe
+
+
+DUPLICATE_MANY_URL = reverse('recipe:recipe-duplicate-many')
+
+
+def duplicate_url(recipe_id):
+    return reverse('recipe:recipe-duplicate', args=[recipe_id])
+
+
+class DuplicateRecipeApiTests(AuthenticatedApiTestCase):
+    """Test copying recipes"""
+
+    def setUp(self):
+        super().setUp()
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        media_root = self.settings(MEDIA_ROOT=location)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(user=self.user,
+                                                    name='Salt')
+        self.recipe = sample_recipe(self.user, title='Curry', price=7,
+                                    link='https://example.com')
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(self.ingredient)
+
+    def test_duplicate(self):
+        """Test a copy gets the fields, tags and ingredients of the recipe
+        and is counted and recorded"""
+        res = self.client.post(duplicate_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        copy = Recipe.objects.get(id=res.data['id'])
+        self.assertNotEqual(copy.id, self.recipe.id)
+        self.assertEqual(
+            (copy.title, copy.price, copy.link, copy.time_minutes),
+            ('Curry', 7, 'https://example.com', 10)
+        )
+        self.assertEqual(list(copy.tags.all()), [self.tag])
+        self.assertEqual(list(copy.ingredients.all()), [self.ingredient])
+        self.assertEqual(res.data['tags'], [self.tag.id])
+
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 2)
+        self.assertEqual(stats.tag_usage, {str(self.tag.id): 2})
+        self.assertTrue(Change.objects.filter(
+            model='recipe', action=Change.CREATED, object_id=copy.id
+        ).exists())
+
+    def test_duplicate_with_title(self):
+        """Test a copy can be given its own title"""
+        res = self.client.post(duplicate_url(self.recipe.id),
+                               {'title': 'Spicy curry'})
+
+        self.assertEqual(res.data['title'], 'Spicy curry')
+
+    def test_image_shared(self):
+        """Test copies reference the image file of the recipe"""
+        self.recipe.image.save('curry.jpg', ContentFile(b'image'))
+
+        for share_image in (True, False):
+            res = self.client.post(duplicate_url(self.recipe.id),
+                                   {'share_image': share_image})
+            copy = Recipe.objects.get(id=res.data['id'])
+            self.assertEqual(copy.image.name, self.recipe.image.name)
+
+        stored = StoredFile.objects.get(name=self.recipe.image.name)
+        self.assertEqual(stored.refcount, 3)
+
+    def test_duplicate_many(self):
+        """Test copying many recipes at once, in the given order"""
+        soup = sample_recipe(self.user, title='Soup')
+        other = create_user(email='other@teamalif.com')
+        foreign = sample_recipe(other)
+
+        res = self.client.post(DUPLICATE_MANY_URL, {
+            'recipes': [soup.id, foreign.id, self.recipe.id]
+        }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [(copy['source'], copy['title']) for copy in res.data],
+            [(soup.id, 'Soup'), (self.recipe.id, 'Curry')]
+        )
+        self.assertEqual(Recipe.objects.filter(user=other).count(), 1)
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 4)
+
+    def test_stats_counted_from_copies(self):
+        """Test the copies are counted into the stats without a recount"""
+        sample_recipe(self.user, title='Soup', time_minutes=25, price=2)
+        cheap = sample_recipe(self.user, title='Salad', price=Decimal('0.50'))
+        cheap.tags.add(self.tag)
+        # the stats rebuilt from scratch afterwards must match
+        stale = UserStats.objects.get(user=self.user)
+        recipe_ids = list(Recipe.objects.filter(user=self.user)
+                          .values_list('id', flat=True))
+
+        with patch.object(UserStats.objects, 'rebuild') as rebuild:
+            res = self.client.post(DUPLICATE_MANY_URL, {
+                'recipes': recipe_ids
+            }, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        rebuild.assert_not_called()
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 2 * stale.recipe_count)
+        UserStats.objects.rebuild([self.user.pk])
+        rebuilt = UserStats.objects.get(user=self.user)
+        fields = ('recipe_count', 'time_minutes_total', 'price_min',
+                  'price_max', 'tag_usage')
+        self.assertEqual([getattr(stats, field) for field in fields],
+                         [getattr(rebuilt, field) for field in fields])
+
+    def test_other_users_recipe(self):
+        """Test other users' recipes can't be copied"""
+        other = create_user(email='other@teamalif.com')
+
+        res = self.client.post(duplicate_url(sample_recipe(other).id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
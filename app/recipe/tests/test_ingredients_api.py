@@ -6,10 +6,12 @@ from django.urls import reverse
 from django.test import TestCase
 
 from core.models import Ingredient, Recipe
+from core.testing import AuthenticatedApiTestCase
 from recipe.serializers import IngredientSerializer
 
 
 INGREDIENT_URL = reverse('recipe:ingredient-list')
+INGREDIENT_BULK_URL = reverse('recipe:ingredient-bulk')
 
 
 class PublicIngredientApiTests(TestCase):
@@ -28,18 +30,10 @@ class PublicIngredientApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateIngredientApiTests(TestCase):
+class PrivateIngredientApiTests(AuthenticatedApiTestCase):
     """
         Tests the ingredient Api for authorized users
     """
-    def setUp(self) -> None:
-        self.client = APIClient()
-        self.user = get_user_model().objects.create_user(
-            email='testemail@teamalif.com',
-            password='testpass123',
-        )
-
-        self.client.force_authenticate(self.user)
 
     def test_get_ingredient_authorized(self):
         """
@@ -120,3 +114,55 @@ class PrivateIngredientApiTests(TestCase):
 
         self.assertIn(serializer1.data, res.data)
         self.assertNotIn(serializer2.data, res.data)
+
+    def test_retrieve_unassigned_ingredients_with_count(self):
+        """
+            Test retrieving unused ingredients together with their counts
+        """
+        recipe = Recipe.objects.create(
+            title='Biryani',
+            time_minutes=50,
+            price=10,
+            user=self.user,
+        )
+        ing1 = Ingredient.objects.create(user=self.user, name='Ing 1')
+        ing2 = Ingredient.objects.create(user=self.user, name='Ing 2')
+        recipe.ingredients.add(ing1)
+
+        res = self.client.get(
+            INGREDIENT_URL,
+            {'unassigned_only': 1, 'with_recipe_count': 1}
+        )
+
+        self.assertEqual(
+            res.data, [{'id': ing2.id, 'name': ing2.name, 'recipe_count': 0}]
+        )
+
+    def test_create_duplicate_ingredient_invalid(self):
+        """
+        Test creating an ingredient whose name exists with another case fails
+        """
+        Ingredient.objects.create(user=self.user, name='Carrot')
+
+        res = self.client.post(INGREDIENT_URL, {'name': 'CARROT'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_get_or_create_ingredients(self):
+        """
+        Test resolving ingredient names in bulk for the current user only
+        """
+        user2 = get_user_model().objects.create_user(
+            email='other@teamalif.com',
+            password='testpass123',
+        )
+        Ingredient.objects.create(user=user2, name='Salt')
+
+        res = self.client.post(INGREDIENT_BULK_URL,
+                               {'names': ['Salt', 'Pepper']}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 2)
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 2
+        )
@@ -1,10 +1,12 @@
 import tempfile
-import os
+from decimal import Decimal
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -12,10 +14,14 @@ from rest_framework.test import APIClient
 
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
-from core.models import Recipe, Tag, Ingredient
+from core.models import Recipe
+from core.query_inspector import QueryInspectorTestMixin
+from core.testing import AuthenticatedApiTestCase, sample_ingredient, \
+                         sample_recipe, sample_tag
 
 
 RECIPE_URL = reverse('recipe:recipe-list')
+SHOPPING_LIST_URL = reverse('recipe:recipe-shopping-list')
 
 
 def image_upload_url(recipe_id):
@@ -32,36 +38,6 @@ def recipe_detail_url(recipe_id):
     return reverse('recipe:recipe-detail', args=[recipe_id])
 
 
-def sample_tag(user, name='Vegetable'):
-    """
-    Create and return a Tag objects
-    """
-    return Tag.objects.create(user=user, name=name)
-
-
-def sample_ingredient(user, name='Carrot'):
-    """
-    Create and return an Ingredient objects
-    """
-    return Ingredient.objects.create(user=user, name=name)
-
-
-def sample_recipe(user, **params):
-    """
-        Created a sample recipe objects for the given user
-    """
-    defaults = {
-        'title': 'Sample Recipe',
-        'time_minutes': 10,
-        'price': 5.00,
-    }
-
-    # to update or add in defaults with given value (params)
-    defaults.update(params)
-
-    return Recipe.objects.create(user=user, **defaults)
-
-
 class PublicRecipeApiTests(TestCase):
     """
     Test for the publicly available api
@@ -79,17 +55,11 @@ class PublicRecipeApiTests(TestCase):
 
 
 # noinspection DuplicatedCode
-class PrivateRecipeApiTests(TestCase):
+class PrivateRecipeApiTests(QueryInspectorTestMixin,
+                            AuthenticatedApiTestCase):
     """
         Tests for authorized users
     """
-    def setUp(self) -> None:
-        self.client = APIClient()
-        self.user = get_user_model().objects.create_user(
-            email='testemail@teamalif.com',
-            password='testpass123',
-        )
-        self.client.force_authenticate(self.user)
 
     def test_retrieving_recipe_successful(self):
         """
@@ -106,6 +76,22 @@ class PrivateRecipeApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
+    def test_retrieving_recipes_without_n_plus_one(self):
+        """
+        Tests listing recipes doesn't load tags and ingredients per recipe
+        """
+        tag = sample_tag(self.user)
+        ingredient = sample_ingredient(self.user)
+        for _ in range(5):
+            recipe = sample_recipe(self.user)
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+
+        with self.assertNoNPlusOne():
+            res = self.client.get(RECIPE_URL)
+
+        self.assertEqual(len(res.data), 5)
+
     def test_recipe_retrieved_for_current_auth_user_only(self):
         """
             Test that recipe objects are retrieved for current authorized user
@@ -163,7 +149,7 @@ class PrivateRecipeApiTests(TestCase):
         Test creating the recipe with tags
         """
         tag1 = sample_tag(self.user)
-        tag2 = sample_tag(self.user)
+        tag2 = sample_tag(self.user, name='Dessert')
         payload = {
             'title': 'Test Recipe',
             'tags': [tag1.id, tag2.id],
@@ -186,7 +172,7 @@ class PrivateRecipeApiTests(TestCase):
         Test for creating the recipe with ingredients
         """
         ingredient1 = sample_ingredient(self.user)
-        ingredient2 = sample_ingredient(self.user)
+        ingredient2 = sample_ingredient(self.user, name='Potato')
         payload = {
             'title': 'Sample Recipe',
             'ingredients': [ingredient1.id, ingredient2.id],
@@ -251,16 +237,126 @@ class PrivateRecipeApiTests(TestCase):
         tags = recipe.tags.all()
         self.assertEqual(tags.count(), 0)
 
+    def test_create_recipe_exact_price(self):
+        """
+            Test prices are stored exactly and reject fractions of cents
+        """
+        payload = {'title': 'Tea', 'time_minutes': 5, 'price': '10.10'}
+        res = self.client.post(RECIPE_URL, payload)
+        invalid = self.client.post(RECIPE_URL, {**payload, 'price': '1.005'})
 
-class RecipeImageUploadTests(TestCase):
+        recipe = Recipe.objects.get(id=res.data['id'])
+        self.assertEqual(recipe.price, Decimal('10.10'))
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
 
-    def setUp(self) -> None:
-        self.client = APIClient()
-        self.user = get_user_model().objects.create_user(
-            email='testemail@teamalif.com',
-            password='testpass@231'
+    def test_recipe_range_filters(self):
+        """
+            Test filtering recipes on price and time ranges
+        """
+        quick = sample_recipe(user=self.user, title='Quick', time_minutes=10,
+                              price=4)
+        sample_recipe(user=self.user, title='Slow', time_minutes=90, price=4)
+        sample_recipe(user=self.user, title='Pricey', time_minutes=10,
+                      price=40)
+
+        res = self.client.get(
+            RECIPE_URL,
+            {'time_minutes__lte': 30, 'price__lt': '10.50'}
+        )
+
+        self.assertEqual(res.data, [RecipeSerializer(quick).data])
+
+    def test_recipe_range_filter_invalid(self):
+        """
+            Test range filters with a value that isn't a number
+        """
+        res = self.client.get(RECIPE_URL, {'price__gte': 'cheap'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recipe_ordering(self):
+        """
+            Test ordering recipes by a whitelisted field with id tie breaker
+        """
+        first = sample_recipe(user=self.user, title='B', price=5)
+        second = sample_recipe(user=self.user, title='A', price=5)
+        third = sample_recipe(user=self.user, title='C', price=1)
+
+        by_price = self.client.get(RECIPE_URL, {'ordering': '-price'})
+        by_title = self.client.get(RECIPE_URL, {'ordering': 'title'})
+        invalid = self.client.get(RECIPE_URL, {'ordering': 'link'})
+
+        self.assertEqual([r['id'] for r in by_price.data],
+                         [second.id, first.id, third.id])
+        self.assertEqual([r['title'] for r in by_title.data],
+                         ['A', 'B', 'C'])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recipe_keyset_pages(self):
+        """
+            Test paging through recipes with a cursor
+        """
+        for minutes in (5, 10, 10, 20):
+            sample_recipe(user=self.user, time_minutes=minutes)
+
+        res = self.client.get(
+            RECIPE_URL,
+            {'ordering': 'time_minutes', 'page_size': 3}
         )
-        self.client.force_authenticate(self.user)
+        following = self.client.get(res.data['next'])
+
+        minutes = [r['time_minutes'] for r in res.data['results']] + \
+            [r['time_minutes'] for r in following.data['results']]
+        self.assertEqual(minutes, [5, 10, 10, 20])
+        self.assertIsNone(following.data['next'])
+
+    def test_shopping_list(self):
+        """
+            Test the ingredients of many recipes are listed once each, with
+            one query
+        """
+        salt = sample_ingredient(self.user, name='Salt')
+        kale = sample_ingredient(self.user, name='Kale')
+        curry = sample_recipe(self.user, title='Curry')
+        curry.ingredients.add(salt, kale)
+        soup = sample_recipe(self.user, title='Soup')
+        soup.ingredients.add(salt)
+        unselected = sample_recipe(self.user)
+        unselected.ingredients.add(sample_ingredient(self.user))
+        other = get_user_model().objects.create_user(
+            'other@teamalif.com', 'testpass'
+        )
+        foreign = sample_recipe(other)
+        foreign.ingredients.add(sample_ingredient(other, name='Pepper'))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(SHOPPING_LIST_URL, {
+                'recipes': f'{curry.id},{soup.id},{foreign.id}'
+            })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [
+            {'id': kale.id, 'name': 'Kale', 'recipes': [curry.id]},
+            {'id': salt.id, 'name': 'Salt', 'recipes': [curry.id, soup.id]},
+        ])
+        self.assertEqual(len([query for query in queries
+                              if query['sql'].startswith('SELECT')]), 1)
+
+    def test_shopping_list_too_many_recipes(self):
+        """
+            Test shopping lists of too many recipes are rejected
+        """
+        res = self.client.get(SHOPPING_LIST_URL, {
+            'recipes': ','.join(str(pk) for pk in range(1, 102))
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeImageUploadTests(AuthenticatedApiTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
         self.recipe = sample_recipe(self.user)
 
     def tearDown(self) -> None:
@@ -280,7 +376,9 @@ class RecipeImageUploadTests(TestCase):
         self.recipe.refresh_from_db()
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertIn('image', res.data)
-        self.assertTrue(os.path.exists(self.recipe.image.path))
+        self.assertTrue(
+            self.recipe.image.storage.exists(self.recipe.image.name)
+        )
 
     def test_upload_image_bad_request(self):
         """
@@ -0,0 +1,78 @@
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Tag
+from core.testing import create_user, sample_recipe
+
+
+def similar_url(recipe_id):
+    return reverse('recipe:recipe-similar', args=[recipe_id])
+
+
+class SimilarRecipesApiTests(TransactionTestCase):
+    """Test the recipes similar to a recipe"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.vegan = Tag.objects.create(user=self.user, name='Vegan')
+        self.quick = Tag.objects.create(user=self.user, name='Quick')
+        self.salt = Ingredient.objects.create(user=self.user, name='Salt')
+        self.recipe = sample_recipe(self.user, [self.vegan, self.quick],
+                                    [self.salt], title='Curry')
+
+    def similar(self, recipe=None, **params):
+        res = self.client.get(similar_url((recipe or self.recipe).id),
+                              params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [(r['title'], round(r['similarity'], 3)) for r in res.data]
+
+    def test_ranked_by_jaccard(self):
+        """Test recipes are ranked by their shared tags and ingredients"""
+        sample_recipe(self.user, [self.vegan, self.quick], [self.salt],
+                      title='Soup')
+        sample_recipe(self.user, [self.vegan], title='Salad')
+        sample_recipe(self.user, title='Bread')
+        other = create_user(email='other@teamalif.com')
+        sample_recipe(other, [self.vegan, self.quick], [self.salt])
+
+        self.assertEqual(self.similar(),
+                         [('Soup', 1.0), ('Salad', 0.333)])
+        self.assertEqual(self.similar(limit=1), [('Soup', 1.0)])
+
+    @override_settings(RECOMMENDATIONS_METRIC='cosine')
+    def test_ranked_by_cosine(self):
+        """Test the cosine similarity can be used instead"""
+        sample_recipe(self.user, [self.vegan], title='Salad')
+
+        self.assertEqual(self.similar(), [('Salad', 0.577)])
+
+    def test_updated_on_m2m_changes(self):
+        """Test the cached neighbors follow tag and recipe changes"""
+        salad = sample_recipe(self.user, [self.vegan], title='Salad')
+        bread = sample_recipe(self.user, title='Bread')
+        self.assertEqual(self.similar(), [('Salad', 0.333)])
+
+        bread.tags.add(self.vegan, self.quick)
+        self.salt.recipe_set.add(bread)
+        self.assertEqual(self.similar(), [('Bread', 1.0), ('Salad', 0.333)])
+
+        bread.delete()
+        self.quick.delete()
+        self.assertEqual(self.similar(), [('Salad', 0.5)])
+        self.assertEqual(self.similar(salad), [('Curry', 0.5)])
+
+    def test_other_users_recipe(self):
+        """Test the similar recipes of another user's recipe are hidden"""
+        other = create_user(email='other@teamalif.com')
+        recipe = sample_recipe(other)
+
+        res = self.client.get(similar_url(recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
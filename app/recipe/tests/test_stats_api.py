@@ -0,0 +1,95 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, UserStats
+from core.testing import AuthenticatedApiTestCase, sample_recipe
+
+
+STATS_URL = reverse('recipe:stats')
+
+
+class PublicStatsApiTests(TestCase):
+    """
+        Test the publicly available stats API
+    """
+    def test_auth_required(self):
+        """
+            Test that stats need an authorized user
+        """
+        res = APIClient().get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateStatsApiTests(AuthenticatedApiTestCase):
+    """
+        Tests the stats kept for authorized users
+    """
+
+    def test_stats_follow_changes(self):
+        """
+            Test the counters follow recipe, tag and ingredient changes
+        """
+        spicy = Tag.objects.create(user=self.user, name='Spicy')
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        Ingredient.objects.create(user=self.user, name='Rice')
+        cheap = sample_recipe(self.user, time_minutes=10, price=2)
+        pricey = sample_recipe(self.user, time_minutes=30, price=20)
+        cheap.tags.add(spicy, vegan)
+        pricey.tags.add(spicy)
+        vegan.recipe_set.remove(cheap)
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['recipe_count'], 2)
+        self.assertEqual(res.data['tag_count'], 2)
+        self.assertEqual(res.data['ingredient_count'], 1)
+        self.assertEqual(res.data['time_minutes_avg'], 20)
+        self.assertEqual(res.data['price_min'], 2)
+        self.assertEqual(res.data['price_max'], 20)
+        self.assertEqual(res.data['tag_usage'], {str(spicy.id): 2})
+
+        pricey.price = 8
+        pricey.save()
+        cheap.delete()
+        stats = UserStats.objects.get(user=self.user)
+
+        self.assertEqual(stats.recipe_count, 1)
+        self.assertEqual(stats.time_minutes_avg, 30)
+        self.assertEqual((stats.price_min, stats.price_max), (8, 8))
+        self.assertEqual(stats.tag_usage, {str(spicy.id): 1})
+
+    def test_stats_match_rebuild(self):
+        """
+            Test the incrementally kept stats equal a full rebuild
+        """
+        tag = Tag.objects.create(user=self.user, name='Spicy')
+        recipe = sample_recipe(self.user, price=3)
+        recipe.tags.add(tag)
+        sample_recipe(self.user, price=7, time_minutes=50)
+        recipe.tags.clear()
+        kept = self.client.get(STATS_URL).data
+
+        call_command('rebuild_stats', self.user.email, stdout=StringIO())
+        rebuilt = self.client.get(STATS_URL).data
+
+        self.assertEqual(kept, rebuilt)
+
+    def test_stats_built_for_users_without_row(self):
+        """
+            Test stats are computed for users created before the stats
+        """
+        sample_recipe(self.user, price=4)
+        UserStats.objects.filter(user=self.user).delete()
+
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.data['recipe_count'], 1)
+        self.assertEqual(res.data['price_max'], 4)
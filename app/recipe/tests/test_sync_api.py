@@ -0,0 +1,243 @@
+import gzip
+import json
+
+from django.test import TransactionTestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Ingredient, Recipe, Tag
+from core.testing import create_user, sample_recipe
+
+
+SYNC_URL = reverse('recipe:sync')
+
+
+class SyncApiTests(TransactionTestCase):
+    """Test the delta sync of offline clients"""
+    # the change feed waits for the transactions of every database
+    run_serially = True
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(user=self.user,
+                                                    name='Salt')
+        self.recipe = sample_recipe(self.user)
+        self.recipe.tags.add(self.tag)
+
+    def pull(self, **params):
+        res = self.client.get(SYNC_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def push(self, token, *changes):
+        res = self.client.post(SYNC_URL, {
+            'token': token, 'changes': list(changes)
+        }, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data['results']
+
+    def test_full_sync(self):
+        """Test everything is pulled without a token"""
+        other = create_user(email='other@teamalif.com')
+        sample_recipe(other)
+
+        data = self.pull()
+
+        self.assertEqual([r['id'] for r in data['recipes']],
+                         [self.recipe.id])
+        self.assertEqual(data['recipes'][0]['tags'], [self.tag.id])
+        self.assertEqual([t['name'] for t in data['tags']], ['Vegan'])
+        self.assertEqual([i['name'] for i in data['ingredients']], ['Salt'])
+        self.assertGreater(data['token'], 0)
+        self.assertFalse(data['more'])
+
+    def test_full_sync_pages(self):
+        """Test everything is pulled in pages of at most limit objects"""
+        for title in ('Curry', 'Soup', 'Stew'):
+            sample_recipe(self.user, title=title)
+
+        pages = [self.pull(limit=2)]
+        while pages[-1]['more']:
+            self.assertNotIn('token', pages[-1])
+            pages.append(self.pull(cursor=pages[-1]['cursor'], limit=2))
+            if len(pages) == 2:
+                # changed after its page, pulled with the next delta
+                self.tag.name = 'Vegetarian'
+                self.tag.save()
+
+        self.assertEqual(len(pages), 3)
+        self.assertTrue(all(
+            len(page['tags'] + page['ingredients'] + page['recipes']) == 2
+            for page in pages
+        ))
+        self.assertEqual(
+            [r['title'] for page in pages for r in page['recipes']],
+            ['Sample Recipe', 'Curry', 'Soup', 'Stew']
+        )
+        self.assertEqual(pages[0]['tags'][0]['name'], 'Vegan')
+        delta = self.pull(token=pages[-1]['token'])
+        self.assertEqual([t['name'] for t in delta['tags']], ['Vegetarian'])
+
+    def test_invalid_cursor(self):
+        """Test cursors are validated"""
+        for params in ({'cursor': 'nope'}, {'cursor': '1:users:0'},
+                       {'cursor': '1:tags:0', 'token': 1}):
+            res = self.client.get(SYNC_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_delta_sync(self):
+        """Test the changes since the token are pulled with tombstones"""
+        token = self.pull()['token']
+        recipe = sample_recipe(self.user, title='Curry')
+        self.tag.name = 'Vegetarian'
+        self.tag.save()
+        ingredient_id = self.ingredient.id
+        self.ingredient.delete()
+        other = create_user(email='other@teamalif.com')
+        sample_recipe(other)
+
+        data = self.pull(token=token)
+
+        self.assertEqual([r['title'] for r in data['recipes']], ['Curry'])
+        self.assertEqual(data['recipes'][0]['id'], recipe.id)
+        self.assertEqual([t['name'] for t in data['tags']], ['Vegetarian'])
+        self.assertEqual(data['ingredients'], [])
+        self.assertEqual(data['deleted'], {
+            'tags': [], 'ingredients': [ingredient_id], 'recipes': []
+        })
+        self.assertEqual(self.pull(token=data['token'])['recipes'], [])
+
+    def test_delta_sync_batches(self):
+        """Test the changes are pulled in batches"""
+        token = self.pull()['token']
+        sample_recipe(self.user, title='Curry')
+        sample_recipe(self.user, title='Soup')
+
+        first = self.pull(token=token, limit=1)
+        second = self.pull(token=first['token'], limit=1)
+
+        self.assertTrue(first['more'])
+        self.assertFalse(second['more'])
+        self.assertEqual(
+            [r['title'] for r in first['recipes'] + second['recipes']],
+            ['Curry', 'Soup']
+        )
+
+    def test_compressed(self):
+        """Test the payload is gzipped for clients accepting it"""
+        for number in range(20):
+            sample_recipe(self.user, title=f'Recipe {number}')
+
+        res = self.client.get(SYNC_URL, HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        data = json.loads(gzip.decompress(res.content))
+        self.assertEqual(len(data['recipes']), 21)
+
+    def test_push_changes(self):
+        """Test client changes are applied in order"""
+        token = self.pull()['token']
+        recipe = sample_recipe(self.user, title='Soup')
+        token = self.pull(token=token)['token']
+
+        results = self.push(
+            token,
+            {'model': 'tags', 'action': 'create', 'data': {'name': 'Quick'}},
+            {'model': 'recipes', 'action': 'update', 'id': self.recipe.id,
+             'data': {'title': 'Curry'}},
+            {'model': 'recipes', 'action': 'delete', 'id': recipe.id},
+            {'model': 'recipes', 'action': 'create', 'data': {}},
+            {'model': 'ingredients', 'action': 'delete',
+             'id': self.ingredient.id},
+        )
+
+        self.assertEqual(
+            [r['status'] for r in results],
+            ['applied', 'applied', 'applied', 'invalid', 'invalid']
+        )
+        tag = Tag.objects.get(user=self.user, name='Quick')
+        self.assertEqual(results[0]['id'], tag.id)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'Curry')
+        self.assertFalse(Recipe.objects.filter(id=recipe.id).exists())
+        self.assertTrue(Ingredient.objects.exists())
+
+    def test_push_conflict(self):
+        """Test changes to objects changed on the server since the token
+        are not applied"""
+        recipe = sample_recipe(self.user, title='Soup')
+        token = self.pull()['token']
+        self.recipe.title = 'Server title'
+        self.recipe.save()
+        recipe_id = recipe.id
+        recipe.delete()
+
+        results = self.push(
+            token,
+            {'model': 'recipes', 'action': 'update', 'id': self.recipe.id,
+             'data': {'title': 'Client title'}},
+            {'model': 'recipes', 'action': 'update', 'id': recipe_id,
+             'data': {'title': 'Client title'}},
+        )
+
+        self.assertEqual([r['status'] for r in results],
+                         ['conflict', 'conflict'])
+        self.assertEqual(results[0]['current']['title'], 'Server title')
+        self.assertIsNone(results[1]['current'])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, 'Server title')
+
+    def test_push_same_object_twice(self):
+        """Test changes of a batch don't conflict with each other"""
+        token = self.pull()['token']
+
+        results = self.push(
+            token,
+            {'model': 'recipes', 'action': 'update', 'id': self.recipe.id,
+             'data': {'title': 'Curry'}},
+            {'model': 'recipes', 'action': 'update', 'id': self.recipe.id,
+             'data': {'time_minutes': 25}},
+            {'model': 'recipes', 'action': 'delete', 'id': self.recipe.id},
+        )
+
+        self.assertEqual([r['status'] for r in results],
+                         ['applied', 'applied', 'applied'])
+        self.assertFalse(Recipe.objects.filter(id=self.recipe.id).exists())
+
+    def test_push_returns_token(self):
+        """Test the token of a push skips the batch's own changes only"""
+        token = self.pull()['token']
+        res = self.client.post(SYNC_URL, {'token': token, 'changes': [
+            {'model': 'tags', 'action': 'create', 'data': {'name': 'Quick'}},
+        ]}, format='json')
+
+        self.assertGreater(res.data['token'], token)
+        data = self.pull(token=res.data['token'])
+        self.assertEqual(data['tags'], [])
+
+        # changed elsewhere meanwhile, the client pulls from its token
+        token = res.data['token']
+        self.tag.name = 'Vegetarian'
+        self.tag.save()
+        res = self.client.post(SYNC_URL, {'token': token, 'changes': [
+            {'model': 'tags', 'action': 'create', 'data': {'name': 'Slow'}},
+        ]}, format='json')
+
+        self.assertEqual(res.data['token'], token)
+        self.assertEqual(
+            sorted(t['name'] for t in self.pull(token=token)['tags']),
+            ['Slow', 'Vegetarian']
+        )
+
+    def test_push_requires_id(self):
+        """Test updates without an id are rejected"""
+        res = self.client.post(SYNC_URL, {'token': 0, 'changes': [
+            {'model': 'recipes', 'action': 'update', 'data': {}}
+        ]}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,5 +1,7 @@
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -7,9 +9,11 @@ from rest_framework.test import APIClient
 
 from recipe.serializers import TagSerializer
 from core.models import Tag, Recipe
+from core.testing import AuthenticatedApiTestCase
 
 
 TAG_URL = reverse('recipe:tag-list')
+TAG_BULK_URL = reverse('recipe:tag-bulk')
 
 
 class PublicTagApiTest(TestCase):
@@ -28,18 +32,10 @@ class PublicTagApiTest(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
-class PrivateTagApiTest(TestCase):
+class PrivateTagApiTest(AuthenticatedApiTestCase):
     """
         Test the tags api for authorized users
     """
-    def setUp(self) -> None:
-        self.client = APIClient()
-        self.user = get_user_model().objects.create_user(
-            email='testemail@teamalif.com',
-            password='testpass@123',
-        )
-
-        self.client.force_authenticate(self.user)
 
     def test_tag_api_for_authorized_user(self):
         """
@@ -123,3 +119,133 @@ class PrivateTagApiTest(TestCase):
 
         self.assertIn(serializer1.data, res.data)
         self.assertNotIn(serializer2.data, res.data)
+
+    def test_retrieve_assigned_tags_unique(self):
+        """
+            Test assigned tags are returned once however many recipes use them
+        """
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        Tag.objects.create(user=self.user, name='Lunch')
+        for title in ('Pancakes', 'Porridge'):
+            recipe = Recipe.objects.create(
+                title=title,
+                time_minutes=5,
+                price=3.00,
+                user=self.user
+            )
+            recipe.tags.add(tag)
+
+        res = self.client.get(TAG_URL, {'assigned_only': 1})
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(res.data[0]['id'], tag.id)
+
+    def test_retrieve_unassigned_tags_only(self):
+        """
+            Test retrieving the tags no recipe uses
+        """
+        recipe = Recipe.objects.create(
+            title="Chicken Tikka",
+            time_minutes=10,
+            price=5.00,
+            user=self.user
+        )
+        tag1 = Tag.objects.create(user=self.user, name='Tag 1')
+        tag2 = Tag.objects.create(user=self.user, name='Tag 2')
+        recipe.tags.add(tag1)
+
+        res = self.client.get(TAG_URL, {'unassigned_only': 1})
+
+        self.assertEqual(res.data, [TagSerializer(tag2).data])
+
+    def test_assigned_only_zero_returns_all(self):
+        """
+            Test assigned_only=0 doesn't filter and other values are invalid
+        """
+        Tag.objects.create(user=self.user, name='Tag 1')
+
+        res = self.client.get(TAG_URL, {'assigned_only': 0})
+        invalid = self.client.get(TAG_URL, {'assigned_only': 'yes'})
+
+        self.assertEqual(len(res.data), 1)
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_tags_with_recipe_count(self):
+        """
+            Test annotating tags with the number of recipes using them
+        """
+        tag1 = Tag.objects.create(user=self.user, name='Tag 1')
+        tag2 = Tag.objects.create(user=self.user, name='Tag 2')
+        for title in ('Pancakes', 'Porridge'):
+            recipe = Recipe.objects.create(
+                title=title,
+                time_minutes=5,
+                price=3.00,
+                user=self.user
+            )
+            recipe.tags.add(tag1)
+
+        res = self.client.get(TAG_URL, {'with_recipe_count': 1})
+
+        counts = {tag['id']: tag['recipe_count'] for tag in res.data}
+        self.assertEqual(counts, {tag1.id: 2, tag2.id: 0})
+
+    def test_recipe_count_single_aggregation(self):
+        """
+            Test the recipe counts are one grouped join, not a subquery
+            per tag
+        """
+        for number in range(3):
+            tag = Tag.objects.create(user=self.user, name=f'Tag {number}')
+            recipe = Recipe.objects.create(
+                title=f'Recipe {number}',
+                time_minutes=5,
+                price=3.00,
+                user=self.user
+            )
+            recipe.tags.add(tag)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(TAG_URL, {'with_recipe_count': 1})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        tag_queries = [query['sql'] for query in queries
+                       if 'FROM "core_tag"' in query['sql']]
+        self.assertEqual(len(tag_queries), 1)
+        self.assertIn('GROUP BY', tag_queries[0])
+        self.assertEqual(tag_queries[0].count('SELECT'), 1)
+
+    def test_create_duplicate_tag_invalid(self):
+        """
+            Test creating a tag whose name exists with another case fails
+        """
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAG_URL, {'name': 'vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_get_or_create_tags(self):
+        """
+            Test resolving tag names in bulk reuses existing tags
+        """
+        vegan = Tag.objects.create(user=self.user, name='Vegan')
+        payload = {'names': ['Spicy', 'vegan', 'spicy', 'Quick']}
+
+        res = self.client.post(TAG_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [tag['name'] for tag in res.data], ['Spicy', 'Vegan', 'Quick']
+        )
+        self.assertEqual(res.data[1]['id'], vegan.id)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 3)
+
+    def test_bulk_tags_invalid(self):
+        """
+            Test resolving an empty list of names fails
+        """
+        res = self.client.post(TAG_BULK_URL, {'names': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
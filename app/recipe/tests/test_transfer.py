@@ -0,0 +1,266 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import jobs
+from core.models import Job, Recipe, Tag, Ingredient, UserStats
+from core.testing import AuthenticatedApiTestCase, create_user, \
+                         sample_recipe
+from recipe import transfer
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+IMPORT_URL = reverse('recipe:recipe-import-recipes')
+
+
+def streamed_lines(res):
+    """
+    Returns the lines of a streaming response
+    """
+    return b''.join(res.streaming_content).decode().splitlines()
+
+
+class RecipeTransferApiTests(AuthenticatedApiTestCase):
+    """
+        Tests for importing and exporting recipes
+    """
+
+    def test_export_ndjson(self):
+        """
+            Test exporting recipes with their tag and ingredient names
+        """
+        recipe = sample_recipe(self.user, title='Biryani')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Spicy'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Rice')
+        )
+        other = create_user(email='other@teamalif.com')
+        sample_recipe(other)
+
+        res = self.client.get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in streamed_lines(res)]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['title'], 'Biryani')
+        self.assertEqual(rows[0]['tags'], ['Spicy'])
+        self.assertEqual(rows[0]['ingredients'], ['Rice'])
+
+    def test_export_csv(self):
+        """
+            Test exporting recipes as CSV with a header
+        """
+        recipe = sample_recipe(self.user)
+        recipe.tags.add(
+            Tag.objects.create(user=self.user, name='Spicy'),
+            Tag.objects.create(user=self.user, name='Vegan'),
+        )
+
+        res = self.client.get(EXPORT_URL, {'fmt': 'csv'})
+        lines = streamed_lines(res)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            lines[0], 'title,time_minutes,price,link,tags,ingredients'
+        )
+        self.assertIn('Spicy|Vegan', lines[1])
+
+    def test_export_job(self):
+        """
+            Test POST queues an export to a file, downloaded through the
+            job by its user only and deleted later
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        export_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_root)
+        sample_recipe(self.user, title='Biryani')
+        other = APIClient()
+        other.force_authenticate(create_user(email='other@teamalif.com'))
+
+        with self.settings(MEDIA_ROOT=media_root, EXPORT_ROOT=export_root):
+            res = self.client.post(f'{EXPORT_URL}?fmt=csv')
+            job, = Job.objects.claim('worker', 1)
+            jobs.execute(job.pk)
+            job_res = self.client.get(res['Location'])
+            exported = os.listdir(export_root)
+            file_res = self.client.get(job_res.data['file_url'])
+            lines = b''.join(file_res.streaming_content).decode() \
+                .splitlines()
+            other_res = other.get(job_res.data['file_url'])
+
+            cleanup = Job.objects.get(name='delete_export')
+            self.assertGreater(cleanup.run_at, timezone.now())
+            Job.objects.filter(pk=cleanup.pk).update(run_at=timezone.now())
+            Job.objects.claim('worker', 1)
+            jobs.execute(cleanup.pk)
+            deleted_res = self.client.get(job_res.data['file_url'])
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(job_res.data['status'], Job.DONE)
+        self.assertNotIn('url', job_res.data['result'])
+        self.assertEqual(len(exported), 1)
+        self.assertFalse(os.listdir(media_root))
+        self.assertEqual(file_res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Biryani', lines[1])
+        self.assertEqual(other_res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(deleted_res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_export_invalid_format(self):
+        """
+            Test exporting with an unknown format fails
+        """
+        res = self.client.get(EXPORT_URL, {'fmt': 'xml'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_ndjson(self):
+        """
+            Test importing recipes creates missing tags and reuses existing
+        """
+        tag = Tag.objects.create(user=self.user, name='Spicy')
+        content = '\n'.join([
+            json.dumps({'title': 'Biryani', 'time_minutes': 50, 'price': 10,
+                        'tags': ['Spicy', 'Rice'], 'ingredients': ['Rice']}),
+            json.dumps({'title': 'Tea', 'time_minutes': 5, 'price': 1}),
+            'not json',
+            json.dumps({'title': 'No time', 'price': 1}),
+        ])
+        upload = SimpleUploadedFile('recipes.ndjson', content.encode())
+
+        res = self.client.post(IMPORT_URL, {'file': upload},
+                               format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 2)
+        self.assertEqual(res.data['invalid'], 2)
+        self.assertEqual([e['line'] for e in res.data['errors']], [3, 4])
+        recipe = Recipe.objects.get(user=self.user, title='Biryani')
+        self.assertIn(tag, recipe.tags.all())
+        self.assertEqual(recipe.tags.count(), 2)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(stats.recipe_count, 2)
+        self.assertEqual(stats.tag_usage, {
+            str(tag_id): 1
+            for tag_id in recipe.tags.values_list('id', flat=True)
+        })
+        self.assertEqual(
+            list(recipe.ingredients.values_list('name', flat=True)), ['Rice']
+        )
+
+    def test_import_csv(self):
+        """
+            Test importing recipes from CSV
+        """
+        content = 'title,time_minutes,price,link,tags,ingredients\n' \
+                  'Biryani,50,10.5,,Spicy|Rice,Rice\n'
+        upload = SimpleUploadedFile('recipes.csv', content.encode())
+
+        res = self.client.post(f'{IMPORT_URL}?fmt=csv', {'file': upload},
+                               format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['created'], 1)
+        recipe = Recipe.objects.get(user=self.user)
+        self.assertEqual(recipe.price, 10.5)
+        self.assertEqual(recipe.tags.count(), 2)
+
+    def test_import_without_file(self):
+        """
+            Test importing without a file fails
+        """
+        res = self.client.post(IMPORT_URL, {}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_commands_round_trip(self):
+        """
+            Test exporting and importing recipes with the management commands
+        """
+        recipe = sample_recipe(self.user, title='Biryani')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Spicy'))
+        other = create_user(email='other@teamalif.com')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'recipes.csv')
+            call_command('export_recipes', self.user.email, format='csv',
+                         output=path, chunk_size=1)
+            call_command('import_recipes', other.email, path, chunk_size=1,
+                         stdout=open(os.devnull, 'w'))
+
+        imported = Recipe.objects.get(user=other)
+        self.assertEqual(imported.title, 'Biryani')
+        self.assertEqual(
+            list(imported.tags.values_list('name', flat=True)), ['Spicy']
+        )
+
+    def test_import_errors_capped(self):
+        """
+            Test only the first invalid rows are reported, all are counted
+        """
+        count = transfer.MAX_REPORTED_ERRORS + 5
+        upload = SimpleUploadedFile('recipes.ndjson',
+                                    '\n'.join(['not json'] * count).encode())
+
+        res = self.client.post(IMPORT_URL, {'file': upload},
+                               format='multipart')
+
+        self.assertEqual(res.data['invalid'], count)
+        self.assertEqual(len(res.data['errors']),
+                         transfer.MAX_REPORTED_ERRORS)
+
+
+class RecipeImportTransactionTests(TransactionTestCase):
+    """Test the transactions of the recipe import API"""
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_import_chunks_committed_on_their_own(self):
+        """
+            Test the chunks imported before a failing chunk are kept
+        """
+        content = '\n'.join(
+            json.dumps({'title': f'Recipe {number}', 'time_minutes': 5,
+                        'price': 1})
+            for number in range(transfer.DEFAULT_CHUNK_SIZE + 1)
+        )
+        upload = SimpleUploadedFile('recipes.ndjson', content.encode())
+        insert_chunk = transfer._insert_chunk
+        calls = []
+
+        def fail_second_chunk(user, rows):
+            calls.append(len(rows))
+            if len(calls) > 1:
+                raise RuntimeError('chunk failed')
+            return insert_chunk(user, rows)
+
+        with patch('recipe.transfer._insert_chunk', fail_second_chunk), \
+                self.assertRaises(RuntimeError):
+            self.client.post(IMPORT_URL, {'file': upload},
+                             format='multipart')
+
+        self.assertEqual(calls, [transfer.DEFAULT_CHUNK_SIZE, 1])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(),
+                         transfer.DEFAULT_CHUNK_SIZE)
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual(
+            (stats.recipe_count, stats.time_minutes_total),
+            (transfer.DEFAULT_CHUNK_SIZE, 5 * transfer.DEFAULT_CHUNK_SIZE)
+        )
@@ -0,0 +1,265 @@
+"""
+Streaming import/export of recipes as JSON Lines (NDJSON) or CSV.
+
+Both directions work in chunks so memory stays flat regardless of the size
+of a user's library: exports read recipes with a server side cursor and load
+tag/ingredient names once per chunk, imports parse the input lazily and write
+every chunk with a handful of bulk queries.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from core import recommendations
+from core.models import Tag, Ingredient, Recipe, UserStats, Change
+
+from .serializers import RecipeImportSerializer
+
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+FORMATS = (NDJSON, CSV)
+CONTENT_TYPES = {
+    NDJSON: 'application/x-ndjson',
+    CSV: 'text/csv',
+}
+DEFAULT_CHUNK_SIZE = 500
+# invalid rows reported back, the others are only counted
+MAX_REPORTED_ERRORS = 100
+
+EXPORT_FIELDS = (
+    'title', 'time_minutes', 'price', 'link', 'tags', 'ingredients'
+)
+# tag and ingredient names are flattened into one CSV cell
+NAME_SEPARATOR = '|'
+
+
+def chunked(iterable, size):
+    """
+    Yields lists of at most `size` items from any iterable
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _names_by_recipe(field_name, recipe_ids):
+    """
+    Returns {recipe_id: [names]} of a recipe M2M field for a chunk of recipes
+    using a single query over the through table
+    """
+    field = Recipe._meta.get_field(field_name)
+    through = field.remote_field.through
+    target = field.m2m_reverse_field_name()
+    rows = through.objects.filter(recipe_id__in=recipe_ids).values_list(
+        'recipe_id', f'{target}__name'
+    ).order_by(f'{target}__name')
+
+    names = {}
+    for recipe_id, name in rows:
+        names.setdefault(recipe_id, []).append(name)
+    return names
+
+
+def export_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields one dict per recipe of the queryset with tag and ingredient names
+    """
+    recipes = queryset.order_by('id').values(
+        'id', 'title', 'time_minutes', 'price', 'link'
+    ).iterator(chunk_size=chunk_size)
+
+    for chunk in chunked(recipes, chunk_size):
+        recipe_ids = [recipe['id'] for recipe in chunk]
+        tags = _names_by_recipe('tags', recipe_ids)
+        ingredients = _names_by_recipe('ingredients', recipe_ids)
+        for recipe in chunk:
+            recipe_id = recipe.pop('id')
+            recipe['tags'] = tags.get(recipe_id, [])
+            recipe['ingredients'] = ingredients.get(recipe_id, [])
+            yield recipe
+
+
+class _Echo:
+    """
+    File-like object that hands back what is written to it, so csv.writer
+    can be used to produce lines for a streaming response
+    """
+    def write(self, value):
+        return value
+
+
+def render_ndjson(rows):
+    """
+    Yields one JSON document per line
+    """
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def render_csv(rows):
+    """
+    Yields CSV lines, starting with the header
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row['tags'] = NAME_SEPARATOR.join(row['tags'])
+        row['ingredients'] = NAME_SEPARATOR.join(row['ingredients'])
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+RENDERERS = {
+    NDJSON: render_ndjson,
+    CSV: render_csv,
+}
+
+
+def export_recipes(queryset, fmt=NDJSON, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Returns a generator of text lines with the recipes in the given format
+    """
+    return RENDERERS[fmt](export_rows(queryset, chunk_size))
+
+
+def parse_ndjson(lines):
+    """
+    Yields (line number, row) for every non blank line of NDJSON input
+    """
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_no, row
+
+
+def _split_names(value):
+    return [name for name in (value or '').split(NAME_SEPARATOR) if name]
+
+
+def parse_csv(lines):
+    """
+    Yields (line number, row) for every record of CSV input with a header
+    """
+    reader = csv.DictReader(lines)
+    for row in reader:
+        row['tags'] = _split_names(row.get('tags'))
+        row['ingredients'] = _split_names(row.get('ingredients'))
+        if not row.get('link'):
+            row.pop('link', None)
+        yield reader.line_num, row
+
+
+PARSERS = {
+    NDJSON: parse_ndjson,
+    CSV: parse_csv,
+}
+
+
+def _resolve_names(model, user, names):
+    """
+    Returns {lower cased name: id} for the given names of the user's
+    tags/ingredients, creating the missing ones
+    """
+    if not names:
+        return {}
+    objects = model.objects.get_or_create_names(user, names)
+    return {name: obj.id for name, obj in objects.items()}
+
+
+def _insert_chunk(user, rows):
+    """
+    Creates the recipes of one validated chunk together with their tags and
+    ingredients using bulk queries only, counted into the user's stats in
+    the same transaction
+    """
+    tag_names = {name for row in rows for name in row['tags']}
+    ingredient_names = {name for row in rows for name in row['ingredients']}
+
+    with transaction.atomic():
+        tag_ids = _resolve_names(Tag, user, tag_names)
+        ingredient_ids = _resolve_names(Ingredient, user, ingredient_names)
+
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                user=user,
+                title=row['title'],
+                time_minutes=row['time_minutes'],
+                price=row['price'],
+                link=row.get('link', ''),
+            )
+            for row in rows
+        ])
+
+        recipe_tags = Recipe.tags.through
+        recipe_ingredients = Recipe.ingredients.through
+        recipe_tags.objects.bulk_create([
+            recipe_tags(recipe_id=recipe.id, tag_id=tag_id)
+            for recipe, row in zip(recipes, rows)
+            for tag_id in {tag_ids[name.lower()] for name in row['tags']}
+        ])
+        recipe_ingredients.objects.bulk_create([
+            recipe_ingredients(
+                recipe_id=recipe.id,
+                ingredient_id=ingredient_id
+            )
+            for recipe, row in zip(recipes, rows)
+            for ingredient_id in {
+                ingredient_ids[name.lower()] for name in row['ingredients']
+            }
+        ])
+        # bulk inserts don't send signals
+        UserStats.objects.add_recipes(user.pk, [
+            (row['time_minutes'], row['price'],
+             {tag_ids[name.lower()] for name in row['tags']})
+            for row in rows
+        ])
+        Change.objects.record(Recipe, Change.CREATED, user.pk,
+                              [recipe.id for recipe in recipes])
+        recommendations.invalidate(user.pk)
+
+    return len(recipes)
+
+
+def import_recipes(user, lines, fmt=NDJSON, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Imports recipes for the user from an iterable of text lines.
+    Every chunk is committed on its own; invalid rows are skipped, counted
+    and the first MAX_REPORTED_ERRORS of them reported
+    Returns {'created': <count>, 'invalid': <count>,
+             'errors': [{'line': .., 'errors': ..}]}
+    """
+    created = 0
+    invalid = 0
+    errors = []
+
+    def reject(line_no, error):
+        nonlocal invalid
+        invalid += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'line': line_no, 'errors': error})
+
+    for chunk in chunked(PARSERS[fmt](lines), chunk_size):
+        valid = []
+        for line_no, row in chunk:
+            if not isinstance(row, dict):
+                reject(line_no, 'Invalid record')
+                continue
+            serializer = RecipeImportSerializer(data=row)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+            else:
+                reject(line_no, serializer.errors)
+        if valid:
+            created += _insert_chunk(user, valid)
+
+    return {'created': created, 'invalid': invalid, 'errors': errors}
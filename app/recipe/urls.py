@@ -13,4 +13,7 @@ app_name = 'recipe'
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('stats/', views.UserStatsApiView.as_view(), name='stats'),
+    path('changes/', views.ChangeFeedApiView.as_view(), name='changes'),
+    path('sync/', views.SyncApiView.as_view(), name='sync'),
 ]
@@ -1,19 +1,50 @@
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework import viewsets, mixins, status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework import generics, viewsets, mixins, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.authentication import TokenAuthentication
 
-from core.models import Tag, Ingredient, Recipe
+from core import jobs, ratelimit, recommendations
+from core.models import Tag, Ingredient, Recipe, UserStats, Change
+from core.compression import CompressedCacheMixin
+from core.routers import ReplicaReadsMixin
+
+from . import sync, transfer
+from .pagination import RecipeCursorPagination
 
 from .serializers import TagSerializer,\
+                         TagCountSerializer,\
                          IngredientSerializer,\
+                         IngredientCountSerializer,\
                          RecipeSerializer,\
                          RecipeDetailSerializer,\
-                         ImageUploadSerializer
+                         BulkNameSerializer,\
+                         ImageUploadSerializer,\
+                         UserStatsSerializer,\
+                         ChangeSerializer,\
+                         ChangeQuerySerializer,\
+                         SyncQuerySerializer,\
+                         SyncPushSerializer,\
+                         SimilarRecipeSerializer,\
+                         SimilarQuerySerializer,\
+                         DuplicateSerializer,\
+                         BulkDuplicateSerializer
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(ReplicaReadsMixin,
+                            CompressedCacheMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """
@@ -22,30 +53,99 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
     authentication_classes = (TokenAuthentication,)
     permission_classes = (IsAuthenticated,)
 
+    # name of the Recipe M2M field pointing to the model of the viewset
+    recipe_field = None
+    count_serializer_class = None
+
+    def _flag_param(self, name):
+        """
+        Reads a 0|1 query parameter, missing means 0
+        """
+        value = self.request.query_params.get(name, '0')
+        if value not in ('0', '1'):
+            raise ValidationError({name: 'Must be 0 or 1'})
+        return value == '1'
+
+    def _recipe_links(self):
+        """
+        Returns the recipe through table rows pointing to the outer object
+        """
+        field = Recipe._meta.get_field(self.recipe_field)
+        column = field.m2m_reverse_field_name()
+        return field.remote_field.through.objects.filter(
+            **{column: OuterRef('pk')}
+        ).order_by().values(column)
+
     def get_queryset(self):
         """
-        Returns objects for current user only
-        bool() gives False only when object is None type.
+        Returns objects for current user only.
+        assigned_only=1 keeps the objects used by at least one recipe,
+        unassigned_only=1 the ones used by none; both use an EXISTS subquery
+        so there is no fan-out through the recipe M2M.
+        with_recipe_count=1 annotates every object with recipe_count,
+        counted by joining the recipe M2M once and grouping by object
         """
-        assigned_only = bool(self.request.query_params.get('assigned_only'))
-        queryset = self.queryset
-        if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)
-        return queryset.filter(user=self.request.user).order_by('-name')
+        queryset = self.queryset.filter(user=self.request.user)
+        if self._flag_param('assigned_only'):
+            queryset = queryset.filter(Exists(self._recipe_links()))
+        if self._flag_param('unassigned_only'):
+            queryset = queryset.filter(~Exists(self._recipe_links()))
+        if self._flag_param('with_recipe_count'):
+            # the M2M rows are unique, no DISTINCT needed
+            queryset = queryset.annotate(recipe_count=Count('recipe'))
+        return queryset.order_by('-name')
+
+    def get_serializer_class(self):
+        """
+        Uses the serializer with recipe_count when the count is requested
+        """
+        if self.action == 'list' and \
+                self._flag_param('with_recipe_count'):
+            return self.count_serializer_class
+        return self.serializer_class
 
+    @transaction.atomic
     def perform_create(self, serializer):
         """
-        Allocates the current user as user when creating objects
+        Allocates the current user as user when creating objects, in one
+        transaction with the stats and change feed entries of the signals
         """
         return serializer.save(user=self.request.user)
 
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """
+        Resolves a list of names to the user's objects, creating the missing
+        ones, and returns them in the order of the given names
+        """
+        serializer = BulkNameSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        names = serializer.validated_data['names']
+        objects = self.queryset.model.objects.get_or_create_names(
+            request.user,
+            names
+        )
+        ordered = list({name.lower(): objects[name.lower()]
+                        for name in names}.values())
+
+        return Response(
+            self.get_serializer(ordered, many=True).data,
+            status=status.HTTP_200_OK
+        )
+
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """
         ViewSet for the tags
     """
     serializer_class = TagSerializer
+    count_serializer_class = TagCountSerializer
     queryset = Tag.objects.all()
+    recipe_field = 'tags'
 
 
 class IngredientApiViewSet(BaseRecipeAttrViewSet):
@@ -53,10 +153,64 @@ class IngredientApiViewSet(BaseRecipeAttrViewSet):
     ViewSet for Ingredients
     """
     serializer_class = IngredientSerializer
+    count_serializer_class = IngredientCountSerializer
     queryset = Ingredient.objects.all()
+    recipe_field = 'ingredients'
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class UserStatsApiView(generics.RetrieveAPIView):
+    """
+        Summary of the user's recipes, tags and ingredients read from the
+        denormalized stats row
+    """
+    serializer_class = UserStatsSerializer
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get_object(self):
+        """
+            returns the stats of the current user, building them from the
+            recipe tables when the user has none yet
+        """
+        stats = UserStats.objects.filter(user=self.request.user).first()
+        if stats is None:
+            UserStats.objects.rebuild([self.request.user.pk])
+            stats = UserStats.objects.get(user=self.request.user)
+        return stats
+
+
+class ChangeFeedApiView(generics.GenericAPIView):
+    """
+        Feed of the changes to the recipes, tags and ingredients of all
+        users, for consumers keeping a copy of them up to date
+    """
+    serializer_class = ChangeSerializer
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        """
+            returns up to `limit` changes numbered after `since`, with the
+            number to send as `since` next and whether more changes wait
+        """
+        query = ChangeQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        since = query.validated_data['since']
+        limit = query.validated_data['limit']
+
+        changes = list(Change.objects.since(since, limit + 1))
+        more = len(changes) > limit
+        changes = changes[:limit]
+
+        return Response({
+            'changes': self.get_serializer(changes, many=True).data,
+            'next': changes[-1].seq if changes else since,
+            'more': more,
+        })
+
+
+class RecipeViewSet(ReplicaReadsMixin, CompressedCacheMixin,
+                    viewsets.ModelViewSet):
     """
         ViewSet for the Recipe api
     """
@@ -65,24 +219,91 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAuthenticated,)
     queryset = Recipe.objects.all()
 
+    pagination_class = RecipeCursorPagination
+    # set by the actions with their own rate limits
+    throttle_scope = None
+
+    # query parameter suffixes accepted for the range filters
+    range_lookups = ('lt', 'lte', 'gt', 'gte')
+    range_fields = {
+        'time_minutes': int,
+        'price': Decimal,
+    }
+    # recipes a shopping list can be made of at once
+    shopping_list_max_recipes = 100
+    # every ordering is backed by a (user, field, id) index
+    ordering_fields = ('price', 'time_minutes', 'title', 'id')
+    default_ordering = '-id'
+
     def _param_to_ints(self, querystring):
         """
         Converts string parameters list to integer list
         """
-        return [int(str_id) for str_id in querystring.split(',')]
+        try:
+            return [int(str_id) for str_id in querystring.split(',')]
+        except ValueError:
+            raise ValidationError('Expected a comma separated list of ids')
+
+    def _range_filters(self):
+        """
+        Collects the field__lookup filters given in the query parameters
+        """
+        filters = {}
+        for field, convert in self.range_fields.items():
+            for lookup in self.range_lookups:
+                param = f'{field}__{lookup}'
+                value = self.request.query_params.get(param)
+                if value is None:
+                    continue
+                try:
+                    filters[param] = convert(value)
+                except (ValueError, InvalidOperation):
+                    raise ValidationError({param: 'Expected a number'})
+        return filters
+
+    def get_ordering(self):
+        """
+        Returns the ordering requested with `ordering` (`price`, `-title`,
+        ...), the id is appended in the same direction as a tie breaker
+        """
+        ordering = self.request.query_params.get(
+            'ordering', self.default_ordering
+        )
+        if ordering.lstrip('-') not in self.ordering_fields:
+            raise ValidationError({
+                'ordering': f'Choose one of {", ".join(self.ordering_fields)}'
+            })
+        direction = '-' if ordering.startswith('-') else ''
+        if ordering.lstrip('-') == 'id':
+            return (ordering,)
+        return (ordering, f'{direction}id')
 
     def get_queryset(self):
-        queryset = self.queryset
+        queryset = self.queryset.filter(
+            user=self.request.user
+        ).prefetch_related('tags', 'ingredients')
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
         if tags:
             tag_ids = self._param_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = queryset.filter(Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef('pk'),
+                    tag_id__in=tag_ids
+                )
+            ))
         if ingredients:
             ing_ids = self._param_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ing_ids)
+            queryset = queryset.filter(Exists(
+                Recipe.ingredients.through.objects.filter(
+                    recipe_id=OuterRef('pk'),
+                    ingredient_id__in=ing_ids
+                )
+            ))
 
-        return queryset.filter(user=self.request.user)
+        return queryset.filter(**self._range_filters()).order_by(
+            *self.get_ordering()
+        )
 
     def get_serializer_class(self):
         """
@@ -93,16 +314,30 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeDetailSerializer
         elif self.action == 'upload_image':
             return ImageUploadSerializer
+        elif self.action == 'similar':
+            return SimilarRecipeSerializer
 
         return self.serializer_class
 
+    # a recipe is written with its M2M rows, stats and change feed entries
+    # in one transaction, the other requests run in autocommit
+    @transaction.atomic
     def perform_create(self, serializer):
         """
         assigns the request's user as the user of the recipe when created
         """
         serializer.save(user=self.request.user)
 
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+
+    @action(methods=['POST'], detail=True, url_path='upload-image',
+            throttle_scope=ratelimit.UPLOAD)
     def upload_image(self, request, pk=None):
         """
             Uploads an image to the recipe app
@@ -113,7 +348,9 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data=request.data
         )
         if serializer.is_valid():
-            serializer.save()
+            # the file references are counted with the recipe saved
+            with transaction.atomic():
+                serializer.save()
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -122,3 +359,214 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    def _copies(self, copies):
+        """
+            Returns the serialized copies of [(recipe id, copy id)] in order
+        """
+        recipes = self.queryset.filter(
+            user=self.request.user, pk__in=[pk for _, pk in copies]
+        ).prefetch_related('tags', 'ingredients').in_bulk()
+        return RecipeSerializer(
+            [recipes[pk] for _, pk in copies], many=True
+        ).data
+
+    @action(methods=['POST'], detail=True, url_path='duplicate')
+    def duplicate(self, request, pk=None):
+        """
+            Copies the recipe with its tags and ingredients, under `title`
+            if given
+        """
+        recipe = self.get_object()
+        options = DuplicateSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+
+        copies = Recipe.objects.duplicate(
+            request.user, [recipe.pk], **options.validated_data
+        )
+        return Response(self._copies(copies)[0],
+                        status=status.HTTP_201_CREATED)
+
+    @action(methods=['POST'], detail=False, url_path='duplicate')
+    def duplicate_many(self, request):
+        """
+            Copies the `recipes` (ids) with their tags and ingredients,
+            the ones that aren't the user's are skipped
+        """
+        options = BulkDuplicateSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+
+        copies = Recipe.objects.duplicate(
+            request.user, options.validated_data['recipes'],
+            share_image=options.validated_data['share_image']
+        )
+        return Response([
+            {'source': source, **copy}
+            for (source, _), copy in zip(copies, self._copies(copies))
+        ], status=status.HTTP_201_CREATED)
+
+    @action(methods=['GET'], detail=False, url_path='shopping-list')
+    def shopping_list(self, request):
+        """
+            Returns the ingredients of the `recipes` (comma separated ids),
+            each once with the ids of the recipes using it
+        """
+        recipe_ids = self._param_to_ints(
+            request.query_params.get('recipes', '')
+        )
+        if len(recipe_ids) > self.shopping_list_max_recipes:
+            raise ValidationError({'recipes': (
+                f'At most {self.shopping_list_max_recipes} recipes'
+            )})
+
+        # one grouped query over the through table
+        rows = Recipe.ingredients.through.objects.filter(
+            recipe__user=request.user, recipe_id__in=recipe_ids
+        ).values('ingredient_id', 'ingredient__name').annotate(
+            recipes=ArrayAgg('recipe_id', ordering='recipe_id')
+        ).order_by('ingredient__name', 'ingredient_id')
+
+        return Response([
+            {'id': row['ingredient_id'], 'name': row['ingredient__name'],
+             'recipes': row['recipes']}
+            for row in rows
+        ])
+
+    @action(methods=['GET'], detail=True, url_path='similar')
+    def similar(self, request, pk=None):
+        """
+            Returns the recipes sharing the most tags and ingredients with
+            the recipe, most similar first, up to `limit`
+        """
+        query = SimilarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        limit = query.validated_data.get('limit',
+                                         settings.RECOMMENDATIONS_TOP_K)
+
+        recipe = self.get_object()
+        scores = dict(recommendations.neighbors(recipe)[:limit])
+        recipes = self.queryset.filter(
+            user=request.user, pk__in=scores
+        ).prefetch_related('tags', 'ingredients')
+        for similar in recipes:
+            similar.similarity = scores[similar.pk]
+        recipes = sorted(recipes, key=lambda similar: (-similar.similarity,
+                                                       similar.pk))
+
+        return Response(self.get_serializer(recipes, many=True).data)
+
+    def _transfer_format(self, request, default=transfer.NDJSON):
+        """
+        Returns the import/export format requested with `fmt`, None if unknown
+        """
+        fmt = request.query_params.get('fmt', default)
+        return fmt if fmt in transfer.FORMATS else None
+
+    @action(methods=['GET', 'POST'], detail=False, url_path='export')
+    def export(self, request):
+        """
+            Streams the user's recipes with tag and ingredient names as
+            NDJSON (default) or CSV. POST queues an export of all of them
+            to a file instead, followed with the job in Location
+        """
+        fmt = self._transfer_format(request)
+        if fmt is None:
+            return Response(
+                {'fmt': f'Choose one of {", ".join(transfer.FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if request.method == 'POST':
+            job = jobs.enqueue('export_recipes', user=request.user,
+                               user_id=request.user.pk, fmt=fmt)
+            return Response(
+                {'id': job.pk, 'status': job.status},
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Location': reverse('user:job', args=[job.pk])}
+            )
+        response = StreamingHttpResponse(
+            transfer.export_recipes(self.get_queryset(), fmt),
+            content_type=transfer.CONTENT_TYPES[fmt]
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="recipes.{fmt}"'
+        return response
+
+    @action(methods=['POST'], detail=False, url_path='import',
+            throttle_scope=ratelimit.UPLOAD)
+    def import_recipes(self, request):
+        """
+            Imports recipes from an uploaded NDJSON or CSV `file`
+        """
+        fmt = self._transfer_format(request)
+        upload = request.FILES.get('file')
+        if fmt is None or upload is None:
+            return Response(
+                {'file': 'Upload an NDJSON or CSV file with `fmt` set'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        lines = io.TextIOWrapper(upload, encoding='utf-8', newline='')
+        result = transfer.import_recipes(request.user, lines, fmt)
+
+        return Response(result, status=status.HTTP_200_OK)
+
+
+class SyncApiView(ReplicaReadsMixin, generics.GenericAPIView):
+    """
+        Delta sync of the user's tags, ingredients and recipes for offline
+        clients, see recipe.sync. Pulls read from the replicas like the
+        viewsets, pushes pin the user to the primary. Responses are
+        compressed by core.compression like the others
+    """
+    authentication_classes = (TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    # the viewsets scoping, serializing and writing the synced objects,
+    # tags and ingredients first so pushed recipes can use new ones
+    sync_viewsets = {
+        'tags': TagViewSet,
+        'ingredients': IngredientApiViewSet,
+        'recipes': RecipeViewSet,
+    }
+
+    def get_sync_views(self):
+        """
+            returns {name: viewset} set up for the request
+        """
+        return {
+            name: viewset(request=self.request, args=(), kwargs={},
+                          format_kwarg=None, action='list')
+            for name, viewset in self.sync_viewsets.items()
+        }
+
+    def get(self, request):
+        """
+            returns the objects changed since `token` and the deleted ids,
+            a page of everything without a token
+        """
+        query = SyncQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        return Response(sync.pull(
+            self.get_sync_views(),
+            request.user,
+            query.validated_data.get('token'),
+            query.validated_data['limit'],
+            query.validated_data.get('cursor'),
+        ))
+
+    def post(self, request):
+        """
+            applies a batch of client changes made since `token`, returns
+            the result of every change and the token to pull from next
+        """
+        serializer = SyncPushSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results, token = sync.push(
+            self.get_sync_views(),
+            request.user,
+            serializer.validated_data['token'],
+            serializer.validated_data['changes'],
+        )
+        return Response({'results': results, 'token': token},
+                        status=status.HTTP_200_OK)
@@ -1,7 +1,10 @@
 from django.contrib.auth import get_user_model, authenticate
+from django.urls import reverse
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
+from core.models import Job
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for the users object"""
@@ -64,3 +67,22 @@ class AuthTokenSerializer(serializers.Serializer):
 
         attrs['user'] = user
         return attrs
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for the background jobs of the user"""
+    file_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ('id', 'name', 'status', 'attempts', 'result', 'created',
+                  'finished', 'file_url')
+        read_only_fields = fields
+
+    def get_file_url(self, job):
+        """The download of the file the job wrote, if any"""
+        if not (job.result or {}).get('file'):
+            return None
+        return self.context['request'].build_absolute_uri(
+            reverse('user:job-file', args=[job.pk])
+        )
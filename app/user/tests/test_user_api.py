@@ -5,6 +5,10 @@ from django.test import TestCase
 from rest_framework.test import APIClient
 from rest_framework import status
 
+from core import jobs
+from core.models import AccountDeletion, Job
+
+
 CREATE_USER_URL = reverse("user:create")
 TOKEN_URL = reverse('user:token')
 ME_URL = reverse('user:me')
@@ -192,3 +196,35 @@ class PrivateUserApiTest(TestCase):
         self.assertEqual(self.user.email, payload['email'])
         self.assertTrue(self.user.check_password(payload['password']))
         self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_delete_account(self):
+        """
+            Test deleting your account deactivates you and queues the
+            deletion
+        """
+        res = self.client.delete(ME_URL)
+
+        self.user.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res.data, {'status': AccountDeletion.PENDING})
+        self.assertFalse(self.user.is_active)
+        deletion = AccountDeletion.objects.get(user_id=self.user.id)
+        job = Job.objects.get(name='delete_account')
+        self.assertEqual(job.args, {'deletion_id': deletion.id})
+
+    def test_retrieve_job(self):
+        """
+            Test following your own background jobs only
+        """
+        job = jobs.enqueue('rebuild_stats', user=self.user)
+        other = jobs.enqueue('rebuild_stats', user=create_user(
+            email='other@teamalif.com',
+            password='testpass@123',
+        ))
+
+        res = self.client.get(reverse('user:job', args=[job.id]))
+        other_res = self.client.get(reverse('user:job', args=[other.id]))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['status'], Job.QUEUED)
+        self.assertEqual(other_res.status_code, status.HTTP_404_NOT_FOUND)
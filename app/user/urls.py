@@ -7,4 +7,7 @@ urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('token/', views.CreateAuthTokenView.as_view(), name='token'),
     path('me/', views.ManagerUserApiView.as_view(), name='me'),
+    path('jobs/<int:pk>/', views.JobApiView.as_view(), name='job'),
+    path('jobs/<int:pk>/file/', views.JobFileView.as_view(),
+         name='job-file'),
 ]
@@ -1,8 +1,16 @@
-from rest_framework import generics, authentication, permissions
+import os
+
+from django.http import FileResponse, Http404
+from rest_framework import generics, authentication, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
-from user.serializers import UserSerializer, AuthTokenSerializer
+from core import accounts
+from core.models import Job
+from core.storage import export_storage
+from user.serializers import UserSerializer, AuthTokenSerializer, \
+    JobSerializer
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -18,9 +26,10 @@ class CreateAuthTokenView(ObtainAuthToken):
     """
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
 
 
-class ManagerUserApiView(generics.RetrieveUpdateAPIView):
+class ManagerUserApiView(generics.RetrieveUpdateDestroyAPIView):
     """
         View to manage the user profile
     """
@@ -34,3 +43,38 @@ class ManagerUserApiView(generics.RetrieveUpdateAPIView):
              user
         """
         return self.request.user
+
+    def destroy(self, request, *args, **kwargs):
+        """
+            deactivates the user and queues the deletion of the account,
+            carried out in the background by its delete_account job
+        """
+        deletion = accounts.request_deletion(request.user)
+        return Response({'status': deletion.status},
+                        status=status.HTTP_202_ACCEPTED)
+
+
+class JobApiView(generics.RetrieveAPIView):
+    """
+        View to follow a background job of the user, an export for example
+    """
+    serializer_class = JobSerializer
+    authentication_classes = (authentication.TokenAuthentication,)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return Job.objects.filter(user_id=self.request.user.pk)
+
+
+class JobFileView(JobApiView):
+    """
+        View to download the file a background job of the user wrote, an
+        export, until it is deleted
+    """
+    def retrieve(self, request, *args, **kwargs):
+        path = (self.get_object().result or {}).get('file')
+        storage = export_storage()
+        if not path or not storage.exists(path):
+            raise Http404
+        return FileResponse(storage.open(path), as_attachment=True,
+                            filename=os.path.basename(path))